@@ -1,9 +1,12 @@
 from decimal import Decimal
 
-from coupons.models import Coupon
+from coupons.cache import get_coupon
 from django.conf import settings
-from orders.models import Order
+from django.utils.module_loading import import_string
+from orders.pricing import build_quote
+from shop.cache import get_catalog_version
 from shop.models import Product
+from shop.translations import translate
 
 
 class Cart:
@@ -17,43 +20,110 @@ class Cart:
         """__init__ initializes the shopping cart.
 
         Stores the current session and makes it accessible to other methods of the Cart
-        class. Gets the cart from the current session if it exists, if not it creates an
-        empty cart. Cart is a dictionary using product IDs as keys, and for each product
-        key, a dictionary will be a value that includes quantity and price. This prevents
-        a product from being added more than once to the cart, simplifying cart item
-        retrieval.
+        class. Gets the cart from the storage backend set in CART_STORAGE, the session by
+        default. If there is no cart it starts an empty cart which is only stored once
+        something is added. Cart is a dictionary using product IDs as keys, and for each
+        product key, a dictionary will be a value that includes quantity, price, weight
+        and catalog version. This prevents a product from being added more than once to
+        the cart, simplifying cart item retrieval. The hydrated lines are built lazily
+        and reused for the rest of the request, see _get_lines() and __iter__().
 
         Args:
             request (object): required to initialize cart.
 
         """
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # save an empty cart in the session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.storage = import_string(settings.CART_STORAGE)(request)
+        self.cart = self.storage.load()
         # store current applied coupon
         self.coupon_id = self.session.get("coupon_id")
         # Not storing shipping cost here
+        # memoized Decimal lines and whether products were attached to them
+        self._lines = None
+        self._hydrated = False
+        # coupon found for coupon_id, see the coupon property
+        self._coupon = None
+        # memoized price quote, see get_quote()
+        self._quote = None
+        # catalog version, read once per request, see get_catalog_version()
+        self._catalog_version = None
+
+    def _get_lines(self):
+        """_get_lines builds the Decimal view of the cart once and reuses it afterwards.
+
+        Each line is a new dict, so the session data is never modified by it. Prices are
+        converted to Decimal and line totals are computed here, once per Cart instance.
+        Lines are first revalidated if the catalog changed since their price was read.
+
+        Returns:
+            dict: lines of the cart keyed by product ID
+
+        """
+        if self._lines is None:
+            self._revalidate()
+            lines = {}
+            for product_id, item in self.cart.items():
+                price = Decimal(item["price"])
+                lines[product_id] = {
+                    **item,
+                    "price": price,
+                    "total_price": price * item["quantity"],
+                }
+            self._lines = lines
+        return self._lines
+
+    def get_catalog_version(self):
+        """get_catalog_version returns the catalog version, read once per Cart instance."""
+        if self._catalog_version is None:
+            self._catalog_version = get_catalog_version()
+        return self._catalog_version
+
+    def _revalidate(self):
+        """_revalidate refreshes the price and weight of lines read at an old version.
+
+        Only when the catalog version changed since a line was stored, the products of
+        the outdated lines are read again with a single query. Lines of products that no
+        longer exist or are no longer available are removed. In the steady state this
+        makes no query at all, and the cart never checks out at a stale price.
+
+        """
+        if not self.cart:
+            return
+        version = self.get_catalog_version()
+        stale_ids = [
+            product_id
+            for product_id, item in self.cart.items()
+            if item.get("version") != version
+        ]
+        if not stale_ids:
+            return
+        changed = {
+            str(product_id): {"price": str(price), "weight": weight, "version": version}
+            for product_id, price, weight in Product.objects.filter(
+                id__in=stale_ids, available=True
+            ).values_list("id", "price", "weight")
+        }
+        removed = [product_id for product_id in stale_ids if product_id not in changed]
+        self.cart = self.storage.update(changed, removed)
 
     def __iter__(self):
         """__iter__ iterates over the items in cart and gets products from the database.
 
+        Products are fetched the first time the cart is iterated over, with their names
+        and slugs from the translation cache. Later passes, such as the ones made by the templates, reuse the same lines.
+
         Yields:
             item: object in cart being iterated over
 
         """
-        product_ids = self.cart.keys()
-        # get the product objects and add them to the cart
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]["product"] = product
-        for item in cart.values():
-            item["price"] = Decimal(item["price"])
-            item["total_price"] = item["price"] * item["quantity"]
-            yield item
+        lines = self._get_lines()
+        if not self._hydrated:
+            # get the product objects and add them to the cart
+            products = Product.objects.filter(id__in=lines.keys())
+            for product in translate(products):
+                lines[str(product.id)]["product"] = product
+            self._hydrated = True
+        yield from lines.values()
 
     def __len__(self):
         """__len__ counts all the items in the cart.
@@ -62,15 +132,20 @@ class Cart:
             int: sum of the quantities of all items in the cart
 
         """
-        return sum(item["quantity"] for item in self.cart.values())
+        summary = self._get_summary()
+        if summary is not None:
+            return summary["count"]
+        return sum(item["quantity"] for item in self._get_lines().values())
 
     def add(self, product, quantity=1, override_quantity=False):
         """add method adds a product to the cart or updates its quantity.
 
         Uses product ID as key in cart's content dictionary. Converts ID key to string
         so Django can use JSON to serialize session data. Value is a dict with quantity
-        and price figures for the Product. Price is converted from decimal to string for
-        serialization. The save() method is called to save the cart in the session.
+        price and weight figures for the Product. Price is converted from decimal to string
+        for serialization. Weight is captured here so shipping can be priced without
+        loading products again. The storage backend applies the change, then save() is
+        called to refresh the cart.
 
         Args:
             product (object): Product to add to the cart
@@ -79,18 +154,43 @@ class Cart:
                 to the existing quantity. Defaults to False.
 
         """
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {"quantity": 0, "price": str(product.price)}
-        if override_quantity:
-            self.cart[product_id]["quantity"] = quantity
-        else:
-            self.cart[product_id]["quantity"] += quantity
+        line = {
+            "price": str(product.price),
+            "weight": product.weight,
+            "version": self.get_catalog_version(),
+        }
+        self.cart = self.storage.add(
+            str(product.id), quantity, line, override_quantity=override_quantity
+        )
         self.save()
 
     def save(self):
-        # marks the session as 'modified' to make sure it gets saved
-        self.session.modified = True
+        """save refreshes the cart after the storage backend has changed it.
+
+        The backends also keep a summary with the item count and subtotal, so the header
+        can show them without reading every line. It is updated by add(), remove() and
+        clear().
+
+        """
+        # the memoized lines no longer match the stored cart
+        self._lines = None
+        self._hydrated = False
+        self._quote = None
+
+    def _get_summary(self):
+        """_get_summary returns the summary saved with the cart, if it is still valid.
+
+        Returns:
+            dict: item count and subtotal of the cart, or None if the lines must be read
+
+        """
+        if self._lines is not None or not self.cart:
+            return None
+        summary = self.storage.get_summary()
+        if summary is None or summary.get("version") != self.get_catalog_version():
+            # some line may be stale, the lines have to be revalidated
+            return None
+        return summary
 
     def remove(self, product):
         """remove method removes a given Product from the cart dictionary and updates cart.
@@ -99,68 +199,84 @@ class Cart:
             product (object): Product to remove from cart
 
         """
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+        self.cart = self.storage.remove(str(product.id))
+        self.save()
 
     def clear(self):
-        # remove cart from session
-        del self.session[settings.CART_SESSION_ID]
+        # remove cart and its summary from storage
+        self.cart = self.storage.clear()
         self.save()
 
+    def get_quote(self):
+        """get_quote prices the cart once and reuses the quote for the rest of the request.
+
+        The quote is built by :func:`orders.pricing.build_quote` with the discount rate
+        of the coupon, so the cart pages, the checkout and the order all use the same
+        amounts.
+
+        Returns:
+            Quote: subtotal, discount, shipping, tax and total of the cart
+
+        """
+        if self._quote is None:
+            self._quote = build_quote(
+                (
+                    (item["price"], item["quantity"], item.get("weight", 0))
+                    for item in self._get_lines().values()
+                ),
+                discount_rate=self.coupon.discount if self.coupon else 0,
+            )
+        return self._quote
+
     def get_total_price(self):
         """get_total_price calculates the total cost of the items in the cart.
 
         Returns:
-            int: the total cost of all the items in the cart.
+            Decimal: the total cost of all the items in the cart.
 
         """
-        return sum(
-            Decimal(item["price"]) * item["quantity"] for item in self.cart.values()
-        )
+        summary = self._get_summary()
+        if summary is not None:
+            return Decimal(summary["subtotal"])
+        return self.get_quote().subtotal
 
     @property
     def coupon(self):
         """coupon method is defined as a property. If cart contains a coupon_id attribute,
         the Coupon object with the given ID is returned.
 
+        The coupon comes from the coupon cache and is remembered for the rest of the
+        request. A coupon that is no longer active or valid is not returned.
+
         Returns:
             object: Coupon object with the given ID
 
         """
-        if self.coupon_id:
-            try:
-                return Coupon.objects.get(id=self.coupon_id)
-            except Coupon.DoesNotExist:
-                pass
-        return None
+        if self._coupon is None and self.coupon_id:
+            coupon = get_coupon(self.coupon_id)
+            if coupon is not None and coupon.is_valid():
+                self._coupon = coupon
+        return self._coupon
 
     def get_discount(self):
-        """get_discount retrieves discount rate and applies it if cart contains a coupon.
-
-        If the cart contains a coupon, retrieves its discount rate and returns the amount
-        to be deducted from the total amount of the cart.
+        """get_discount returns the amount deducted by the coupon, if the cart has one.
 
         Returns:
             Decimal: amount to be deducted from the total amount of the cart.
 
         """
-        if self.coupon:
-            return (self.coupon.discount / Decimal(100)) * self.get_total_price()
-        return Decimal(0)
+        return self.get_quote().discount
 
     def get_total_price_after_discount(self):
-        """get_total_price_after_discount deducts amount returned from total amount of cart.
+        """get_total_price_after_discount returns the total amount of the cart.
 
-        Returns the total amount of the cart after deducting the amount returned by the
-        :method:`coupons.get_discount` method.
+        This is the subtotal after deducting the discount, with shipping and tax added.
 
         Returns:
-            int: the total amount of the cart after deducting the discounted amount
+            Decimal: the total amount of the cart
 
         """
-        return self.get_total_price() - self.get_discount() + self.get_shipping_cost()
+        return self.get_quote().total
 
     def set_shipping_cost(self, shipping_cost):
         """Set the shipping cost for the cart.
@@ -172,14 +288,21 @@ class Cart:
         self.session["shipping_cost"] = str(Decimal(shipping_cost))
         self.save()
 
+    def get_total_weight(self):
+        """get_total_weight finds the total weight of the items in the cart.
+
+        Uses the product weights captured by add(), so no products are loaded.
+
+        Returns:
+            int: weight of all items in the cart, calculated in grams
+
+        """
+        return self.get_quote().weight
+
     def get_shipping_cost(self):
         """Get the shipping cost for the cart.
 
         Returns:
-            Decimal: The shipping cost.
+            Decimal: The shipping cost, priced by :func:`orders.shipping.get_shipping_cost`.
         """
-        # Calculate shipping cost dynamically using Order's get_shipping_cost() method
-        order = Order.objects.first()  # Adjust this to fetch the correct order
-        if order:
-            return order.get_shipping_cost()
-        return Decimal("0.00")
+        return self.get_quote().shipping
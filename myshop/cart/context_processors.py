@@ -1,11 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
 from .cart import Cart
 
 
 def cart(request):
-    """cart context processor instantiates the cart and makes it available to templates.
+    """cart context processor makes a lazily instantiated cart available to templates.
 
-    cart is instantiated using the request object and makes it available for the
-    templates as a variable named cart.
+    cart is instantiated using the request object the first time a template uses it,
+    and is available for the templates as a variable named cart. Pages that never use
+    the cart do not read the session.
 
     Args:
         request (object): used to instantiate the cart
@@ -14,4 +17,4 @@ def cart(request):
         object: cart
 
     """
-    return {"cart": Cart(request)}
+    return {"cart": SimpleLazyObject(lambda: Cart(request))}
@@ -0,0 +1,142 @@
+import statistics
+import threading
+import time
+import uuid
+from importlib import import_module
+from types import SimpleNamespace
+
+import redis
+from cart.storage import RedisCartStorage, SessionCartStorage
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class ScratchCartStorage(RedisCartStorage):
+    # carts of the benchmark are kept in the scratch database
+    client = None
+
+    @property
+    def redis(self):
+        return self.client
+
+
+class RedisBackend:
+    """RedisBackend adds to a cart kept in a Redis hash of the scratch database."""
+
+    def __init__(self, db, threads):
+        self.client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=db,
+            max_connections=threads + 1,
+        )
+        ScratchCartStorage.client = self.client
+        self.cart_id = uuid.uuid4().hex
+
+    def add(self, line):
+        request = SimpleNamespace(
+            session={settings.CART_REDIS_SESSION_ID: self.cart_id}
+        )
+        ScratchCartStorage(request).add("1", 1, line)
+
+    def get_quantity(self):
+        return int(self.client.hget(f"cart:{self.cart_id}", "qty:1") or 0)
+
+    def delete(self):
+        self.client.delete(f"cart:{self.cart_id}")
+
+
+class SessionBackend:
+    """SessionBackend adds to a cart kept in a session of the SESSION_ENGINE.
+
+    Each add loads the session, changes the cart and saves the session, like a request.
+
+    """
+
+    def __init__(self, db, threads):
+        self.SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+        session = self.SessionStore()
+        session.create()
+        self.session_key = session.session_key
+
+    def add(self, line):
+        session = self.SessionStore(self.session_key)
+        SessionCartStorage(SimpleNamespace(session=session)).add("1", 1, line)
+        session.save()
+
+    def get_quantity(self):
+        lines = self.SessionStore(self.session_key).get(settings.CART_SESSION_ID) or {}
+        return lines.get("1", {}).get("quantity", 0)
+
+    def delete(self):
+        self.SessionStore(self.session_key).delete()
+
+
+BACKENDS = {"redis": RedisBackend, "session": SessionBackend}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput and latency of concurrent add() calls on a single "
+        "cart, and counts the quantities lost, with the Redis backend on a scratch "
+        "Redis database or with the session backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", nargs="+", type=int, default=[1, 4, 16, 32])
+        parser.add_argument("--adds", type=int, default=200, help="Adds per thread.")
+        parser.add_argument("--backend", choices=sorted(BACKENDS), default="redis")
+        parser.add_argument(
+            "--db",
+            type=int,
+            default=15,
+            help="Redis database used for the benchmark, its keys are deleted after.",
+        )
+
+    def handle(self, *args, **options):
+        line = {"price": "10.00", "weight": 500, "version": 1}
+        for threads in options["threads"]:
+            backend = BACKENDS[options["backend"]](options["db"], threads)
+            timings = []
+            errors = []
+            lock = threading.Lock()
+
+            def run():
+                local = []
+                try:
+                    for _ in range(options["adds"]):
+                        start = time.perf_counter()
+                        backend.add(line)
+                        local.append((time.perf_counter() - start) * 1000)
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    # each thread has its own database connection
+                    connection.close()
+                with lock:
+                    timings.extend(local)
+
+            workers = [threading.Thread(target=run) for _ in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            quantity = backend.get_quantity()
+            backend.delete()
+            if errors:
+                raise CommandError(f"{threads} threads: {errors[0]!r}")
+            expected = threads * options["adds"]
+            if quantity != expected and options["backend"] == "redis":
+                raise CommandError(
+                    f"{threads} threads: quantity {quantity}, expected {expected}"
+                )
+            timings.sort()
+            self.stdout.write(
+                f"{threads} threads: {expected / elapsed:.0f} adds/s, "
+                f"p50 {statistics.median(timings):.2f}ms, "
+                f"p99 {timings[int(len(timings) * 0.99) - 1]:.2f}ms, "
+                f"{expected - quantity} of {expected} adds lost"
+            )
@@ -0,0 +1,244 @@
+"""storage backends for :class:`cart.Cart`.
+
+A backend keeps the lines of a cart. Lines are a dictionary using product IDs as keys,
+and for each product key a dictionary with quantity, price, weight and the catalog
+version the price was read at as value. Every write method returns the lines as they
+are after the write, so the cart does not have to read them again. The backend is
+selected with the CART_STORAGE setting.
+
+"""
+
+import json
+import logging
+import uuid
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from shop.redis_pool import breaker, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(lines):
+    """summarize computes the item count and subtotal of the given cart lines.
+
+    Args:
+        lines (dict): cart lines keyed by product ID
+
+    Returns:
+        dict: count (int), subtotal (string) and the oldest catalog version (int) of the
+            lines, ready to be serialized
+
+    """
+    return {
+        "count": sum(line["quantity"] for line in lines.values()),
+        "subtotal": str(
+            sum(Decimal(line["price"]) * line["quantity"] for line in lines.values())
+        ),
+        "version": min(line.get("version", 0) for line in lines.values()),
+    }
+
+
+class SessionCartStorage:
+    """:class:`cart.SessionCartStorage` keeps the cart inside the Django session.
+
+    This is the default backend. The whole cart is saved with the session, together
+    with a summary of the item count and subtotal used by the header.
+
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        # an empty cart is not saved in the session until a product is added
+        self.lines = self.session.get(settings.CART_SESSION_ID) or {}
+
+    def load(self):
+        return self.lines
+
+    def get_summary(self):
+        return self.session.get(settings.CART_SUMMARY_SESSION_ID)
+
+    def add(self, product_id, quantity, line, override_quantity=False):
+        """add adds quantity to a line, creating it from line if it does not exist.
+
+        Args:
+            product_id (str): key of the line
+            quantity (int): number of the product to add, or the new quantity
+            line (dict): price, weight and version of the product, used for new lines
+            override_quantity (bool, optional): whether quantity replaces the existing
+                quantity. Defaults to False.
+
+        Returns:
+            dict: the cart lines
+
+        """
+        if product_id not in self.lines:
+            self.lines[product_id] = {**line, "quantity": 0}
+        if override_quantity:
+            self.lines[product_id]["quantity"] = quantity
+        else:
+            self.lines[product_id]["quantity"] += quantity
+        return self.save()
+
+    def remove(self, product_id):
+        if product_id in self.lines:
+            del self.lines[product_id]
+            self.save()
+        return self.lines
+
+    def update(self, changed, removed=()):
+        """update replaces the price, weight and version of lines and drops others.
+
+        Args:
+            changed (dict): new line values keyed by product ID, without quantity
+            removed (iterable, optional): product IDs of lines to drop
+
+        Returns:
+            dict: the cart lines
+
+        """
+        for product_id, line in changed.items():
+            if product_id in self.lines:
+                self.lines[product_id].update(line)
+        for product_id in removed:
+            self.lines.pop(product_id, None)
+        return self.save()
+
+    def clear(self):
+        self.lines = {}
+        return self.save()
+
+    def save(self):
+        if self.lines:
+            self.session[settings.CART_SESSION_ID] = self.lines
+            self.session[settings.CART_SUMMARY_SESSION_ID] = summarize(self.lines)
+        else:
+            self.session.pop(settings.CART_SESSION_ID, None)
+            self.session.pop(settings.CART_SUMMARY_SESSION_ID, None)
+        # marks the session as 'modified' to make sure it gets saved
+        self.session.modified = True
+        return self.lines
+
+
+class RedisCartStorage:
+    """:class:`cart.RedisCartStorage` keeps each cart in a Redis hash.
+
+    The session only stores the ID of the cart, written once when the first product is
+    added. Each line is kept in two fields of the hash, qty:[id] with the quantity and
+    line:[id] with the price, weight and version as JSON. Quantities are changed with HINCRBY,
+    HSET and HDEL inside a MULTI/EXEC block, so concurrent requests for the same cart
+    never overwrite each other. Every access refreshes the TTL of the hash, so abandoned
+    carts expire after CART_REDIS_TTL seconds.
+
+    Calls go through the circuit breaker of :mod:`shop.redis_pool`. While Redis is
+    unavailable the cart is read-only: it is read as empty, changes are dropped and
+    logged as errors, so pages showing the cart are still served without waiting.
+
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        self.cart_id = self.session.get(settings.CART_REDIS_SESSION_ID)
+        self.lines = None
+
+    @property
+    def redis(self):
+        # shared pool with connect and read timeouts, see shop.redis_pool
+        return get_redis()
+
+    def get_key(self):
+        """get_key builds the Redis key of the cart, which looks like cart:[cart_id]."""
+        if self.cart_id is None:
+            self.cart_id = uuid.uuid4().hex
+            self.session[settings.CART_REDIS_SESSION_ID] = self.cart_id
+        return f"cart:{self.cart_id}"
+
+    def load(self):
+        if self.lines is None:
+            if self.cart_id is None:
+                # nothing was ever added, no need to ask redis
+                self.lines = {}
+            else:
+                self.lines = self._execute(lambda pipe, key: None)
+        return self.lines
+
+    def get_summary(self):
+        # the lines are always loaded from the same hash, no summary is stored
+        return None
+
+    def add(self, product_id, quantity, line, override_quantity=False):
+        def write(pipe, key):
+            pipe.hsetnx(key, f"line:{product_id}", json.dumps(line))
+            if override_quantity:
+                pipe.hset(key, f"qty:{product_id}", quantity)
+            else:
+                pipe.hincrby(key, f"qty:{product_id}", quantity)
+
+        self.lines = self._execute(write)
+        return self.lines
+
+    def remove(self, product_id):
+        def write(pipe, key):
+            pipe.hdel(key, f"qty:{product_id}", f"line:{product_id}")
+
+        self.lines = self._execute(write)
+        return self.lines
+
+    def update(self, changed, removed=()):
+        def write(pipe, key):
+            for product_id, line in changed.items():
+                pipe.hset(key, f"line:{product_id}", json.dumps(line))
+            for product_id in removed:
+                pipe.hdel(key, f"qty:{product_id}", f"line:{product_id}")
+
+        self.lines = self._execute(write)
+        return self.lines
+
+    def clear(self):
+        if self.cart_id is not None:
+            try:
+                breaker.call(self.redis.delete, self.get_key())
+            except redis.RedisError as e:
+                logger.error(f"Cart {self.cart_id} not cleared, Redis failed: {e}")
+        self.lines = {}
+        return self.lines
+
+    def _execute(self, write):
+        """_execute runs write and reads the cart back in a single MULTI/EXEC block.
+
+        Args:
+            write (callable): receives the pipeline and the key of the cart and queues
+                the commands that change the cart
+
+        Returns:
+            dict: the cart lines after the write, or the lines already read, if any,
+                when Redis fails or the breaker is open
+
+        """
+        key = self.get_key()
+        try:
+            with self.redis.pipeline(transaction=True) as pipe:
+                write(pipe, key)
+                pipe.expire(key, settings.CART_REDIS_TTL)
+                pipe.hgetall(key)
+                fields = breaker.call(pipe.execute)[-1]
+        except redis.RedisError as e:
+            logger.error(f"Cart {self.cart_id} is read-only, Redis failed: {e}")
+            return self.lines or {}
+        return self._parse(fields)
+
+    def _parse(self, fields):
+        lines = {}
+        for field, value in fields.items():
+            kind, product_id = field.decode().split(":", 1)
+            if kind == "line":
+                lines.setdefault(product_id, {}).update(json.loads(value))
+            else:
+                lines.setdefault(product_id, {})["quantity"] = int(value)
+        # drop lines that lost a field to a concurrent remove, or were set to zero
+        return {
+            product_id: line
+            for product_id, line in lines.items()
+            if "price" in line and line.get("quantity", 0) > 0
+        }
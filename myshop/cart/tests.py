@@ -1,3 +1,175 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.base import SessionBase
+from django.test import SimpleTestCase, TestCase
+from shop.models import Category, Product
+from shop.redis_pool import CircuitBreaker
+
+from .cart import Cart
+from .storage import RedisCartStorage
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+LINE = {"price": "10.00", "weight": 500, "version": 1}
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RedisCartStorageTests(SimpleTestCase):
+    """Tests of :class:`cart.RedisCartStorage` against an in-memory Redis."""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        patcher = mock.patch("cart.storage.get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cart_id = "test"
+
+    def get_storage(self):
+        # each request has its own session, holding the ID of the same cart
+        request = SimpleNamespace(
+            session={settings.CART_REDIS_SESSION_ID: self.cart_id}
+        )
+        return RedisCartStorage(request)
+
+    def run_threads(self, target, count):
+        barrier = threading.Barrier(count)
+        errors = []
+
+        def run(number):
+            barrier.wait()
+            try:
+                target(number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_adds_are_not_lost(self):
+        threads, adds = 20, 25
+
+        def add(number):
+            for _ in range(adds):
+                self.get_storage().add("1", 1, LINE)
+
+        self.run_threads(add, threads)
+        lines = self.get_storage().load()
+        self.assertEqual(lines["1"]["quantity"], threads * adds)
+        self.assertEqual(lines["1"]["price"], LINE["price"])
+
+    def test_concurrent_adds_of_different_products(self):
+        def add(number):
+            self.get_storage().add(str(number), 2, LINE)
+
+        self.run_threads(add, 20)
+        lines = self.get_storage().load()
+        self.assertEqual(sorted(lines, key=int), [str(n) for n in range(20)])
+        self.assertTrue(all(line["quantity"] == 2 for line in lines.values()))
+
+    def test_override_and_remove(self):
+        storage = self.get_storage()
+        storage.add("1", 3, LINE)
+        self.assertEqual(
+            storage.add("1", 1, LINE, override_quantity=True)["1"]["quantity"], 1
+        )
+        self.assertEqual(storage.remove("1"), {})
+        self.assertEqual(self.redis.ttl(f"cart:{self.cart_id}"), -2)
+
+    def test_read_only_while_redis_is_down(self):
+        storage = self.get_storage()
+        storage.add("1", 3, LINE)
+        self.server.connected = False
+        breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+        with mock.patch("cart.storage.breaker", breaker):
+            with self.assertLogs("cart.storage", "ERROR"):
+                self.assertEqual(self.get_storage().load(), {})
+                self.assertEqual(self.get_storage().add("2", 1, LINE), {})
+                # the breaker is open, Redis is not called at all
+                self.get_storage().clear()
+        self.assertEqual(breaker.get_metrics()["rejected_calls"], 1)
+        self.server.connected = True
+        self.assertEqual(self.get_storage().load()["1"]["quantity"], 3)
+
+
+class CartQueryTests(TestCase):
+    """Tests of the queries made by :class:`cart.Cart` for 1, 20 and 200 lines."""
+
+    sizes = [1, 20, 200]
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        cls.products = [
+            Product.objects.create(
+                category=category,
+                name=f"Tea {number}",
+                slug=f"tea-{number}",
+                price="2.00",
+                weight=10,
+            )
+            for number in range(max(cls.sizes))
+        ]
+
+    def get_cart(self, products, quantity=1):
+        session = SessionBase()
+        cart = Cart(SimpleNamespace(session=session))
+        for product in products:
+            cart.add(product, quantity)
+        # the next request reads the same cart from the session
+        return Cart(SimpleNamespace(session=session))
+
+    def test_quote_makes_no_queries(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                cart = self.get_cart(self.products[:size])
+                with self.assertNumQueries(0):
+                    quote = cart.get_quote()
+                    cart.get_shipping_cost()
+                    len(cart)
+                self.assertEqual(quote.weight, 10 * size)
+
+    def test_lines_are_hydrated_with_one_query(self):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                cart = self.get_cart(self.products[:size])
+                # the translations are cached by the first pass
+                list(cart)
+                cart = self.get_cart(self.products[:size])
+                with self.assertNumQueries(1):
+                    self.assertEqual(len(list(cart)), size)
+                    list(cart)
+
+    def test_shipping_tiers_from_captured_weights(self):
+        tiers = [
+            (1, Decimal("5.00")),
+            (50, Decimal("5.00")),
+            (51, Decimal("10.00")),
+            (200, Decimal("10.00")),
+            (201, Decimal("20.00")),
+        ]
+        product = self.products[0]
+        for quantity, shipping in tiers:
+            with self.subTest(quantity=quantity):
+                cart = self.get_cart([product], quantity)
+                with self.assertNumQueries(0):
+                    self.assertEqual(cart.get_total_weight(), 10 * quantity)
+                    self.assertEqual(cart.get_shipping_cost(), shipping)
+
+    def test_shipping_uses_weight_captured_when_added(self):
+        cart = self.get_cart(self.products[:60])
+        # the catalog version is not bumped, the captured weights are still valid
+        Product.objects.filter(pk__in=[p.pk for p in self.products]).update(weight=0)
+        self.assertEqual(cart.get_total_weight(), 600)
+        self.assertEqual(cart.get_shipping_cost(), Decimal("10.00"))
@@ -1,8 +1,8 @@
 from coupons.forms import CouponApplyForm
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
+from shop import recommendations
 from shop.models import Product
-from shop.recommender import Recommender
 
 from .cart import Cart
 from .forms import CartAddProductForm
@@ -22,7 +22,8 @@ def cart_add(request, product_id):
 
     """
     cart = Cart(request)
-    product = get_object_or_404(Product, id=product_id)
+    # products out of stock are shown, but cannot be added
+    product = get_object_or_404(Product, id=product_id, available=True)
     form = CartAddProductForm(request.POST)
     if form.is_valid():
         cd = form.cleaned_data
@@ -67,11 +68,10 @@ def cart_detail(request):
         )
     coupon_apply_form = CouponApplyForm()
 
-    # recommender in cart
-    r = Recommender()
+    # recommender in cart, served from the materialized top suggestions
     cart_products = [item["product"] for item in cart]
     if cart_products:
-        recommended_products = r.suggest_products_for(cart_products, max_results=4)
+        recommended_products = recommendations.suggest(cart_products, max_results=4)
     else:
         recommended_products = []
     return render(
@@ -79,6 +79,7 @@ def cart_detail(request):
         "cart/detail.html",
         {
             "cart": cart,
+            "quote": cart.get_quote(),
             "coupon_apply_form": coupon_apply_form,
             "recommended_products": recommended_products,
         },
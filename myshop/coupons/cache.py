@@ -0,0 +1,94 @@
+"""in-process cache of :model:`coupons.Coupon` lookups.
+
+Coupons are looked up by ID from the cart on almost every page, and by code when a
+user applies one. Both lookups are cached in the current process for COUPON_CACHE_TTL
+seconds, so a cache hit does not query the database. Missing IDs are cached too, but
+codes are only cached for coupons that exist: codes are typed by users, and caching
+every unknown one would grow the cache without bound. The cached Coupon objects carry
+their validity window, so expiry is checked with :method:`coupons.Coupon.is_valid`
+without the database.
+
+The whole cache is cleared whenever a coupon is saved or deleted, see
+:mod:`coupons.signals`, but only in the process that made the change. The other
+processes keep serving the old coupon, for example one that was just deactivated,
+until their entry expires, which is why COUPON_CACHE_TTL is kept short.
+
+"""
+
+import time
+
+from django.conf import settings
+
+from .models import Coupon
+
+# entries are (coupon or None, time the entry was cached)
+_by_id = {}
+_by_code = {}
+
+
+def normalize_code(code):
+    """normalize_code returns the key used to look up a coupon code, case-insensitive."""
+    return code.strip().lower()
+
+
+def _get_cached(entries, key):
+    entry = entries.get(key)
+    if entry is None:
+        return False, None
+    coupon, cached_at = entry
+    if time.monotonic() - cached_at > settings.COUPON_CACHE_TTL:
+        entries.pop(key, None)
+        return False, None
+    return True, coupon
+
+
+def _store(coupon):
+    now = time.monotonic()
+    _by_id[coupon.id] = (coupon, now)
+    _by_code[normalize_code(coupon.code)] = (coupon, now)
+
+
+def get_coupon(coupon_id):
+    """get_coupon returns the Coupon with the given ID, or None if it does not exist.
+
+    Args:
+        coupon_id (int): ID of the coupon
+
+    Returns:
+        object: Coupon object with the given ID, or None
+
+    """
+    found, coupon = _get_cached(_by_id, coupon_id)
+    if not found:
+        coupon = Coupon.objects.filter(id=coupon_id).first()
+        if coupon is None:
+            # IDs come from sessions, so only coupons that existed can be missing
+            _by_id[coupon_id] = (None, time.monotonic())
+        else:
+            _store(coupon)
+    return coupon
+
+
+def get_coupon_by_code(code):
+    """get_coupon_by_code returns the Coupon with the given code, ignoring case.
+
+    Args:
+        code (str): coupon code entered by the user
+
+    Returns:
+        object: Coupon object with the given code, or None
+
+    """
+    code = normalize_code(code)
+    found, coupon = _get_cached(_by_code, code)
+    if not found:
+        coupon = Coupon.objects.filter(code__iexact=code).first()
+        if coupon is not None:
+            _store(coupon)
+    return coupon
+
+
+def clear():
+    """clear empties the cache, used when a coupon is saved or deleted."""
+    _by_id.clear()
+    _by_code.clear()
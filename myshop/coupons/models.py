@@ -1,5 +1,6 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 
 # Defines data stored in tables related to coupons
@@ -29,3 +30,16 @@ class Coupon(models.Model):
 
     def __str__(self):
         return self.code
+
+    def is_valid(self, now=None):
+        """is_valid checks that the coupon is active and valid at the given datetime.
+
+        Args:
+            now (datetime, optional): datetime to check. Defaults to the current time.
+
+        Returns:
+            bool: whether the coupon can be applied
+
+        """
+        now = now or timezone.now()
+        return self.active and self.valid_from <= now <= self.valid_to
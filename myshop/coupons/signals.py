@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Coupon
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, **kwargs):
+    """coupon_changed clears the coupon cache when a coupon is saved or deleted.
+
+    Only the cache of this process is cleared, the other processes see the change
+    once their entries are older than COUPON_CACHE_TTL.
+
+    """
+    cache.clear()
@@ -1,8 +1,9 @@
 from django.shortcuts import redirect
 from django.utils import timezone
 from django.views.decorators.http import require_POST
+
+from .cache import get_coupon_by_code
 from .forms import CouponApplyForm
-from .models import Coupon
 
 
 # View for coupon entry form
@@ -13,8 +14,9 @@ def coupon_apply(request):
     :form:`coupons.CouponApplyForm` is instantiated using the posted data, + checks that
     the form is valid.
     If valid, gets the code entered by user from the form's cleaned_data dictionary.
-    Tries to retrieve the Coupon object with the given code. Uses iexact lookup to perform
-    a case-sensitive match. Coupon must be currently active and valid for current datetime.
+    Tries to retrieve the Coupon object with the given code from the coupon cache, which
+    uses an iexact lookup to perform a case-insensitive match. Coupon must be currently
+    active and valid for current datetime.
     The coupon ID is stored in the user's session.
     The user is redirected to the cart_detail url, displaying cart with coupon applied.
 
@@ -29,14 +31,9 @@ def coupon_apply(request):
     form = CouponApplyForm(request.POST)
     if form.is_valid():
         code = form.cleaned_data["code"]
-        try:
-            coupon = Coupon.objects.get(
-                code__iexact=code,
-                valid_from__lte=now,
-                valid_to__gte=now,
-                active=True,
-            )
+        coupon = get_coupon_by_code(code)
+        if coupon is not None and coupon.is_valid(now):
             request.session["coupon_id"] = coupon.id
-        except Coupon.DoesNotExist:
+        else:
             request.session["coupon_id"] = None
     return redirect("cart:cart_detail")
@@ -153,8 +153,78 @@ MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
 
+# number of products on each page of the product list
+PRODUCTS_PER_PAGE = 24
+# upper bounds of the price bands used to filter the product list
+FACET_PRICE_BOUNDS = [25, 50, 100, 250]
+# seconds before a process rebuilds its facet index after a catalog change
+FACET_INDEX_MAX_AGE = 60
+# absolute url of the shop, used by the sitemaps and the product feeds
+SITE_URL = config("SITE_URL", default="http://localhost:8000")
+# directory of the generated sitemaps and product feeds
+SITEMAP_ROOT = BASE_DIR / "sitemaps"
+# product IDs per sitemap shard, so a shard stays under 50,000 urls in every language
+SITEMAP_SHARD_SIZE = 25000
+# widths in pixels of the resized variants of product images
+IMAGE_VARIANT_WIDTHS = [320, 640, 1024]
+# quality of the JPEG and WebP variants of product images
+IMAGE_VARIANT_QUALITY = 80
+# suggestions stored per product by the materialize_recommendations task
+RECOMMENDATIONS_TOP_K = 12
+# products kept in each product:[id]:purchased_with set by rebuild_recommendations
+# and the compact_recommendations task
+RECOMMENDATIONS_SET_SIZE = 100
+# seconds after which a purchase weighs half as much in the recommendations
+RECOMMENDATIONS_HALF_LIFE = 60 * 60 * 24 * 30
+# growth of the decay factor at which compact_recommendations renormalizes the scores
+RECOMMENDATIONS_RENORMALIZE_FACTOR = 2
+# entries of the recommendation cache of each process
+RECOMMENDATIONS_LRU_SIZE = 10000
+# seconds between checks of the recommendation and catalog versions by each process
+RECOMMENDATIONS_VERSION_CHECK = 30
+# seconds the payloads of the catalog API are cached, they are keyed by version
+API_CACHE_TIMEOUT = 60 * 60
+# seconds the resolved name and slug of a product or category are cached
+TRANSLATION_CACHE_TIMEOUT = 60 * 60 * 24
+# seconds the slug of a product is kept in the slug map
+SLUG_MAP_TIMEOUT = 60 * 60 * 24 * 7
+# seconds the cached parts of a product detail page are kept
+PRODUCT_DETAIL_CACHE_TIMEOUT = 60 * 15
+# seconds the version of a product is kept, a new one starts when it expires
+PRODUCT_VERSION_TIMEOUT = 60 * 60 * 24
+# seconds a request waits for another request rebuilding the same cache entry
+SINGLE_FLIGHT_WAIT = 5
+# maximum number of products returned by the product search
+SEARCH_RESULTS = 48
+# snapshot of the search index written by the rebuild_search_index command
+SEARCH_INDEX_PATH = BASE_DIR / "search_index.pickle"
+# seconds between a product change and the rebuild that reaches every process
+SEARCH_REBUILD_DELAY = 60
+# seconds the category tree of the sidebar is cached, it is also invalidated on change
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
 # Key to store the cart in the user session
 CART_SESSION_ID = "cart"
+# Key to store the cart item count and subtotal in the user session
+CART_SUMMARY_SESSION_ID = "cart_summary"
+# Backend storing the cart lines: cart.storage.SessionCartStorage keeps them in the
+# session, cart.storage.RedisCartStorage keeps them in a Redis hash per cart
+CART_STORAGE = "cart.storage.SessionCartStorage"
+# Key to store the ID of the Redis cart in the user session
+CART_REDIS_SESSION_ID = "cart_id"
+# seconds of inactivity before a Redis cart expires (two weeks)
+CART_REDIS_TTL = 60 * 60 * 24 * 14
+
+
+# dotted path to a callable returning the tax of a cart or order, see orders.pricing.
+# It is called with the subtotal, discount and shipping as keyword arguments.
+CART_TAX_HOOK = None
+
+
+# seconds a coupon lookup is cached in each process, see coupons.cache. Changes to a
+# coupon reach the other processes only when their entries expire, so keep it short.
+COUPON_CACHE_TTL = 60
 
 
 # email backend for testing in development
@@ -178,11 +248,48 @@ STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET")
 
 # declaring tasks in celery imports
 CELERY_IMPORTS = ("payment.tasks",)
+# periodic tasks run by celery beat
+CELERY_BEAT_SCHEDULE = {
+    "materialize-recommendations": {
+        "task": "shop.tasks.materialize_recommendations",
+        "schedule": 60 * 15,
+    },
+    "compact-recommendations": {
+        "task": "shop.tasks.compact_recommendations",
+        "schedule": 60 * 60 * 24,
+    },
+    "generate-sitemaps": {
+        "task": "shop.tasks.generate_sitemaps",
+        "schedule": 60 * 60,
+    },
+}
 
 # Redis settings
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 REDIS_DB = 1
+# connections kept by the shared pool of each process
+REDIS_MAX_CONNECTIONS = 50
+# seconds to connect to Redis, and to wait for the reply to a command
+REDIS_CONNECT_TIMEOUT = 0.25
+REDIS_SOCKET_TIMEOUT = 0.5
+# consecutive failures that open the circuit breaker, and seconds it stays open
+REDIS_BREAKER_THRESHOLD = 5
+REDIS_BREAKER_RESET = 30
+
+
+# shared cache used by all processes, e.g. for the catalog version in shop.cache
+CACHES = {
+    "default": {
+        # Redis errors are treated as cache misses, through the shared circuit breaker
+        "BACKEND": "shop.cache_backend.ResilientRedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/2",
+        "OPTIONS": {
+            "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+            "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        },
+    }
+}
 
 
 # django-parler settings
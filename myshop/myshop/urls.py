@@ -12,6 +12,7 @@ from django.contrib import admin
 from django.urls import include, path
 from django.utils.translation import gettext_lazy as _
 from payment import webhooks
+from shop import views as shop_views
 
 urlpatterns = i18n_patterns(
     # Django admin documentation
@@ -36,6 +37,11 @@ urlpatterns = i18n_patterns(
 # i18n_patterns() to ensure a single url is maintained for Stripe event notifications.
 urlpatterns += [
     path("payment/webhook/", webhooks.stripe_webhook, name="stripe-webhook"),
+    # sitemap index, sitemap shards and product feeds cover every language
+    path("sitemap.xml", shop_views.sitemap_file, name="sitemap"),
+    path("sitemaps/<str:filename>", shop_views.sitemap_file, name="sitemap-file"),
+    # state of the Redis circuit breaker of the process, for monitoring
+    path("health/redis/", shop_views.redis_health, name="redis-health"),
 ]
 # for serving uploaded media files using the development server
 if settings.DEBUG:
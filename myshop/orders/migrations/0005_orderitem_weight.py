@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 10:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_weight(apps, schema_editor):
+    """Capture the current product weight on existing order items."""
+    OrderItem = apps.get_model("orders", "OrderItem")
+    Product = apps.get_model("shop", "Product")
+    OrderItem.objects.update(
+        weight=Subquery(
+            Product.objects.filter(id=OuterRef("product_id")).values("weight")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_alter_order_address_alter_order_city_and_more"),
+        ("shop", "0003_product_weight"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="weight",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_product_weight, migrations.RunPython.noop),
+    ]
@@ -5,6 +5,9 @@ from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from shop.translations import translate
+
+from .pricing import Quote, build_quote
 
 
 class Order(models.Model):
@@ -59,67 +62,87 @@ class Order(models.Model):
     def __str__(self) -> str:
         return f"Order {self.id}"  # type: ignore
 
+    def get_quote(self) -> Quote:
+        """get_quote prices the order with the same pipeline used by the cart.
+
+        Items are read once, with the price and weight captured when the order was
+        created, and the quote is remembered on this instance.
+
+        Returns:
+            Quote: subtotal, discount, shipping, tax and total of the order
+
+        """
+        if getattr(self, "_quote", None) is None:
+            self._quote = build_quote(
+                (
+                    (item.price, item.quantity, item.weight)
+                    for item in self.items.all()  # type: ignore
+                ),
+                discount_rate=self.discount,
+            )
+        return self._quote
+
+    def get_items(self) -> list:
+        """get_items returns the items of the order with their products, loaded once.
+
+        Products are fetched with the items in a single query and their names come from
+        the translation cache, so invoices and payment line items do not query the
+        translations of each product.
+
+        Returns:
+            list: :model:`orders.OrderItem` objects of the order
+
+        """
+        if getattr(self, "_items", None) is None:
+            self._items = list(self.items.select_related("product"))  # type: ignore
+            translate(item.product for item in self._items)
+        return self._items
+
     def get_total_weight(self) -> int:
         """get_total_weight finds the total weight of all products in the order.
 
         For each item in the order, this method computes the weight of each product by
         multiplying its weight by how many of that product is being ordered. After all
         items in the order have weights calculated, all the weights are added together
-        and that sum is returned as an integer. Weights are stored in grams as a
-        PositiveIntegerField in the :model:`shop.Product` model.
+        and that sum is returned as an integer. Weights are stored in grams on each
+        :model:`orders.OrderItem` when the order is created, so the products themselves
+        are not loaded.
 
         Returns:
             integer: weight of all items in the order, calculated in grams
 
         """
-        return sum(item.get_weight() for item in self.items.all())  # type: ignore
+        return self.get_quote().weight
 
     def get_shipping_cost(self) -> Decimal:
-        """get_shipping_cost finds the cost of shipping for an order. Three fee tiers.
+        """get_shipping_cost finds the cost of shipping for an order.
 
-        Assigns the sum found by the get_total_weight method to the variable total_weight.
-        Returns 0.00 if total_weight is zero (indicating there are no physical products),
-        otherwise calculates shipping cost based on weight tiers.
-        The three weight tiers are calculated by weight as follows:
-            (A) if the value is less than or equal to 500 grams, 5.00 is returned.
-            (B) Else if the value is less than or equal to 2000 grams, 10.00 is returned.
-            (C) Otherwise, assume the value is greater than 2000 grams and 20.00 is returned.
+        The total weight of the order is priced by :func:`orders.shipping.get_shipping_cost`,
+        the same engine used by the cart.
 
         Returns:
             decimal: Shipping cost based on the total weight of the order.
 
         """
-        total_weight = self.get_total_weight()
-        if total_weight == 0:
-            return Decimal("0.00")
-        elif total_weight <= 500:
-            return Decimal("5.00")
-        elif total_weight <= 2000:
-            return Decimal("10.00")
-        else:
-            return Decimal("20.00")
+        return self.get_quote().shipping
 
     def get_total_cost_before_discount(self) -> Decimal:
-        return sum(item.get_cost() for item in self.items.all())  # type: ignore
+        return self.get_quote().subtotal
 
     def get_discount(self) -> Decimal:
-        total_cost = self.get_total_cost_before_discount()
-        if self.discount:
-            return total_cost * (Decimal(self.discount) / Decimal(100))
-        return Decimal(0)
+        return self.get_quote().discount
 
     def get_total_cost(self) -> Decimal:
         """get_total_cost gets the total cost of order, including discount and shipping.
 
         The total cost before the discount is found, then the amount of any discounts
-        are removed from the total cost. Then the shipping cost is found and removed.
+        are removed from the total cost. Then the shipping cost and any tax are added.
 
         Returns:
-            integer: This returns the total cost of the order as an integer with 2 decimals.
+            decimal: This returns the total cost of the order with 2 decimals.
 
         """
-        total_cost = self.get_total_cost_before_discount()
-        return total_cost - self.get_discount() + self.get_shipping_cost()
+        return self.get_quote().total
 
     def get_stripe_url(self) -> str:
         """get_stripe_url returns the Stripe dashboard's url for the payment of this order.
@@ -162,6 +185,7 @@ class OrderItem(models.Model):
     )
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
+    weight = models.PositiveIntegerField(default=0)  # weight in grams of one item
 
     def __str__(self) -> str:
         return str(self.id)  # type: ignore
@@ -170,5 +194,5 @@ class OrderItem(models.Model):
         return self.price * Decimal(self.quantity)
 
     def get_weight(self) -> int:
-        """Calculate the total weight of this item."""
-        return self.product.weight * self.quantity
+        """Calculate the total weight of this item from the weight captured at checkout."""
+        return self.weight * self.quantity
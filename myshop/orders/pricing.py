@@ -0,0 +1,94 @@
+"""pricing pipeline shared by :class:`cart.Cart` and :model:`orders.Order`.
+
+build_quote() walks the lines once and runs the stages in order: subtotal, coupon
+discount, shipping, and an optional tax hook. The result is a frozen Quote, so the
+amounts shown in the cart, on the checkout page and charged through Stripe all come
+from the same figures. Every amount is quantized to cents with ROUND_HALF_UP.
+
+"""
+
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .shipping import get_shipping_cost
+
+CENT = Decimal("0.01")
+
+
+def quantize(amount):
+    """quantize rounds an amount to cents, rounding halves up."""
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+@dataclass(frozen=True)
+class Quote:
+    """:class:`orders.Quote` holds the priced amounts of a cart or order.
+
+    Args:
+        subtotal (Decimal): cost of all the items
+        discount (Decimal): amount deducted by the coupon
+        shipping (Decimal): shipping cost for the total weight
+        tax (Decimal): amount returned by the tax hook, zero without one
+        total (Decimal): amount to charge
+        weight (int): total weight of the items in grams
+        discount_rate (int): coupon discount rate, a percentage between 0 and 100
+
+    """
+
+    subtotal: Decimal
+    discount: Decimal
+    shipping: Decimal
+    tax: Decimal
+    total: Decimal
+    weight: int
+    discount_rate: int = 0
+
+
+def get_tax_hook():
+    """get_tax_hook returns the callable set in CART_TAX_HOOK, or None if not set."""
+    if settings.CART_TAX_HOOK:
+        return import_string(settings.CART_TAX_HOOK)
+    return None
+
+
+def build_quote(lines, discount_rate=0):
+    """build_quote prices the given lines in a single pass.
+
+    The tax hook, if CART_TAX_HOOK is set, is called with the subtotal, discount and
+    shipping as keyword arguments and returns the tax amount.
+
+    Args:
+        lines (iterable): (price, quantity, weight) tuples, price as Decimal and weight
+            in grams for one item
+        discount_rate (int, optional): coupon discount rate, a percentage. Defaults to 0.
+
+    Returns:
+        Quote: the priced amounts
+
+    """
+    subtotal = Decimal(0)
+    weight = 0
+    for price, quantity, item_weight in lines:
+        subtotal += price * quantity
+        weight += item_weight * quantity
+    subtotal = quantize(subtotal)
+    discount = quantize(subtotal * Decimal(discount_rate) / Decimal(100))
+    shipping = get_shipping_cost(weight)
+    tax = Decimal("0.00")
+    tax_hook = get_tax_hook()
+    if tax_hook is not None:
+        tax = quantize(
+            tax_hook(subtotal=subtotal, discount=discount, shipping=shipping)
+        )
+    return Quote(
+        subtotal=subtotal,
+        discount=discount,
+        shipping=shipping,
+        tax=tax,
+        total=subtotal - discount + shipping + tax,
+        weight=weight,
+        discount_rate=discount_rate,
+    )
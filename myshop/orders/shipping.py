@@ -0,0 +1,38 @@
+from decimal import Decimal
+
+# weight tiers in grams, checked in order. Anything heavier than the last tier is
+# charged HEAVY_SHIPPING_COST.
+SHIPPING_TIERS = [
+    (500, Decimal("5.00")),
+    (2000, Decimal("10.00")),
+]
+HEAVY_SHIPPING_COST = Decimal("20.00")
+
+
+def get_shipping_cost(total_weight: int) -> Decimal:
+    """get_shipping_cost finds the cost of shipping for a given weight. Three fee tiers.
+
+    This is the shipping engine shared by :class:`cart.Cart` and :model:`orders.Order`,
+    so the cost shown in the cart is the cost stored with the order. It only needs the
+    total weight, which both callers compute from weights captured when products were
+    added, so no queries are made here.
+    Returns 0.00 if total_weight is zero (indicating there are no physical products),
+    otherwise calculates shipping cost based on weight tiers.
+    The three weight tiers are calculated by weight as follows:
+        (A) if the value is less than or equal to 500 grams, 5.00 is returned.
+        (B) Else if the value is less than or equal to 2000 grams, 10.00 is returned.
+        (C) Otherwise, assume the value is greater than 2000 grams and 20.00 is returned.
+
+    Args:
+        total_weight (int): weight of all items, calculated in grams
+
+    Returns:
+        decimal: Shipping cost based on the total weight.
+
+    """
+    if total_weight <= 0:
+        return Decimal("0.00")
+    for max_weight, cost in SHIPPING_TIERS:
+        if total_weight <= max_weight:
+            return cost
+    return HEAVY_SHIPPING_COST
@@ -1,3 +1,54 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from .pricing import build_quote
+
+
+def flat_tax(subtotal, discount, shipping):
+    """flat_tax charges 10% of the discounted subtotal, shipping excluded."""
+    return (subtotal - discount) * Decimal("0.1")
+
+
+class BuildQuoteTests(SimpleTestCase):
+    """Tests of :func:`orders.pricing.build_quote`."""
+
+    def test_empty_cart(self):
+        quote = build_quote([])
+        self.assertEqual(quote.subtotal, Decimal("0"))
+        self.assertEqual(quote.shipping, Decimal("0.00"))
+        self.assertEqual(quote.tax, Decimal("0"))
+        self.assertEqual(quote.total, Decimal("0"))
+
+    def test_subtotal_and_weight(self):
+        quote = build_quote([(Decimal("10.00"), 2, 100), (Decimal("2.50"), 4, 50)])
+        self.assertEqual(quote.subtotal, Decimal("30.00"))
+        self.assertEqual(quote.weight, 400)
+        self.assertEqual(quote.total, Decimal("35.00"))
+
+    def test_discount_is_rounded_to_cents(self):
+        quote = build_quote([(Decimal("10.05"), 1, 0)], discount_rate=15)
+        self.assertEqual(quote.discount, Decimal("1.51"))
+        self.assertEqual(quote.total, Decimal("8.54"))
+
+    def test_shipping_tiers(self):
+        tiers = [
+            (0, Decimal("0.00")),
+            (500, Decimal("5.00")),
+            (501, Decimal("10.00")),
+            (2000, Decimal("10.00")),
+            (2001, Decimal("20.00")),
+        ]
+        for weight, shipping in tiers:
+            with self.subTest(weight=weight):
+                quote = build_quote([(Decimal("1.00"), 1, weight)])
+                self.assertEqual(quote.shipping, shipping)
+                self.assertEqual(quote.total, Decimal("1.00") + shipping)
+
+    @override_settings(CART_TAX_HOOK="orders.tests.flat_tax")
+    def test_tax_hook(self):
+        quote = build_quote([(Decimal("50.00"), 2, 600)], discount_rate=10)
+        self.assertEqual(quote.discount, Decimal("10.00"))
+        self.assertEqual(quote.shipping, Decimal("10.00"))
+        self.assertEqual(quote.tax, Decimal("9.00"))
+        self.assertEqual(quote.total, Decimal("109.00"))
@@ -34,22 +34,24 @@ def order_create(request):
             # commit=False allows setting additional fields before saving the order
             # instance to the database
             order = form.save(commit=False)
+            # the coupon discount rate is stored, the order is priced from its items
+            # with the same pipeline as the cart, see Order.get_quote()
             if cart.coupon:
                 order.coupon = cart.coupon
-                order.discount = cart.get_discount()
-
-            # Ensure shipping cost is included when creating an order
-            shipping_cost = cart.get_shipping_cost()
-            if shipping_cost > 0:
-                order.shipping_cost = shipping_cost
+                order.discount = cart.coupon.discount
             order.save()
-            for item in cart:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item["product"],
-                    price=item["price"],
-                    quantity=item["quantity"],
-                )
+            OrderItem.objects.bulk_create(
+                [
+                    OrderItem(
+                        order=order,
+                        product=item["product"],
+                        price=item["price"],
+                        quantity=item["quantity"],
+                        weight=item.get("weight", item["product"].weight),
+                    )
+                    for item in cart
+                ]
+            )
 
             # launch asynchronous task with Celery
             order_created.delay(order.id)
@@ -67,7 +69,7 @@ def order_create(request):
     return render(
         request,
         "orders/order/create.html",
-        {"cart": cart, "form": form, "code": code},
+        {"cart": cart, "quote": cart.get_quote(), "form": form, "code": code},
     )
 
 
@@ -1,3 +1,144 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from coupons.models import Coupon
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from redis import RedisError
+from shop.models import Category, Product
+
+from .views import payment_process
+from .webhooks import stripe_webhook
+
+
+def create_order():
+    """create_order creates an order of two teas with a 15% coupon."""
+    category = Category.objects.create(name="Tea", slug="tea")
+    green = Product.objects.create(
+        category=category, name="Green tea", slug="green-tea", price="4.35"
+    )
+    black = Product.objects.create(
+        category=category, name="Black tea", slug="black-tea", price="12.99"
+    )
+    now = timezone.now()
+    coupon = Coupon.objects.create(
+        code="TEA15",
+        valid_from=now - timedelta(days=1),
+        valid_to=now + timedelta(days=1),
+        discount=15,
+        active=True,
+    )
+    order = Order.objects.create(
+        first_name="Ada",
+        last_name="Lovelace",
+        email="ada@example.com",
+        address="12 Example Road",
+        postal_code="12345",
+        city="London",
+        state="London",
+        coupon=coupon,
+        discount=coupon.discount,
+    )
+    OrderItem.objects.create(
+        order=order, product=green, price="4.35", quantity=3, weight=250
+    )
+    OrderItem.objects.create(
+        order=order, product=black, price="12.99", quantity=1, weight=400
+    )
+    return order
+
+
+class PaymentProcessTests(TestCase):
+    """Tests of the Stripe checkout session built by :func:`payment_process`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = create_order()
+
+    def create_session(self):
+        """create_session posts to payment_process and returns the Stripe calls."""
+        request = RequestFactory().post("/payment/process/")
+        request.session = {"order_id": self.order.id}
+        with mock.patch("payment.views.stripe") as stripe:
+            stripe.Coupon.create.return_value = SimpleNamespace(id="coupon")
+            stripe.checkout.Session.create.return_value = SimpleNamespace(
+                url="https://checkout.stripe.com/session"
+            )
+            response = payment_process(request)
+        self.assertEqual(response["Location"], "https://checkout.stripe.com/session")
+        return stripe
+
+    def assert_charges_quote(self, stripe):
+        session_data = stripe.checkout.Session.create.call_args.kwargs
+        charged = sum(
+            line["price_data"]["unit_amount"] * line["quantity"]
+            for line in session_data["line_items"]
+        )
+        if "discounts" in session_data:
+            charged -= stripe.Coupon.create.call_args.kwargs["amount_off"]
+        quote = Order.objects.get(pk=self.order.pk).get_quote()
+        self.assertEqual(charged, int(quote.total * 100))
+
+    def test_line_items_match_quote_total(self):
+        stripe = self.create_session()
+        self.assertEqual(stripe.Coupon.create.call_args.kwargs["amount_off"], 391)
+        self.assert_charges_quote(stripe)
+
+    @override_settings(CART_TAX_HOOK="orders.tests.flat_tax")
+    def test_line_items_match_quote_total_with_tax(self):
+        self.assert_charges_quote(self.create_session())
+
+
+class StripeWebhookTests(TestCase):
+    """Tests of the purchases recorded by :func:`stripe_webhook`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = create_order()
+
+    def post_paid_session(self):
+        event = {
+            "type": "checkout.session.completed",
+            "data": {
+                "object": {
+                    "mode": "payment",
+                    "payment_status": "paid",
+                    "client_reference_id": self.order.id,
+                    "payment_intent": "pi_test",
+                }
+            },
+        }
+        request = RequestFactory().post(
+            "/payment/webhook/",
+            data=b"{}",
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="signature",
+        )
+        with mock.patch("payment.webhooks.stripe.Webhook.construct_event") as event_for:
+            event_for.return_value = event
+            with mock.patch("payment.webhooks.payment_completed"):
+                return stripe_webhook(request)
+
+    @mock.patch("payment.webhooks.products_bought")
+    @mock.patch("payment.webhooks.Recommender")
+    def test_purchase_is_recorded(self, recommender, task):
+        self.assertEqual(self.post_paid_session().status_code, 200)
+        ids = list(self.order.items.values_list("product_id", flat=True))
+        recommender.return_value.products_bought.assert_called_once_with(
+            ids, dict(self.order.items.values_list("product_id", "quantity"))
+        )
+        task.delay.assert_not_called()
+
+    @mock.patch("payment.webhooks.products_bought")
+    @mock.patch("payment.webhooks.Recommender")
+    def test_purchase_is_queued_while_redis_is_down(self, recommender, task):
+        recommender.return_value.products_bought.side_effect = RedisError("down")
+        with self.assertLogs("payment.webhooks", "WARNING"):
+            self.assertEqual(self.post_paid_session().status_code, 200)
+        task.delay.assert_called_once_with(
+            list(self.order.items.values_list("product_id", "quantity"))
+        )
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
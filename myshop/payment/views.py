@@ -48,7 +48,7 @@ def payment_process(request):
         }
 
         # add order items to the Stripe checkout session
-        for item in order.items.all():
+        for item in order.get_items():
             session_data["line_items"].append(
                 {
                     "price_data": {
@@ -62,13 +62,15 @@ def payment_process(request):
                 }
             )
 
+        # amounts come from the same quote shown on the order summary
+        quote = order.get_quote()
+
         # Add shipping cost to the Stripe checkout session if it's greater than 0
-        shipping_cost = order.get_shipping_cost()
-        if shipping_cost > 0:
+        if quote.shipping > 0:
             session_data["line_items"].append(
                 {
                     "price_data": {
-                        "unit_amount": int(shipping_cost * Decimal("100")),
+                        "unit_amount": int(quote.shipping * Decimal("100")),
                         "currency": "usd",
                         "product_data": {
                             "name": "Shipping",
@@ -78,11 +80,27 @@ def payment_process(request):
                 }
             )
 
-        # Stripe coupon
-        if order.coupon:
+        # Add tax to the Stripe checkout session if it's greater than 0
+        if quote.tax > 0:
+            session_data["line_items"].append(
+                {
+                    "price_data": {
+                        "unit_amount": int(quote.tax * Decimal("100")),
+                        "currency": "usd",
+                        "product_data": {
+                            "name": "Tax",
+                        },
+                    },
+                    "quantity": 1,
+                }
+            )
+
+        # Stripe coupon, a fixed amount so Stripe deducts exactly the quoted discount
+        if order.coupon and quote.discount > 0:
             stripe_coupon = stripe.Coupon.create(
                 name=order.coupon.code,
-                percent_off=order.discount,
+                amount_off=int(quote.discount * Decimal("100")),
+                currency="usd",
                 duration="once",
             )
             session_data["discounts"] = [{"coupon": stripe_coupon.id}]
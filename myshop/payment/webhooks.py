@@ -6,8 +6,9 @@ from django.conf import settings
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from orders.models import Order
-from shop.models import Product
+from redis import RedisError
 from shop.recommender import Recommender
+from shop.tasks import products_bought
 
 from .tasks import payment_completed
 
@@ -67,11 +68,19 @@ def stripe_webhook(request):
             order.stripe_id = session.get("payment_intent")
             order.save()
 
-            # save items bought for product recommendations
-            product_ids = order.items.values_list("product_id", flat=True)
-            products = Product.objects.filter(id__in=product_ids)
+            # save items bought for product recommendations, weighted by quantity
+            quantities = {}
+            for product_id, quantity in order.items.values_list(
+                "product_id", "quantity"
+            ):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
             r = Recommender()
-            r.products_bought(products)
+            try:
+                r.products_bought(list(quantities), quantities)
+            except RedisError as e:
+                # buffered in the task queue and replayed once Redis is back
+                logger.warning(f"Purchase of order {order.id} buffered: {e}")
+                products_bought.delay(list(quantities.items()))
 
             # launch asynchronous task
             payment_completed.delay(order.id)
@@ -0,0 +1,224 @@
+"""read-only JSON API of the catalog: categories, product list and product detail.
+
+Every response has a strong ETag made of the language and the versions of the data it
+shows, read from the shared cache, and of the content coding of the body, since the
+gzip and identity bodies are different bytes. A request whose If-None-Match matches is
+answered with 304 Not Modified by the condition() decorator before the view runs,
+without any query. Otherwise the payload is looked up in the shared cache by the
+versions in its ETag. Payloads are
+compact JSON with sorted keys, stored gzip-compressed, and sent as they are to clients
+that accept gzip, so a payload is only serialized and compressed once per version.
+
+"""
+
+import gzip
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition, require_GET
+
+from . import facets
+from .cache import (
+    get_catalog_version,
+    get_category_tree,
+    get_category_version,
+    get_or_build,
+    get_product_version,
+)
+from .models import Product
+from .pagination import paginate
+from .slugs import get_category_id
+from .translations import translate
+
+
+def serialize_product(product):
+    return {
+        "id": product.id,
+        "name": product.name,
+        "slug": product.slug,
+        "url": product.get_absolute_url(),
+        "category": product.category_id,
+        "price": str(product.price),
+        "weight": product.weight,
+        "available": product.available,
+        "image": product.image.url if product.image else None,
+    }
+
+
+def compress(data):
+    """compress serializes data as compact JSON and compresses it with gzip.
+
+    Keys are sorted and mtime is fixed, so the same data always gives the same bytes.
+
+    """
+    payload = json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+    return gzip.compress(payload, mtime=0)
+
+
+def parse_accept_encoding(header):
+    """parse_accept_encoding maps the content codings of an Accept-Encoding header to
+    their q-values.
+
+    A coding without q-value has 1, and one with an invalid q-value has 0.
+
+    Args:
+        header (string): value of the Accept-Encoding header
+
+    Returns:
+        dict: q-value (float) keyed by lower-cased coding
+
+    """
+    codings = {}
+    for item in header.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def get_encoding(request):
+    """get_encoding returns the content coding of the response, gzip or identity.
+
+    gzip is sent when the client accepts it, with a q-value above 0, and does not
+    prefer identity. Codings that are not listed have the q-value of *, if it is given,
+    so identity is only preferred to gzip when the client says so.
+
+    """
+    codings = parse_accept_encoding(request.headers.get("Accept-Encoding", ""))
+    default = codings.get("*", 0)
+    q = codings.get("gzip", codings.get("x-gzip", default))
+    return "gzip" if q > 0 and q >= codings.get("identity", default) else "identity"
+
+
+def encoded(etag_func):
+    """encoded adds the content coding of the response to the ETags of etag_func."""
+
+    def get_etag(request, *args, **kwargs):
+        return f"{etag_func(request, *args, **kwargs)}-{get_encoding(request)}"
+
+    return get_etag
+
+
+def respond(request, etag, build):
+    """respond sends the cached payload of etag, building it with build on a miss.
+
+    Args:
+        request
+        etag (string): ETag of the response, without quotes
+        build (callable): returns the data of the response
+
+    Returns:
+        HttpResponse: the JSON payload, gzip-encoded if the client accepts it
+
+    """
+    payload = get_or_build(
+        f"shop:api:{etag}", lambda: compress(build()), settings.API_CACHE_TIMEOUT
+    )
+    if get_encoding(request) == "gzip":
+        response = HttpResponse(payload, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(
+            gzip.decompress(payload), content_type="application/json"
+        )
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def categories_etag(request):
+    return f"categories-{request.LANGUAGE_CODE}-{get_category_version()}"
+
+
+@require_GET
+@condition(etag_func=encoded(categories_etag))
+def categories(request):
+    """categories lists the categories with their names and slugs in the language."""
+    return respond(
+        request,
+        categories_etag(request),
+        lambda: {"categories": get_category_tree(request.LANGUAGE_CODE)},
+    )
+
+
+def product_list_etag(request):
+    # every query parameter can change the page, so they are part of the ETag
+    query = hashlib.sha1(
+        request.GET.urlencode().encode(), usedforsecurity=False
+    ).hexdigest()[:16]
+    return (
+        f"products-{request.LANGUAGE_CODE}-{get_catalog_version()}-"
+        f"{get_category_version()}-{query}"
+    )
+
+
+@require_GET
+@condition(etag_func=encoded(product_list_etag))
+def product_list(request):
+    """product_list lists the products, one page at a time, newest first.
+
+    The query parameters are the ones of the product list page: category (slug),
+    price, weight, available and cursor.
+
+    """
+    language = request.LANGUAGE_CODE
+
+    def build():
+        products = Product.objects.all()
+        filters = facets.get_filters(request.GET)
+        category_slug = request.GET.get("category")
+        if category_slug:
+            category_id = get_category_id(category_slug, language)
+            if category_id is None:
+                raise Http404("No Category matches the given query.")
+            products = products.filter(category_id=category_id)
+        products, next_cursor = paginate(
+            facets.filter_products(products, filters),
+            cursor=request.GET.get("cursor"),
+            page_size=settings.PRODUCTS_PER_PAGE,
+        )
+        return {
+            "products": [serialize_product(p) for p in translate(products, language)],
+            "next": next_cursor,
+        }
+
+    return respond(request, product_list_etag(request), build)
+
+
+def product_detail_etag(request, id):
+    return (
+        f"product-{id}-{request.LANGUAGE_CODE}-"
+        f"{get_product_version(id)}-{get_category_version()}"
+    )
+
+
+@require_GET
+@condition(etag_func=encoded(product_detail_etag))
+def product_detail(request, id):
+    """product_detail returns a single product, out of stock or not, with details."""
+
+    def build():
+        product = Product.objects.filter(id=id).first()
+        if product is None:
+            raise Http404("No Product matches the given query.")
+        translate([product], request.LANGUAGE_CODE)
+        return {
+            **serialize_product(product),
+            "description": product.safe_translation_getter(
+                "description", any_language=True
+            )
+            or "",
+        }
+
+    return respond(request, product_detail_etag(request, id), build)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ShopConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "shop"
+
+    def ready(self):
+        # connect the signal receivers that keep the catalog caches up to date
+        from . import signals
+
+        # the slug map is built once per deploy, after the migrations
+        post_migrate.connect(signals.build_slug_map, sender=self)
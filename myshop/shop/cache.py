@@ -0,0 +1,193 @@
+"""shared cache helpers for the product catalog.
+
+Versions are counters kept in the shared cache and bumped by the receivers in
+:mod:`shop.signals`. The catalog version is bumped whenever a :model:`shop.Product` or
+one of its translations is saved or deleted. Data copied from the catalog, such as the prices stored in cart lines,
+records the version it was copied at and only has to be checked against the database
+when the version changes. The category version is bumped whenever a
+:model:`shop.Category` or one of its translations changes, and is part of the key of the
+cached category tree, so a change simply makes the old entries unreachable. Each
+product also has its own version, bumped when the product, its translations or its
+recommendations change, which is part of the key of its cached detail page. Product
+versions expire after PRODUCT_VERSION_TIMEOUT seconds, since any ID in a url creates
+one, and an expired version is simply replaced by a newer one.
+
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import translation
+
+from .models import Category
+
+CATALOG_VERSION_KEY = "shop:catalog_version"
+CATEGORY_VERSION_KEY = "shop:category_version"
+
+
+def _initial_version():
+    # a version created after the key was evicted must never match an older one
+    return int(time.time() * 1000)
+
+
+def get_version(key, timeout=None):
+    """get_version returns the current value of the version counter with the given key.
+
+    Args:
+        key (string): cache key of the version counter
+        timeout (int, optional): seconds a new counter is kept. Defaults to None,
+            forever.
+
+    Returns:
+        int: version
+
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=timeout)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key, timeout=None):
+    """bump_version increments the version counter with the given key after a change.
+
+    Args:
+        key (string): cache key of the version counter
+        timeout (int, optional): seconds a new counter is kept. Defaults to None,
+            forever.
+
+    Returns:
+        int: new version
+
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key does not exist (yet or anymore)
+        cache.add(key, _initial_version(), timeout=timeout)
+        return cache.get(key)
+
+
+def get_catalog_version():
+    """get_catalog_version returns the current version of the catalog."""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """bump_catalog_version increments the catalog version after a product change."""
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def get_product_version_key(product_id):
+    return f"shop:product_version:{product_id}"
+
+
+def get_product_version(product_id):
+    """get_product_version returns the current version of a single product."""
+    return get_version(
+        get_product_version_key(product_id), settings.PRODUCT_VERSION_TIMEOUT
+    )
+
+
+def bump_product_version(product_id):
+    """bump_product_version increments the version of a product after it changed."""
+    return bump_version(
+        get_product_version_key(product_id), settings.PRODUCT_VERSION_TIMEOUT
+    )
+
+
+def invalidate_products(product_ids):
+    """invalidate_products changes the version of several products at once.
+
+    The version keys are deleted, so the next get_version() of each product starts a
+    new version, with a single cache call for all of them.
+
+    """
+    cache.delete_many(
+        [get_product_version_key(product_id) for product_id in product_ids]
+    )
+
+
+def get_category_version():
+    """get_category_version returns the current version of the categories."""
+    return get_version(CATEGORY_VERSION_KEY)
+
+
+def bump_category_version():
+    """bump_category_version increments the category version after a category change."""
+    return bump_version(CATEGORY_VERSION_KEY)
+
+
+def get_category_tree(language):
+    """get_category_tree returns the categories to display in the given language.
+
+    Names, slugs and urls are computed once per language and category version and
+    kept in the shared cache, so a warm cache costs no query and no reverse() call.
+
+    Args:
+        language (string): code of the language to display
+
+    Returns:
+        list: a dict with id, name, slug and url for each category
+
+    """
+    key = f"shop:category_tree:{language}:{get_category_version()}"
+    tree = cache.get(key)
+    if tree is None:
+        with translation.override(language):
+            tree = [
+                {
+                    "id": category.id,
+                    "name": category.name,
+                    "slug": category.slug,
+                    "url": category.get_absolute_url(),
+                }
+                for category in Category.objects.order_by("id").prefetch_related(
+                    "translations"
+                )
+            ]
+        cache.set(key, tree, settings.CATEGORY_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def get_or_build(key, build, timeout):
+    """get_or_build returns the cached value of key, building it on a miss.
+
+    Only one request at a time builds a missing value. It takes a lock with cache.add(),
+    which is atomic in the shared cache, while the other requests poll the cache for the
+    result. A waiting request tries to take the lock again at each poll, so it builds
+    the value as soon as the lock is released without one, for example when build
+    raised, and it builds the value itself after SINGLE_FLIGHT_WAIT seconds. This way a
+    popular entry expiring under load triggers a single rebuild. build should return a
+    value standing for "not found" rather than raise, so that it is cached too.
+
+    Args:
+        key (string): cache key of the value
+        build (callable): returns the value to cache, must not return None
+        timeout (int): seconds to keep the value in the cache
+
+    Returns:
+        object: the cached or built value
+
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        if cache.add(lock_key, 1, settings.SINGLE_FLIGHT_WAIT * 2):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+            finally:
+                cache.delete(lock_key)
+            return value
+        # another request is building the value, wait for it
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return build()
@@ -0,0 +1,59 @@
+"""Django cache backend on Redis that degrades to cache misses while Redis is down.
+
+Every call goes through the circuit breaker of :mod:`shop.redis_pool`, shared with
+the other Redis users of the shop. A failed or rejected call does not raise: reads
+return nothing, writes are dropped and add() reports success, so the caller builds the
+value itself instead of waiting for a lock nobody holds. Together with the socket
+timeouts given in OPTIONS, a Redis incident costs each request a bounded delay until
+the breaker opens, and no delay at all while it is open.
+
+"""
+
+import redis
+from django.core.cache.backends.redis import RedisCache
+
+from .redis_pool import breaker
+
+
+class ResilientRedisCache(RedisCache):
+    """:class:`shop.ResilientRedisCache` is a RedisCache whose failures are misses."""
+
+    def _call(self, fallback, function, *args, **kwargs):
+        try:
+            return breaker.call(function, *args, **kwargs)
+        except redis.RedisError:
+            return fallback
+
+    def add(self, key, value, timeout=None, version=None):
+        return self._call(True, super().add, key, value, timeout, version)
+
+    def get(self, key, default=None, version=None):
+        return self._call(default, super().get, key, default, version)
+
+    def set(self, key, value, timeout=None, version=None):
+        self._call(None, super().set, key, value, timeout, version)
+
+    def touch(self, key, timeout=None, version=None):
+        return self._call(False, super().touch, key, timeout, version)
+
+    def delete(self, key, version=None):
+        return self._call(False, super().delete, key, version)
+
+    def get_many(self, keys, version=None):
+        return self._call({}, super().get_many, keys, version)
+
+    def has_key(self, key, version=None):
+        return self._call(False, super().has_key, key, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._call(None, super().incr, key, delta, version)
+
+    def set_many(self, data, timeout=None, version=None):
+        # every key failed
+        return self._call(list(data), super().set_many, data, timeout, version)
+
+    def delete_many(self, keys, version=None):
+        self._call(None, super().delete_many, keys, version)
+
+    def clear(self):
+        return self._call(False, super().clear)
@@ -0,0 +1,342 @@
+"""bulk import and export of the product catalog, used by the catalog commands.
+
+A catalog row holds the fields of a :model:`shop.Product` and its translations in
+every language: category, price, weight, available, then name_[code], slug_[code] and
+description_[code] for each language code. The category is given by its slug in the
+fallback language. Products are matched by their slug in the fallback language, so a
+row whose slug already exists updates that product, otherwise a new product is created.
+
+Rows are streamed and handled in chunks, so memory is bounded by the chunk size. Each
+chunk is written with bulk_create and bulk_update inside its own transaction, without
+the per-row signals of Model.save(). The cached versions and translations of the
+products of a chunk are invalidated once it is written, and the caches that depend on
+the whole catalog once, after the last chunk. The importer only keeps counts and the
+first MAX_ERRORS errors, so its memory does not grow with the size of the catalog.
+
+"""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+from parler import appsettings
+
+from . import search, slugs, translations
+from .cache import bump_catalog_version, invalidate_products
+from .models import Category, Product
+
+ProductTranslation = Product._parler_meta.root_model
+CategoryTranslation = Category._parler_meta.root_model
+
+PRODUCT_FIELDS = ["category", "price", "weight", "available"]
+TRANSLATED_FIELDS = ["name", "slug", "description"]
+FORMATS = ["csv", "jsonl"]
+# invalid rows whose error is kept to be reported, the others are only counted
+MAX_ERRORS = 100
+
+
+def get_key_language():
+    """get_key_language returns the language whose slugs identify products."""
+    # parler turns the "fallback" setting into a list of "fallbacks"
+    return appsettings.PARLER_LANGUAGES["default"]["fallbacks"][0]
+
+
+def get_languages():
+    return [code for code, name in settings.LANGUAGES]
+
+
+def get_columns():
+    """get_columns returns the columns of a catalog row, in order."""
+    return PRODUCT_FIELDS + [
+        f"{field}_{code}" for code in get_languages() for field in TRANSLATED_FIELDS
+    ]
+
+
+def get_category_slugs():
+    """get_category_slugs maps the slug of each category to its ID, in one query."""
+    return dict(
+        CategoryTranslation.objects.filter(
+            language_code=get_key_language()
+        ).values_list("slug", "master_id")
+    )
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def read_rows(stream, file_format):
+    """read_rows parses catalog rows from a text stream, one at a time.
+
+    Args:
+        stream (file): open text file
+        file_format (string): csv or jsonl
+
+    Yields:
+        dict: values of a row keyed by column
+
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_rows(stream, rows, file_format):
+    """write_rows serializes catalog rows to a text stream, one at a time.
+
+    Args:
+        stream (file): open text file
+        rows (iterable): values of each row keyed by column
+        file_format (string): csv or jsonl
+
+    Returns:
+        int: number of rows written
+
+    """
+    count = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(stream, fieldnames=get_columns())
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    else:
+        for count, row in enumerate(rows, 1):
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return count
+
+
+def export_rows(chunk_size=2000):
+    """export_rows reads the whole catalog, one chunk of products at a time.
+
+    Products are read in ID order with a keyset on the primary key, and the
+    translations of each chunk are fetched with a single query.
+
+    Args:
+        chunk_size (int, optional): number of products read at once. Defaults to 2000.
+
+    Yields:
+        dict: values of a row keyed by column
+
+    """
+    category_slugs = {
+        category_id: slug for slug, category_id in get_category_slugs().items()
+    }
+    last_id = 0
+    while True:
+        products = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "category_id", "price", "weight", "available")[
+                :chunk_size
+            ]
+        )
+        if not products:
+            return
+        rows = {}
+        for product_id, category_id, price, weight, available in products:
+            rows[product_id] = dict.fromkeys(get_columns(), "")
+            rows[product_id].update(
+                category=category_slugs.get(category_id, ""),
+                price=str(price),
+                weight=weight,
+                available=int(available),
+            )
+        for product_id, code, *values in ProductTranslation.objects.filter(
+            master_id__in=rows
+        ).values_list("master_id", "language_code", *TRANSLATED_FIELDS):
+            for field, value in zip(TRANSLATED_FIELDS, values):
+                rows[product_id][f"{field}_{code}"] = value
+        yield from rows.values()
+        last_id = products[-1][0]
+
+
+def clean_row(row, category_slugs):
+    """clean_row validates a catalog row and converts its values.
+
+    Args:
+        row (dict): values of the row keyed by column, as read
+        category_slugs (dict): ID of each category keyed by slug
+
+    Raises:
+        ValidationError: if a value is missing or invalid
+
+    Returns:
+        tuple: fields of the product and dict of translated fields by language code.
+            available is None if its cell is empty.
+
+    """
+    key_language = get_key_language()
+    category_id = category_slugs.get(row.get("category"))
+    if category_id is None:
+        raise ValidationError(f"unknown category {row.get('category')!r}")
+    try:
+        price = Decimal(str(row.get("price"))).quantize(Decimal("0.01"))
+        weight = int(row.get("weight") or 0)
+    except (InvalidOperation, ValueError):
+        raise ValidationError("invalid price or weight") from None
+    if price < 0 or weight < 0:
+        raise ValidationError("price and weight cannot be negative")
+    # an empty cell keeps the availability of an existing product, see import_chunk
+    available = row.get("available")
+    available = "" if available is None else str(available).strip().lower()
+    if available in ("1", "true", "yes"):
+        available = True
+    elif available in ("0", "false", "no"):
+        available = False
+    elif available:
+        raise ValidationError(f"invalid available {row.get('available')!r}")
+    else:
+        available = None
+    fields = {
+        "category_id": category_id,
+        "price": price,
+        "weight": weight,
+        "available": available,
+    }
+    translated = {}
+    for code in get_languages():
+        values = {
+            field: row.get(f"{field}_{code}") or "" for field in TRANSLATED_FIELDS
+        }
+        if values["name"] and values["slug"]:
+            validate_slug(values["slug"])
+            translated[code] = values
+        elif code == key_language:
+            raise ValidationError(f"name_{code} and slug_{code} are required")
+    return fields, translated
+
+
+class CatalogImporter:
+    """:class:`shop.CatalogImporter` writes catalog rows to the database in chunks.
+
+    Args:
+        chunk_size (int): number of rows written in each transaction
+        dry_run (bool): whether rows are only validated
+        max_errors (int): number of errors kept in errors, the others are only counted
+
+    """
+
+    def __init__(self, chunk_size=1000, dry_run=False, max_errors=MAX_ERRORS):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.category_slugs = get_category_slugs()
+        self.created = 0
+        self.updated = 0
+        self.invalid = 0
+        # (row number, message) of the first max_errors invalid rows
+        self.errors = []
+
+    def run(self, rows):
+        """run imports every row, then invalidates the caches of the whole catalog once.
+
+        Args:
+            rows (iterable): values of each row keyed by column
+
+        Returns:
+            int: number of rows read
+
+        """
+        count = 0
+        for chunk in chunked(rows, self.chunk_size):
+            self.import_chunk(chunk, first_row=count + 1)
+            count += len(chunk)
+        if not self.dry_run and (self.created or self.updated):
+            self.invalidate()
+        return count
+
+    def import_chunk(self, rows, first_row):
+        key_language = get_key_language()
+        cleaned = {}
+        for number, row in enumerate(rows, first_row):
+            try:
+                fields, translated = clean_row(row, self.category_slugs)
+            except ValidationError as e:
+                self.invalid += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((number, "; ".join(e.messages)))
+                continue
+            # a slug given twice in the same chunk keeps its last row
+            cleaned[translated[key_language]["slug"]] = (fields, translated)
+        if not cleaned or self.dry_run:
+            return
+        with transaction.atomic():
+            existing = {}
+            was_available = {}
+            for slug, product_id, available in ProductTranslation.objects.filter(
+                language_code=key_language, slug__in=cleaned
+            ).values_list("slug", "master_id", "master__available"):
+                existing[slug] = product_id
+                was_available[slug] = available
+            now = timezone.now()
+            to_update = []
+            to_create = []
+            for slug, (fields, translated) in cleaned.items():
+                if fields["available"] is None:
+                    # new products are available by default
+                    fields["available"] = was_available.get(slug, True)
+                if slug in existing:
+                    to_update.append(Product(id=existing[slug], updated=now, **fields))
+                else:
+                    to_create.append((slug, Product(**fields)))
+            Product.objects.bulk_update(
+                to_update, ["category", "price", "weight", "available", "updated"]
+            )
+            # the primary keys of the new products are set by bulk_create
+            Product.objects.bulk_create([product for slug, product in to_create])
+            existing.update((slug, product.id) for slug, product in to_create)
+            self.write_translations(
+                {existing[slug]: values for slug, (fields, values) in cleaned.items()}
+            )
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        product_ids = [existing[slug] for slug in cleaned]
+        invalidate_products(product_ids)
+        translations.invalidate_many(Product, product_ids)
+
+    def write_translations(self, translated):
+        """write_translations creates or updates the translations of a chunk.
+
+        Args:
+            translated (dict): translated fields by language code, keyed by product ID
+
+        """
+        existing = {
+            (product_id, code): translation_id
+            for translation_id, product_id, code in ProductTranslation.objects.filter(
+                master_id__in=translated
+            ).values_list("id", "master_id", "language_code")
+        }
+        to_update = []
+        to_create = []
+        for product_id, languages in translated.items():
+            for code, values in languages.items():
+                translation = ProductTranslation(
+                    id=existing.get((product_id, code)),
+                    master_id=product_id,
+                    language_code=code,
+                    **values,
+                )
+                if translation.id is None:
+                    to_create.append(translation)
+                else:
+                    to_update.append(translation)
+        ProductTranslation.objects.bulk_update(to_update, TRANSLATED_FIELDS)
+        ProductTranslation.objects.bulk_create(to_create)
+
+    def invalidate(self):
+        """invalidate refreshes the caches that depend on the whole catalog."""
+        bump_catalog_version()
+        slugs.build()
+        search.rebuild()
@@ -0,0 +1,228 @@
+"""offline rebuild of the products bought together, from the history of paid orders.
+
+Paid :model:`orders.OrderItem` rows are streamed with .iterator(), ordered by order, in
+batches that never split an order. Each batch becomes a sparse order x product matrix of
+quantities Q, and B is the same matrix with every quantity set to 1. B.T @ Q then holds,
+for every pair of products, the quantity of the second one bought in the orders of the
+first one, which is what :class:`shop.Recommender` adds with ZINCRBY when an order is
+paid. The products of the batches are added up in a sparse product x product matrix,
+so memory is bounded by the number of distinct pairs, not by the number of items.
+Quantities are weighted by the age of their order with the decay of the recommender,
+relative to the epoch given to count().
+
+load() writes the best entries of each row to a staging copy of its
+product:[id]:purchased_with set, with one pipeline per batch of products, and then
+renames the staging sets over the live ones, as materialize() does with the served
+suggestions, so pages keep their recommendations during a rebuild. The purchases the
+payment webhook adds while the rebuild runs are overwritten by the rename, so only the
+orders updated before the rebuild started are counted, and replay() adds the others
+once the sets are loaded.
+
+"""
+
+import uuid
+from itertools import groupby, islice
+from operator import itemgetter
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from orders.models import OrderItem
+from scipy import sparse
+
+from .models import Product
+from .recommender import Recommender
+
+
+def iter_batches(batch_size, updated_before=None):
+    """iter_batches streams the items of paid orders, batch_size items at a time.
+
+    A batch only ends between two orders, so it may hold a few more items.
+
+    Args:
+        batch_size (int): number of items of a batch
+        updated_before (datetime, optional): only orders last updated at or before this
+            time are streamed. Defaults to None, every paid order.
+
+    Yields:
+        tuple: numpy arrays of the order IDs, product IDs and quantities of the items,
+            and of the UNIX times their orders were created
+
+    """
+    items = OrderItem.objects.filter(order__paid=True)
+    if updated_before is not None:
+        items = items.filter(order__updated__lte=updated_before)
+    items = (
+        items.order_by("order_id")
+        .values_list("order_id", "product_id", "quantity", "order__created")
+        .iterator(chunk_size=min(batch_size, 10000))
+    )
+    batch = []
+    for order_id, product_id, quantity, created in items:
+        if len(batch) >= batch_size and order_id != batch[-1][0]:
+            yield _to_arrays(batch)
+            batch = []
+        batch.append((order_id, product_id, quantity, created.timestamp()))
+    if batch:
+        yield _to_arrays(batch)
+
+
+def _to_arrays(batch):
+    order_ids, product_ids, quantities, created = zip(*batch)
+    return (
+        np.array(order_ids, dtype=np.int64),
+        np.array(product_ids, dtype=np.int64),
+        np.array(quantities, dtype=np.float64),
+        np.array(created, dtype=np.float64),
+    )
+
+
+def get_size():
+    """get_size returns the side of the co-purchase matrix, above every product ID."""
+    return (Product.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+
+def count(batches, size, epoch, progress=None):
+    """count adds up the co-purchases of the batches in a sparse matrix.
+
+    Args:
+        batches (iterable): order IDs, product IDs, quantities and order times, as from
+            iter_batches
+        size (int): side of the matrix, greater than every product ID
+        epoch (float): UNIX time at which a quantity weighs its nominal value
+        progress (callable, optional): called with the number of items counted so far
+            after each batch
+
+    Returns:
+        scipy.sparse.csr_matrix: quantity of the column product bought with the row
+            product, over every order, keyed by product IDs
+
+    """
+    counts = sparse.csr_matrix((size, size), dtype=np.float64)
+    items = 0
+    for order_ids, product_ids, quantities, created in batches:
+        rows = np.unique(order_ids, return_inverse=True)[1]
+        # same decay as Recommender.get_weight()
+        half_lives = (created - epoch) / settings.RECOMMENDATIONS_HALF_LIFE
+        weights = quantities * 2**half_lives
+        # the quantities of a product listed twice in an order are summed
+        bought = sparse.csr_matrix(
+            (weights, (rows, product_ids)),
+            shape=(rows.max() + 1, size),
+        )
+        together = bought.copy()
+        together.data[:] = 1
+        counts = counts + (together.T @ bought).tocsr()
+        items += len(order_ids)
+        if progress is not None:
+            progress(items)
+    # a product is not suggested with itself
+    counts = (counts - sparse.diags(counts.diagonal())).tocsr()
+    counts.eliminate_zeros()
+    return counts
+
+
+def load(counts, top_n, batch_size=500, redis_client=None):
+    """load replaces the sets of every product with the top_n best entries of counts.
+
+    The new sets are written to staging keys, product:[id]:purchased_with:rebuild:[x]
+    with a random x, then each one is moved over the live set with RENAME, batch_size
+    keys per transaction, so a product always has either its old or its new set and is
+    never left empty while the rebuild runs. The live sets of the products without
+    co-purchases are then found with SCAN and removed. If writing fails, the staging
+    keys are removed and the live sets are left as they were.
+
+    Args:
+        counts (scipy.sparse.csr_matrix): co-purchases, as returned by count
+        top_n (int): products kept in the set of each product
+        batch_size (int, optional): products written per pipeline. Defaults to 500.
+        redis_client (redis.Redis, optional): defaults to the shared client
+
+    Returns:
+        int: number of products with a set
+
+    """
+    recommender = Recommender(redis_client)
+    r = recommender.redis
+    token = uuid.uuid4().hex
+
+    def get_staging_key(product_id):
+        return f"{recommender.get_product_key(product_id)}:rebuild:{token}"
+
+    product_ids = np.flatnonzero(np.diff(counts.indptr)).tolist()
+    try:
+        for start in range(0, len(product_ids), batch_size):
+            with r.pipeline(transaction=False) as pipe:
+                for product_id in product_ids[start : start + batch_size]:
+                    begin, end = (
+                        counts.indptr[product_id],
+                        counts.indptr[product_id + 1],
+                    )
+                    with_ids = counts.indices[begin:end]
+                    scores = counts.data[begin:end]
+                    if len(scores) > top_n:
+                        best = np.argpartition(scores, -top_n)[-top_n:]
+                        with_ids, scores = with_ids[best], scores[best]
+                    pipe.zadd(
+                        get_staging_key(product_id),
+                        dict(zip(with_ids.tolist(), scores.tolist())),
+                    )
+                pipe.execute()
+    except Exception:
+        staging_keys = r.scan_iter(match=get_staging_key("*"), count=batch_size)
+        while batch := list(islice(staging_keys, batch_size)):
+            r.unlink(*batch)
+        raise
+    for start in range(0, len(product_ids), batch_size):
+        with r.pipeline(transaction=True) as pipe:
+            for product_id in product_ids[start : start + batch_size]:
+                pipe.rename(
+                    get_staging_key(product_id), recommender.get_product_key(product_id)
+                )
+            pipe.execute()
+    rebuilt = set(product_ids)
+    recommender.clear_purchases(
+        product_id
+        for key in recommender.scan_product_keys(batch_size)
+        if (product_id := int(key.split(b":")[1])) not in rebuilt
+    )
+    return len(product_ids)
+
+
+def replay(updated_after, updated_before, redis_client=None):
+    """replay adds the purchases of the orders paid while the sets were rebuilt.
+
+    The webhook records a purchase after saving its paid order. The purchases recorded
+    between the start of the rebuild and the rename of a set by load() are lost, and
+    iter_batches() did not count those orders, so the paid orders updated in between
+    are added again with :meth:`shop.Recommender.products_bought`, as the webhook does.
+    An order paid after its sets were renamed but before load() returned is counted
+    twice.
+
+    Args:
+        updated_after (datetime): when the rebuild started, as given to iter_batches
+        updated_before (datetime): when load() returned
+        redis_client (redis.Redis, optional): defaults to the shared client
+
+    Returns:
+        int: number of orders replayed
+
+    """
+    recommender = Recommender(redis_client)
+    items = (
+        OrderItem.objects.filter(
+            order__paid=True,
+            order__updated__gt=updated_after,
+            order__updated__lte=updated_before,
+        )
+        .order_by("order_id")
+        .values_list("order_id", "product_id", "quantity")
+    )
+    orders = 0
+    for order_id, order_items in groupby(items.iterator(), key=itemgetter(0)):
+        quantities = {}
+        for _, product_id, quantity in order_items:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        recommender.products_bought(list(quantities), quantities)
+        orders += 1
+    return orders
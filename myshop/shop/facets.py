@@ -0,0 +1,347 @@
+"""facet index used to count the products of each filter of the product list.
+
+The index holds the ID of every product in a compact array, and for each facet value a
+bitset stored as a Python int, where bit n is set if the product at position n has that
+value. Facets are price band, weight band, category and availability. Counting the
+products that match a set of filters is an AND of bitsets followed by a popcount, so
+counts for every facet value cost no query at all.
+
+The index is built from the database the first time it is needed. The receivers in
+:mod:`shop.signals` apply product changes to the index of the current process, and
+other processes rebuild theirs once the catalog version has changed and the index is
+older than FACET_INDEX_MAX_AGE seconds.
+
+"""
+
+import threading
+import time
+from array import array
+from decimal import Decimal
+
+from django.conf import settings
+from orders.shipping import SHIPPING_TIERS
+
+from .cache import get_catalog_version
+from .models import Product
+
+FACETS = ["category", "price", "weight", "available"]
+
+
+def get_bands(bounds):
+    """get_bands turns ascending upper bounds into (lower, upper) bands.
+
+    The last band has no upper bound. For bounds [25, 50] the bands are (0, 25),
+    (25, 50) and (50, None).
+
+    """
+    lowers = [0, *bounds]
+    uppers = [*bounds, None]
+    return list(zip(lowers, uppers))
+
+
+def band_label(band):
+    lower, upper = band
+    return f"{lower}-{upper}" if upper is not None else f"{lower}-"
+
+
+def parse_band(label):
+    """parse_band reads a band from its label, as given in the query string.
+
+    Returns:
+        tuple: (lower, upper) with upper None for the last band, or None if invalid
+
+    """
+    try:
+        lower, upper = label.split("-")
+        return Decimal(lower), Decimal(upper) if upper else None
+    except (AttributeError, ValueError, ArithmeticError):
+        return None
+
+
+def find_band(bands, value, inclusive_upper=False):
+    for band in bands:
+        lower, upper = band
+        if upper is None:
+            return band
+        if value < upper or (inclusive_upper and value == upper):
+            return band
+    return bands[-1]
+
+
+PRICE_BANDS = get_bands(settings.FACET_PRICE_BOUNDS)
+# weight bands follow the shipping tiers, whose upper bounds are inclusive
+WEIGHT_BANDS = get_bands([max_weight for max_weight, cost in SHIPPING_TIERS])
+
+
+class FacetIndex:
+    """:class:`shop.FacetIndex` holds the bitsets of every facet value.
+
+    Args:
+        ids (array): product ID at each position
+        positions (dict): position of each product ID
+        bitsets (dict): for each facet, a dict of bitsets keyed by facet value
+        values (dict): facet values of each product ID, used to clear its bits
+        version (int): catalog version the index was built at
+
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.positions = {}
+        self.bitsets = {facet: {} for facet in FACETS}
+        self.values = {}
+        self.version = None
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_values(category_id, price, weight, available):
+        return {
+            "category": category_id,
+            "price": band_label(find_band(PRICE_BANDS, price)),
+            "weight": band_label(find_band(WEIGHT_BANDS, weight, inclusive_upper=True)),
+            "available": available,
+        }
+
+    @classmethod
+    def build(cls):
+        """build creates the index of every product, streaming them from the database.
+
+        Bits are first collected in bytearrays and turned into ints once per value.
+
+        Returns:
+            FacetIndex: the new index
+
+        """
+        index = cls()
+        index.version = get_catalog_version()
+        bitmaps = {facet: {} for facet in FACETS}
+        rows = Product.objects.values_list(
+            "id", "category_id", "price", "weight", "available"
+        ).iterator(chunk_size=5000)
+        for position, (product_id, *fields) in enumerate(rows):
+            index.ids.append(product_id)
+            index.positions[product_id] = position
+            values = cls.get_values(*fields)
+            index.values[product_id] = values
+            for facet, value in values.items():
+                bitmap = bitmaps[facet].setdefault(value, bytearray())
+                byte = position >> 3
+                if len(bitmap) <= byte:
+                    bitmap.extend(bytes(byte - len(bitmap) + 1))
+                bitmap[byte] |= 1 << (position & 7)
+        for facet, values in bitmaps.items():
+            index.bitsets[facet] = {
+                value: int.from_bytes(bitmap, "little")
+                for value, bitmap in values.items()
+            }
+        return index
+
+    def update(self, product_id, values=None):
+        """update sets the facet values of a product, or clears them if values is None.
+
+        Args:
+            product_id (int): ID of the changed product
+            values (dict, optional): facet values from get_values(), None if deleted
+
+        """
+        with self.lock:
+            position = self.positions.get(product_id)
+            if position is None:
+                if values is None:
+                    return
+                position = self.positions[product_id] = len(self.ids)
+                self.ids.append(product_id)
+            bit = 1 << position
+            old_values = self.values.pop(product_id, None)
+            if old_values:
+                for facet, value in old_values.items():
+                    self.bitsets[facet][value] &= ~bit
+            if values is not None:
+                self.values[product_id] = values
+                for facet, value in values.items():
+                    bitsets = self.bitsets[facet]
+                    bitsets[value] = bitsets.get(value, 0) | bit
+
+    def match(self, filters, exclude=None):
+        """match returns the bitset of the products matching every filter.
+
+        Args:
+            filters (dict): selected value of each filtered facet
+            exclude (string, optional): facet to leave out of the filters
+
+        Returns:
+            int: bitset of the matching products, or -1 if nothing is filtered
+
+        """
+        matched = -1
+        for facet, value in filters.items():
+            if facet != exclude:
+                matched &= self.bitsets[facet].get(value, 0)
+        return matched
+
+    def get_counts(self, filters):
+        """get_counts counts the products of every facet value.
+
+        The count of a value is taken with the filters of the other facets applied, so
+        it is the number of products a user gets by choosing that value.
+
+        Args:
+            filters (dict): selected value of each filtered facet
+
+        Returns:
+            dict: for each facet, a dict of counts keyed by facet value
+
+        """
+        counts = {}
+        with self.lock:
+            for facet in FACETS:
+                matched = self.match(filters, exclude=facet)
+                counts[facet] = {
+                    value: (bitset & matched).bit_count()
+                    for value, bitset in self.bitsets[facet].items()
+                }
+        return counts
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """get_index returns the facet index of this process, building it if needed."""
+    global _index
+    index = _index
+    if index is None or (
+        time.monotonic() - index.built_at > settings.FACET_INDEX_MAX_AGE
+        and index.version != get_catalog_version()
+    ):
+        with _lock:
+            if _index is index:
+                _index = FacetIndex.build()
+            index = _index
+    return index
+
+
+def update_product(product, deleted=False):
+    """update_product applies a product change to the index of this process, if any."""
+    if _index is None:
+        return
+    if deleted:
+        _index.update(product.id)
+    else:
+        _index.update(
+            product.id,
+            FacetIndex.get_values(
+                product.category_id, product.price, product.weight, product.available
+            ),
+        )
+
+
+def get_filters(params, category=None):
+    """get_filters reads the selected facet values from the query string.
+
+    Only available products are listed unless available=all is given, which includes
+    the products out of stock. Unknown bands are ignored.
+
+    Args:
+        params (QueryDict): query string of the request
+        category (object, optional): Category selected by the url
+
+    Returns:
+        dict: selected value of each filtered facet
+
+    """
+    filters = {}
+    if params.get("available") != "all":
+        filters["available"] = True
+    if category is not None:
+        filters["category"] = category.id
+    for facet, bands in (("price", PRICE_BANDS), ("weight", WEIGHT_BANDS)):
+        label = params.get(facet)
+        if label in {band_label(band) for band in bands}:
+            filters[facet] = label
+    return filters
+
+
+def filter_products(queryset, filters):
+    """filter_products applies the selected price, weight and availability filters.
+
+    Price bands include their lower bound, weight bands their upper bound, like the
+    shipping tiers. The category is filtered by the view.
+
+    Args:
+        queryset (QuerySet): products to filter
+        filters (dict): selected value of each filtered facet, from get_filters()
+
+    Returns:
+        QuerySet: the filtered products
+
+    """
+    if "available" in filters:
+        queryset = queryset.filter(available=filters["available"])
+    if "price" in filters:
+        lower, upper = parse_band(filters["price"])
+        queryset = queryset.filter(price__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(price__lt=upper)
+    if "weight" in filters:
+        lower, upper = parse_band(filters["weight"])
+        if lower:
+            queryset = queryset.filter(weight__gt=lower)
+        if upper is not None:
+            queryset = queryset.filter(weight__lte=upper)
+    return queryset
+
+
+def describe(filters, params):
+    """describe lists the price, weight and availability facets for the template.
+
+    The availability facet offers in stock only, the default, and all products, whose
+    count adds the products out of stock to the available ones.
+
+    Args:
+        filters (dict): selected value of each filtered facet, from get_filters()
+        params (QueryDict): query string of the request, used to build the links
+
+    Returns:
+        tuple: list of facets, each with its name and values, and the counts of every
+            facet from FacetIndex.get_counts()
+
+    """
+    counts = get_index().get_counts(filters)
+    facets = []
+    for facet, values in (
+        ("price", [band_label(band) for band in PRICE_BANDS]),
+        ("weight", [band_label(band) for band in WEIGHT_BANDS]),
+        ("available", [True, "all"]),
+    ):
+        choices = []
+        for value in values:
+            query = params.copy()
+            query.pop("cursor", None)
+            selected = filters.get(facet, "all") == value
+            if facet == "available":
+                # in stock only is the default, it has no parameter
+                query.pop("available", None)
+                if value == "all":
+                    query["available"] = "all"
+            elif selected:
+                # choosing a selected value again removes the filter
+                query.pop(facet, None)
+            else:
+                query[facet] = value
+            choices.append(
+                {
+                    "value": value,
+                    "count": (
+                        sum(counts[facet].values())
+                        if value == "all"
+                        else counts[facet].get(value, 0)
+                    ),
+                    "selected": selected,
+                    "query": query.urlencode(),
+                }
+            )
+        facets.append({"name": facet, "values": choices})
+    return facets, counts
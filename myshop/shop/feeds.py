@@ -0,0 +1,264 @@
+"""sitemap and product feed files for the whole catalog, in every language.
+
+Available products are split into shards by ID range, SITEMAP_SHARD_SIZE product IDs
+per shard, so a shard never holds more than 50,000 urls, the limit of a sitemap, even
+with a url per language. For each shard, a sitemap file and a part of the product feed
+of each language are written to SITEMAP_ROOT. sitemap.xml is the sitemap index listing
+the shards, and feed-[code].xml is the Google Shopping feed of a language, joined from
+its parts.
+
+Products are streamed with .iterator() and their translations are loaded in bulk, one
+query per chunk. Urls are built from a template made once per language with reverse(),
+instead of calling get_absolute_url() for every product. The manifest keeps the number
+of products and the latest Product.updated of every shard, and generate() only writes
+the shards whose values changed, plus the index and the feeds.
+
+"""
+
+import json
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max
+from django.urls import reverse
+from django.utils import translation
+
+from .models import Product
+
+ProductTranslation = Product._parler_meta.root_model
+
+MANIFEST = "manifest.json"
+# placeholders given to reverse() to build the url template of product pages
+_ID_PLACEHOLDER = 987654321
+_SLUG_PLACEHOLDER = "slug-placeholder"
+
+
+def get_languages():
+    return [code for code, name in settings.LANGUAGES]
+
+
+def get_url_templates():
+    """get_url_templates returns the url of a product page in each language.
+
+    Returns:
+        dict: absolute url with {id} and {slug} fields, keyed by language code
+
+    """
+    templates = {}
+    for code in get_languages():
+        with translation.override(code):
+            url = reverse(
+                "shop:product_detail", args=[_ID_PLACEHOLDER, _SLUG_PLACEHOLDER]
+            )
+        url = url.replace(str(_ID_PLACEHOLDER), "{id}").replace(
+            _SLUG_PLACEHOLDER, "{slug}"
+        )
+        templates[code] = settings.SITE_URL + url
+    return templates
+
+
+def get_path(name):
+    return os.path.join(settings.SITEMAP_ROOT, name)
+
+
+def write_file(name, chunks):
+    """write_file writes the strings of chunks to a file, then moves it into place."""
+    partial = get_path(f".{name}.{os.getpid()}")
+    with open(partial, "w", encoding="utf-8") as output:
+        output.writelines(chunks)
+    os.replace(partial, get_path(name))
+
+
+def get_shard_stats():
+    """get_shard_stats counts the available products of every shard, in one query.
+
+    Returns:
+        dict: [count, latest update as ISO string] keyed by shard number as a string
+
+    """
+    rows = (
+        Product.objects.filter(available=True)
+        .annotate(shard=(F("id") - 1) / settings.SITEMAP_SHARD_SIZE)
+        .values("shard")
+        .annotate(count=Count("id"), updated=Max("updated"))
+        .order_by("shard")
+    )
+    return {
+        str(row["shard"]): [row["count"], row["updated"].isoformat()] for row in rows
+    }
+
+
+def iter_products(shard, chunk_size=2000):
+    """iter_products streams the available products of a shard with their translations.
+
+    Yields:
+        tuple: product values (id, price, image, updated) and a dict of (name, slug,
+            description) tuples keyed by language code
+
+    """
+    lower = shard * settings.SITEMAP_SHARD_SIZE
+    products = (
+        Product.objects.filter(
+            available=True, id__gt=lower, id__lte=lower + settings.SITEMAP_SHARD_SIZE
+        )
+        .order_by("id")
+        .values_list("id", "price", "image", "updated")
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for product in products:
+        chunk.append(product)
+        if len(chunk) == chunk_size:
+            yield from _translate(chunk)
+            chunk = []
+    if chunk:
+        yield from _translate(chunk)
+
+
+def _translate(chunk):
+    translated = {}
+    for product_id, code, *values in ProductTranslation.objects.filter(
+        master_id__in=[product[0] for product in chunk]
+    ).values_list("master_id", "language_code", "name", "slug", "description"):
+        translated.setdefault(product_id, {})[code] = values
+    for product in chunk:
+        yield product, translated.get(product[0], {})
+
+
+def render_sitemap(products, templates):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+        'xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+    )
+    for (product_id, price, image, updated), languages in products:
+        urls = {
+            code: templates[code].format(id=product_id, slug=values[1])
+            for code, values in languages.items()
+        }
+        # every language version links to the others
+        alternates = "".join(
+            f'<xhtml:link rel="alternate" hreflang="{code}" href={quoteattr(url)}/>'
+            for code, url in urls.items()
+        )
+        lastmod = updated.date().isoformat()
+        for url in urls.values():
+            yield (
+                f"<url><loc>{escape(url)}</loc><lastmod>{lastmod}</lastmod>"
+                f"{alternates}</url>\n"
+            )
+    yield "</urlset>\n"
+
+
+def render_feed_items(products, templates, language):
+    for (product_id, price, image, updated), languages in products:
+        values = languages.get(language)
+        if values is None:
+            continue
+        name, slug, description = values
+        link = templates[language].format(id=product_id, slug=slug)
+        image_link = (
+            f"<g:image_link>{escape(settings.SITE_URL + default_storage.url(image))}"
+            "</g:image_link>"
+            if image
+            else ""
+        )
+        yield (
+            f"<item><g:id>{product_id}</g:id><title>{escape(name)}</title>"
+            f"<description>{escape(description)}</description>"
+            f"<link>{escape(link)}</link>{image_link}"
+            f"<g:price>{price} USD</g:price>"
+            "<g:availability>in_stock</g:availability></item>\n"
+        )
+
+
+def write_shard(shard, templates):
+    """write_shard writes the sitemap and the feed parts of a shard.
+
+    The sitemap is written while the products are streamed. The feed parts of each
+    language are written from a second pass over the shard, so memory stays bounded.
+
+    """
+    write_file(f"sitemap-{shard}.xml", render_sitemap(iter_products(shard), templates))
+    for code in get_languages():
+        write_file(
+            f"feed-{code}-{shard}.part",
+            render_feed_items(iter_products(shard), templates, code),
+        )
+
+
+def write_index(shards):
+    lastmods = "".join(
+        f"<sitemap><loc>{escape(settings.SITE_URL)}/sitemaps/sitemap-{shard}.xml</loc>"
+        f"<lastmod>{updated}</lastmod></sitemap>\n"
+        for shard, (count, updated) in sorted(shards.items(), key=lambda s: int(s[0]))
+    )
+    write_file(
+        "sitemap.xml",
+        [
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+            lastmods,
+            "</sitemapindex>\n",
+        ],
+    )
+
+
+def write_feed(language, shards):
+    """write_feed joins the parts of the feed of a language into feed-[code].xml."""
+
+    def chunks():
+        yield (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>'
+            f"<title>West.East.Designs Shop</title><link>{escape(settings.SITE_URL)}"
+            f"/{language}/</link><description>Products</description>\n"
+        )
+        for shard in sorted(shards, key=int):
+            path = get_path(f"feed-{language}-{shard}.part")
+            with open(path, encoding="utf-8") as part:
+                yield from part
+        yield "</channel></rss>\n"
+
+    write_file(f"feed-{language}.xml", chunks())
+
+
+def generate(full=False):
+    """generate writes the sitemap files and the product feeds that are out of date.
+
+    Args:
+        full (bool, optional): whether every shard is written again. Defaults to False.
+
+    Returns:
+        tuple: number of shards written and total number of shards
+
+    """
+    os.makedirs(settings.SITEMAP_ROOT, exist_ok=True)
+    try:
+        with open(get_path(MANIFEST)) as manifest:
+            previous = json.load(manifest)
+    except FileNotFoundError:
+        previous = {}
+    shards = get_shard_stats()
+    templates = get_url_templates()
+    written = 0
+    for shard, stats in shards.items():
+        if full or previous.get(shard) != stats:
+            write_shard(int(shard), templates)
+            written += 1
+    # shards left without available products
+    for shard in previous.keys() - shards.keys():
+        for name in [f"sitemap-{shard}.xml"] + [
+            f"feed-{code}-{shard}.part" for code in get_languages()
+        ]:
+            try:
+                os.remove(get_path(name))
+            except FileNotFoundError:
+                pass
+    write_index(shards)
+    for code in get_languages():
+        write_feed(code, shards)
+    write_file(MANIFEST, [json.dumps(shards)])
+    return written, len(shards)
@@ -0,0 +1,186 @@
+"""resized and WebP variants of product images, served with srcset.
+
+Every uploaded :model:`shop.Product` image is resized to each of the widths in
+IMAGE_VARIANT_WIDTHS, never larger than the original, and saved as JPEG and WebP. The
+variants are content-addressed: they are stored under MEDIA_ROOT/variants/[digest]/,
+where digest is the SHA-256 of the original file, so the same picture uploaded twice is
+only processed once. The manifest, MEDIA_ROOT/variants/manifest.json, maps the name of
+each original image to its digest, size and variants. It is written by the Celery task
+in :mod:`shop.tasks` and the backfill_image_variants command, under a file lock, and
+read by the product_image template tag.
+
+render_variants() does not use Django, so it can run in the processes of a pool.
+
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = "variants"
+# format of each variant, by file extension
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def get_variants_root():
+    return Path(settings.MEDIA_ROOT) / VARIANTS_DIR
+
+
+def get_manifest_path():
+    return get_variants_root() / "manifest.json"
+
+
+def hash_file(path):
+    """hash_file returns the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render_variants(source, root, widths, quality):
+    """render_variants writes the variants of an image that do not exist yet.
+
+    Args:
+        source (Path): path of the original image
+        root (Path): directory of the variants
+        widths (list): widths of the variants, in pixels
+        quality (int): quality of the JPEG and WebP encoders
+
+    Returns:
+        dict: manifest entry of the image, with its digest, width, height and the
+            width, format and path of every variant, relative to root
+
+    """
+    digest = hash_file(source)
+    directory = Path(root) / digest
+    variants = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        # an image narrower than a width gets a single variant at its own width
+        for target in sorted({min(w, width) for w in widths}):
+            resized = None
+            for extension, image_format in FORMATS.items():
+                path = directory / f"{target}.{extension}"
+                if not path.exists():
+                    if resized is None:
+                        size = (target, max(1, round(height * target / width)))
+                        resized = image.resize(size, Image.Resampling.LANCZOS)
+                    directory.mkdir(parents=True, exist_ok=True)
+                    converted = resized
+                    if image_format == "JPEG" and resized.mode != "RGB":
+                        converted = resized.convert("RGB")
+                    # written next to the final file and renamed, so readers never
+                    # see a partial variant
+                    partial = path.with_name(f".{path.name}.{os.getpid()}")
+                    converted.save(partial, format=image_format, quality=quality)
+                    os.replace(partial, path)
+                variants.append(
+                    {
+                        "width": target,
+                        "format": extension,
+                        "path": f"{digest}/{target}.{extension}",
+                    }
+                )
+    return {"digest": digest, "width": width, "height": height, "variants": variants}
+
+
+# manifest of this process and the modification time of the file it was read from
+_manifest = {}
+_manifest_mtime = None
+_lock = threading.Lock()
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return {}
+
+
+def get_manifest():
+    """get_manifest returns the manifest, read again only when the file changed."""
+    global _manifest, _manifest_mtime
+    path = get_manifest_path()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if mtime != _manifest_mtime:
+        with _lock:
+            if mtime != _manifest_mtime:
+                _manifest = _read_manifest(path)
+                _manifest_mtime = mtime
+    return _manifest
+
+
+def update_manifest(entries):
+    """update_manifest adds or replaces entries of the manifest.
+
+    The file is locked while it is read and written, so concurrent workers do not lose
+    each other's entries, and replaced atomically, so readers never see a partial file.
+
+    Args:
+        entries (dict): manifest entries keyed by the name of the original image
+
+    """
+    path = get_manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = _read_manifest(path)
+        manifest.update(entries)
+        partial = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(partial, "w") as output:
+            json.dump(manifest, output, separators=(",", ":"))
+        os.replace(partial, path)
+
+
+def generate(name):
+    """generate creates the variants of an uploaded image and adds it to the manifest.
+
+    Args:
+        name (string): name of the image in the media storage, like product.image.name
+
+    Returns:
+        dict: manifest entry of the image
+
+    """
+    entry = render_variants(
+        Path(settings.MEDIA_ROOT) / name,
+        get_variants_root(),
+        settings.IMAGE_VARIANT_WIDTHS,
+        settings.IMAGE_VARIANT_QUALITY,
+    )
+    update_manifest({name: entry})
+    return entry
+
+
+def get_srcsets(name):
+    """get_srcsets builds the srcset of each format for an image.
+
+    Args:
+        name (string): name of the original image
+
+    Returns:
+        dict: srcset string keyed by format, empty if the image has no variants yet
+
+    """
+    entry = get_manifest().get(name)
+    if entry is None:
+        return {}
+    srcsets = {}
+    for variant in entry["variants"]:
+        url = default_storage.url(f"{VARIANTS_DIR}/{variant['path']}")
+        srcsets.setdefault(variant["format"], []).append(f"{url} {variant['width']}w")
+    return {image_format: ", ".join(urls) for image_format, urls in srcsets.items()}
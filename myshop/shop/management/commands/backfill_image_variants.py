@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shop import images
+from shop.cache import bump_product_version
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Creates the resized and WebP variants of existing product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes resizing images.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Process images already in the manifest as well.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        names = set(Product.objects.exclude(image="").values_list("image", flat=True))
+        if not options["all"]:
+            names -= images.get_manifest().keys()
+        entries = {}
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {
+                pool.submit(
+                    images.render_variants,
+                    Path(settings.MEDIA_ROOT) / name,
+                    images.get_variants_root(),
+                    settings.IMAGE_VARIANT_WIDTHS,
+                    settings.IMAGE_VARIANT_QUALITY,
+                ): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    entries[name] = future.result()
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    self.stderr.write(f"{name}: {e}")
+        # the manifest is written once, for every processed image
+        if entries:
+            images.update_manifest(entries)
+            # cached detail pages are rendered again with the variants
+            for product_id in Product.objects.filter(image__in=entries).values_list(
+                "id", flat=True
+            ):
+                bump_product_version(product_id)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(entries)} images processed, {failed} failed, "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
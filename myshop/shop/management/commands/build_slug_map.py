@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import slugs
+
+
+class Command(BaseCommand):
+    help = "Writes the slug of every product in every language to the shared cache."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = slugs.build()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} product slugs written in {time.perf_counter() - start:.2f}s"
+            )
+        )
@@ -0,0 +1,72 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from shop import recommendations
+from shop.cache import invalidate_products
+from shop.models import Category, Product
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        "Clears the products bought together, for every product or only for the "
+        "products of a category or the given products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--category", help="Slug of the category whose products are cleared."
+        )
+        parser.add_argument(
+            "--product",
+            type=int,
+            nargs="+",
+            default=[],
+            help="IDs of the products to clear.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        recommender = Recommender()
+
+        def progress(removed):
+            self.stdout.write(f"{removed} keys removed", ending="\r")
+
+        if not options["category"] and not options["product"]:
+            removed = recommender.clear_purchases(
+                batch_size=batch_size, progress=progress
+            )
+            recommendations.forget()
+        else:
+            removed = 0
+            for product_ids in self.get_product_batches(options, batch_size):
+                removed += recommender.clear_purchases(product_ids, batch_size)
+                recommendations.forget(product_ids)
+                invalidate_products(product_ids)
+                progress(removed)
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(f"{removed} keys removed"))
+
+    def get_product_batches(self, options, batch_size):
+        """get_product_batches streams the IDs of the products to clear, in batches."""
+        if options["product"]:
+            yield from (
+                options["product"][i : i + batch_size]
+                for i in range(0, len(options["product"]), batch_size)
+            )
+        if options["category"]:
+            category = (
+                Category.objects.filter(translations__slug=options["category"])
+                .values_list("id", flat=True)
+                .first()
+            )
+            if category is None:
+                raise CommandError(f"Unknown category {options['category']!r}.")
+            product_ids = (
+                Product.objects.filter(category_id=category)
+                .values_list("id", flat=True)
+                .iterator(chunk_size=batch_size)
+            )
+            while batch := list(islice(product_ids, batch_size)):
+                yield batch
@@ -0,0 +1,48 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop import catalog
+
+
+class Command(BaseCommand):
+    help = "Exports every product and its translations as a CSV or JSONL catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", help="File to write, or - to write to standard output."
+        )
+        parser.add_argument(
+            "--format",
+            choices=catalog.FORMATS,
+            help="Format of the catalog. Defaults to the extension of the file.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of products read at once.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1]
+        if file_format not in catalog.FORMATS:
+            raise CommandError("Unknown catalog format, use --format.")
+        rows = catalog.export_rows(chunk_size=options["chunk_size"])
+        start = time.perf_counter()
+        if path == "-":
+            count = catalog.write_rows(sys.stdout, rows, file_format)
+            # the summary must not end up in the exported catalog
+            out = self.stderr
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as stream:
+                count = catalog.write_rows(stream, rows, file_format)
+            out = self.stdout
+        elapsed = time.perf_counter() - start
+        out.write(
+            self.style.SUCCESS(
+                f"{count} products exported in {elapsed:.2f}s "
+                f"({count / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import feeds
+
+
+class Command(BaseCommand):
+    help = "Writes the sitemap shards and product feeds of products that changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Write every shard again, even if its products did not change.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written, total = feeds.generate(full=options["full"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{written} of {total} shards written "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
@@ -0,0 +1,63 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports products and their translations from a CSV or JSONL catalog, "
+        "updating the products whose slug already exists."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Catalog file, or - to read standard input.")
+        parser.add_argument(
+            "--format",
+            choices=catalog.FORMATS,
+            help="Format of the catalog. Defaults to the extension of the file.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows written in each transaction.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only validate the rows.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1]
+        if file_format not in catalog.FORMATS:
+            raise CommandError("Unknown catalog format, use --format.")
+        importer = catalog.CatalogImporter(
+            chunk_size=options["chunk_size"], dry_run=options["dry_run"]
+        )
+        start = time.perf_counter()
+        try:
+            if path == "-":
+                count = importer.run(catalog.read_rows(sys.stdin, file_format))
+            else:
+                with open(path, newline="", encoding="utf-8") as stream:
+                    count = importer.run(catalog.read_rows(stream, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read the catalog: {e}") from e
+        elapsed = time.perf_counter() - start
+        for number, message in importer.errors:
+            self.stderr.write(f"row {number}: {message}")
+        if importer.invalid > len(importer.errors):
+            self.stderr.write(
+                f"{importer.invalid - len(importer.errors)} more invalid rows"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} rows read, {importer.created} products created, "
+                f"{importer.updated} updated, {importer.invalid} invalid "
+                f"in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,83 @@
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from shop import recommendations
+from shop.recommender import Recommender
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the products bought together from the items of every paid order, "
+        "then materializes the suggestions. Orders paid while the sets are rebuilt "
+        "are added again once they are loaded, an order paid while the sets are "
+        "renamed may be counted twice. Reports the time and peak memory of each step, "
+        "and with --dry-run only counts, as a benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Order items counted at once.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=settings.RECOMMENDATIONS_SET_SIZE,
+            help="Products kept in the set of each product.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the co-purchases without writing to Redis.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from shop import copurchases
+        except ImportError as e:
+            raise CommandError(
+                f"numpy and scipy are required to rebuild recommendations: {e}"
+            ) from None
+
+        def progress(items):
+            self.stdout.write(f"{items} order items counted", ending="\r")
+
+        start = time.perf_counter()
+        # the rebuilt scores start a new decay epoch
+        epoch = time.time()
+        # the purchases of orders paid from now on are overwritten by load()
+        started = timezone.now()
+        counts = copurchases.count(
+            copurchases.iter_batches(options["batch_size"], updated_before=started),
+            copurchases.get_size(),
+            epoch,
+            progress,
+        )
+        self.stdout.write("")
+        self.report("Counted", start, f"{counts.nnz} pairs")
+        if options["dry_run"]:
+            return
+        start = time.perf_counter()
+        products = copurchases.load(counts, options["top"])
+        Recommender().set_epoch(epoch)
+        self.report("Loaded", start, f"{products} products")
+        start = time.perf_counter()
+        replayed = copurchases.replay(started, timezone.now())
+        self.report("Replayed", start, f"{replayed} orders paid during the rebuild")
+        start = time.perf_counter()
+        suggested = recommendations.materialize()
+        self.report("Materialized", start, f"{suggested} products")
+        self.stdout.write(self.style.SUCCESS("Recommendations rebuilt"))
+
+    def report(self, step, start, result):
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f"{step} {result} in {time.perf_counter() - start:.2f}s, "
+            f"peak memory {peak:.0f}MB"
+        )
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the product search index of every language from the database."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        indexes = search.rebuild()
+        for language, index in indexes.items():
+            self.stdout.write(f"{language}: {len(index)} products indexed")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Search index rebuilt in {time.perf_counter() - start:.2f}s"
+            )
+        )
@@ -0,0 +1,62 @@
+import statistics
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shop.recommender import Recommender
+
+# IDs of the synthetic products, far above the IDs of real products
+FIRST_ID = 10_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the latency of recording an order in the recommender, one ZINCRBY "
+        "round trip per pair against a single pipeline, on a scratch Redis database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[2, 5, 10, 20, 50])
+        parser.add_argument("--orders", type=int, default=50)
+        parser.add_argument(
+            "--db",
+            type=int,
+            default=15,
+            help="Redis database used for the benchmark, its keys are deleted after.",
+        )
+
+    def handle(self, *args, **options):
+        client = redis.Redis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=options["db"]
+        )
+        recommender = Recommender(client)
+        for size in options["sizes"]:
+            product_ids = list(range(FIRST_ID, FIRST_ID + size))
+            sequential = self.measure(
+                options["orders"], self.sequential, client, product_ids
+            )
+            pipelined = self.measure(
+                options["orders"], recommender.products_bought, product_ids
+            )
+            self.stdout.write(
+                f"{size} products: "
+                f"sequential p50 {statistics.median(sequential):.2f}ms, "
+                f"pipelined p50 {statistics.median(pipelined):.2f}ms"
+            )
+            client.delete(*[recommender.get_product_key(id) for id in product_ids])
+
+    def measure(self, orders, function, *args):
+        timings = []
+        for _ in range(orders):
+            start = time.perf_counter()
+            function(*args)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def sequential(self, client, product_ids):
+        # the previous implementation, one round trip per ordered pair
+        for product_id in product_ids:
+            for with_id in product_ids:
+                if product_id != with_id:
+                    client.zincrby(f"product:{product_id}:purchased_with", 1, with_id)
@@ -0,0 +1,53 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from shop.search import SearchIndex
+
+WORDS = {
+    "en": (
+        "shirt dress jacket coat scarf hat cotton linen wool silk blue red green black "
+        "white printed striped embroidered handmade vintage summer winter classic "
+        "oversized fitted organic soft light warm pocket button zipper collar"
+    ).split(),
+    "es": (
+        "camisa vestido chaqueta abrigo bufanda sombrero algodon lino lana seda azul "
+        "rojo verde negro blanco estampado rayas bordado artesanal clasico verano "
+        "invierno amplio ajustado organico suave ligero calido bolsillo boton cuello"
+    ).split(),
+}
+
+
+class Command(BaseCommand):
+    help = "Measures search latency on synthetic in-memory indexes of several sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000])
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--language", default="en", choices=sorted(WORDS))
+
+    def handle(self, *args, **options):
+        words = WORDS[options["language"]]
+        rng = random.Random(0)
+        for size in options["sizes"]:
+            index = SearchIndex(options["language"])
+            start = time.perf_counter()
+            for doc_id in range(size):
+                name = " ".join(rng.choices(words, k=3))
+                description = " ".join(rng.choices(words, k=30))
+                index.add(doc_id, name, description)
+            build = time.perf_counter() - start
+            timings = []
+            for _ in range(options["queries"]):
+                query = " ".join(rng.choices(words, k=rng.randint(1, 3)))
+                start = time.perf_counter()
+                index.search(query)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f"{size} products: built in {build:.1f}s, "
+                f"p50 {statistics.median(timings):.1f}ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.1f}ms, "
+                f"max {timings[-1]:.1f}ms"
+            )
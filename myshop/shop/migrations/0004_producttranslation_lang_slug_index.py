@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0003_product_weight"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="producttranslation",
+            index=models.Index(
+                fields=["language_code", "slug"], name="shop_product_lang_slug_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,51 @@
 from django.db import models
 from django.urls import reverse
+from django.utils.translation import get_language
+from parler.fields import TranslatedFieldDescriptor
 from parler.models import TranslatableModel, TranslatedFields
 
 
+class CachedTranslatedFieldDescriptor(TranslatedFieldDescriptor):
+    """CachedTranslatedFieldDescriptor reads a field from the translation cache if it can.
+
+    :func:`shop.translations.translate` attaches the translated fields to objects it
+    loaded for a language. Without them, or once another language is active, the field
+    comes from parler. Assignments go to parler as usual.
+
+    """
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self
+        cached = getattr(instance, "_cached_translation", None)
+        if cached is not None and cached[0] == get_language():
+            return cached[1][self.field.name]
+        meta = self.field.meta
+        try:
+            return super().__get__(instance, instance_type)
+        except meta.model.DoesNotExist:
+            if instance.pk is None:
+                return ""
+            # like safe_translation_getter(any_language=True)
+            translation = instance._get_any_translated_model(meta=meta)
+            return getattr(translation, self.field.name, "")
+
+
+def cache_translations(model):
+    """cache_translations makes name and slug of a model read the translation cache.
+
+    Parler adds its own descriptors while the model class is created, so they are
+    replaced afterwards.
+
+    """
+    for name in ("name", "slug"):
+        field = model.__dict__[name].field
+        setattr(model, name, CachedTranslatedFieldDescriptor(field))
+    return model
+
+
 # Defines the tables of data for the shop app
+@cache_translations
 class Category(TranslatableModel):
     """Category model stores a name and slug for the categories of Product.
 
@@ -32,14 +74,6 @@ class Category(TranslatableModel):
         verbose_name = "category"
         verbose_name_plural = "categories"
 
-    @property
-    def name(self) -> str:
-        return self.safe_translation_getter("name", any_language=True) or ""
-
-    @property
-    def slug(self) -> str:
-        return self.safe_translation_getter("slug", any_language=True) or ""
-
     def __str__(self):
         return self.name
 
@@ -47,12 +81,13 @@ class Category(TranslatableModel):
         return reverse("shop:product_list_by_category", args=[self.slug])
 
 
+@cache_translations
 class Product(TranslatableModel):
     """Product model stores data about the items or products in the shop app.
 
-    Products are indexed by id and slug fields together to optimize queries utilizing
-    both fields. Products are also indexed by name. There is another index for the created
-    field, which is defined in descending order of creation date and time.
+    Product translations are indexed by language and slug together, for lookups of a
+    slug in a given language. There is another index for the created field, which is
+    defined in descending order of creation date and time.
 
     Args:
         category (ForeignKey): connects :model:`shop.Category` to :model:`shop.Product`.
@@ -79,6 +114,14 @@ class Product(TranslatableModel):
         name=models.CharField(max_length=200),
         slug=models.SlugField(max_length=200),
         description=models.TextField(blank=True),
+        meta={
+            # urls and catalog imports look products up by slug in a language
+            "indexes": [
+                models.Index(
+                    fields=["language_code", "slug"], name="shop_product_lang_slug_idx"
+                ),
+            ],
+        },
     )
     category = models.ForeignKey(
         Category, related_name="products", on_delete=models.CASCADE
@@ -93,19 +136,10 @@ class Product(TranslatableModel):
     class Meta:
         # ordering = ["name"]
         indexes = [
-            # models.Index(fields=["id", "slug"]),
             # models.Index(fields=["name"]),
             models.Index(fields=["-created"]),
         ]
 
-    @property
-    def name(self) -> str:
-        return self.safe_translation_getter("name", any_language=True) or ""
-
-    @property
-    def slug(self) -> str:
-        return self.safe_translation_getter("slug", any_language=True) or ""
-
     def __str__(self):
         return self.name
 
@@ -0,0 +1,80 @@
+"""keyset (cursor) pagination for the product catalog.
+
+Products are listed newest first, ordered by created and then id, which follows the
+index on -created. A page is fetched with a WHERE clause on the last product of the
+previous page instead of an OFFSET, so every page costs the same no matter how deep it
+is. The cursor is an opaque, url-safe string built from the created and id values of
+that product.
+
+"""
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+ORDERING = ["-created", "-id"]
+
+
+def encode_cursor(product):
+    """encode_cursor builds the cursor pointing after the given product.
+
+    Args:
+        product (object): last Product of a page
+
+    Returns:
+        string: url-safe cursor
+
+    """
+    value = f"{product.created.isoformat()}|{product.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """decode_cursor reads the created and id values from a cursor.
+
+    Args:
+        cursor (string): cursor built by encode_cursor()
+
+    Returns:
+        tuple: (created, id) or None if the cursor is missing or invalid
+
+    """
+    if not cursor:
+        return None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(cursor + padding).decode()
+        created, id = value.split("|")
+        return datetime.fromisoformat(created), int(id)
+    except ValueError:
+        return None
+
+
+def paginate(queryset, cursor=None, page_size=24):
+    """paginate returns one page of products after the given cursor.
+
+    One extra row is fetched to know whether there is a next page, so a page costs a
+    single query and holds at most page_size + 1 products in memory.
+
+    Args:
+        queryset (QuerySet): products to paginate
+        cursor (string, optional): cursor of the page to return. Defaults to the first.
+        page_size (int, optional): number of products per page. Defaults to 24.
+
+    Returns:
+        tuple: list of products of the page, and the cursor of the next page or None
+
+    """
+    queryset = queryset.order_by(*ORDERING)
+    position = decode_cursor(cursor)
+    if position is not None:
+        created, id = position
+        queryset = queryset.filter(
+            Q(created__lt=created) | Q(created=created, id__lt=id)
+        )
+    products = list(queryset[: page_size + 1])
+    if len(products) > page_size:
+        products = products[:page_size]
+        return products, encode_cursor(products[-1])
+    return products, None
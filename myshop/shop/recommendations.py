@@ -0,0 +1,311 @@
+"""materialized top-K recommendations, served from a per-process LRU cache.
+
+The materialize_recommendations Celery task runs materialize() periodically. It reads
+the best RECOMMENDATIONS_TOP_K products bought with every product from the sorted sets
+of :class:`shop.Recommender`, with pipelined ZREVRANGE calls, and writes them to a
+single Redis hash, recommendations:top, as "id:score,id:score" strings. The new hash is
+written under a temporary name and renamed into place, then recommendations:version is
+incremented.
+
+suggest() reads that hash through an LRU cache of this process, which holds the top
+list of each product and the summary of each suggested product in each language. A
+summary has what the templates show, so a hit needs neither Redis nor the database.
+The cache is cleared when the recommendations version or the catalog version changes,
+checked at most every RECOMMENDATIONS_VERSION_CHECK seconds. While Redis is unavailable,
+the cached entries keep being served and products that are not cached get no
+suggestions.
+
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+
+import redis
+from django.conf import settings
+from django.utils.translation import get_language
+
+from .cache import get_catalog_version
+from .models import Product
+from .recommender import Recommender
+from .redis_pool import breaker, get_redis
+from .translations import translate
+
+logger = logging.getLogger(__name__)
+
+TOP_KEY = "recommendations:top"
+VERSION_KEY = "recommendations:version"
+
+
+@dataclass(frozen=True, slots=True)
+class ProductSummary:
+    """:class:`shop.ProductSummary` holds what templates show of a suggested product.
+
+    Args:
+        id (int): ID of the product
+        name (string): translated name
+        url (string): url of the product page in the language
+        image (string): name of the image in the media storage, empty if none
+
+    """
+
+    id: int
+    name: str
+    url: str
+    image: str
+
+    def get_absolute_url(self):
+        return self.url
+
+
+class LRUCache:
+    """:class:`shop.LRUCache` is a thread-safe LRU cache that counts its hits.
+
+    Args:
+        maxsize (int): number of entries kept, the least recently used go first
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """get_many returns the cached entries of the keys found and counts the rest."""
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, entries):
+        with self.lock:
+            for key, value in entries.items():
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """get_stats returns the size, hits, misses and hit rate of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = LRUCache(settings.RECOMMENDATIONS_LRU_SIZE)
+# versions the entries of _cache were read at, and when they were last checked
+_versions = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_stats():
+    """get_stats returns the statistics of the LRU cache of this process."""
+    return _cache.get_stats()
+
+
+def get_version():
+    """get_version returns the version of the materialized suggestions.
+
+    It is part of the key of cached pages showing suggestions, and is read from Redis
+    at most every RECOMMENDATIONS_VERSION_CHECK seconds.
+
+    Returns:
+        int: version, 0 before the first materialization or if Redis was unavailable
+
+    """
+    _check_versions()
+    return int(_versions[0] or 0) if _versions else 0
+
+
+def _check_versions():
+    global _versions, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < settings.RECOMMENDATIONS_VERSION_CHECK:
+        return
+    with _lock:
+        if now - _checked_at < settings.RECOMMENDATIONS_VERSION_CHECK:
+            return
+        _checked_at = now
+        try:
+            version = breaker.call(get_redis().get, VERSION_KEY)
+        except redis.RedisError:
+            # keep serving the cached entries, checked again after the interval
+            return
+        versions = (version, get_catalog_version())
+        if versions != _versions:
+            if _versions is not None:
+                logger.info(f"Recommendations changed, cache cleared: {get_stats()}")
+            _cache.clear()
+            _versions = versions
+
+
+def encode(suggestions):
+    return ",".join(f"{int(member)}:{score:g}" for member, score in suggestions)
+
+
+def decode(value):
+    if not value:
+        return []
+    pairs = (item.split(":") for item in value.decode().split(","))
+    return [(int(product_id), float(score)) for product_id, score in pairs]
+
+
+def materialize(top_k=None, batch_size=500):
+    """materialize writes the top suggestions of every product to the Redis hash.
+
+    Args:
+        top_k (int, optional): suggestions kept per product. Defaults to
+            RECOMMENDATIONS_TOP_K.
+        batch_size (int, optional): products read per pipeline. Defaults to 500.
+
+    Returns:
+        int: number of products with suggestions
+
+    """
+    top_k = top_k or settings.RECOMMENDATIONS_TOP_K
+    r = get_redis()
+    recommender = Recommender(r)
+    tmp_key = f"{TOP_KEY}:{uuid.uuid4().hex}"
+    count = 0
+    product_ids = Product.objects.values_list("id", flat=True).iterator(
+        chunk_size=batch_size
+    )
+    while batch := list(islice(product_ids, batch_size)):
+        with r.pipeline(transaction=False) as pipe:
+            for product_id in batch:
+                pipe.zrevrange(
+                    recommender.get_product_key(product_id),
+                    0,
+                    top_k - 1,
+                    withscores=True,
+                )
+            results = pipe.execute()
+        mapping = {
+            product_id: encode(suggestions)
+            for product_id, suggestions in zip(batch, results)
+            if suggestions
+        }
+        if mapping:
+            r.hset(tmp_key, mapping=mapping)
+            count += len(mapping)
+    with r.pipeline(transaction=True) as pipe:
+        if count:
+            pipe.rename(tmp_key, TOP_KEY)
+        else:
+            pipe.delete(TOP_KEY)
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+    return count
+
+
+def forget(product_ids=None):
+    """forget removes materialized suggestions, of every product or of some of them.
+
+    The version is incremented, so every process clears its cache.
+
+    Args:
+        product_ids (list, optional): IDs of the products. Defaults to None, every one.
+
+    """
+    r = get_redis()
+    with r.pipeline(transaction=True) as pipe:
+        if product_ids is None:
+            pipe.unlink(TOP_KEY)
+        else:
+            pipe.hdel(TOP_KEY, *product_ids)
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+
+
+def _get_top(product_ids):
+    cached = _cache.get_many([("top", product_id) for product_id in product_ids])
+    top = {key[1]: value for key, value in cached.items()}
+    missing = [product_id for product_id in product_ids if product_id not in top]
+    if missing:
+        try:
+            values = breaker.call(get_redis().hmget, TOP_KEY, missing)
+        except redis.RedisError as e:
+            logger.warning(f"Suggestions not loaded, Redis is unavailable: {e}")
+            return top
+        loaded = {
+            product_id: decode(value) for product_id, value in zip(missing, values)
+        }
+        _cache.set_many(
+            {("top", product_id): value for product_id, value in loaded.items()}
+        )
+        top.update(loaded)
+    return top
+
+
+def _get_summaries(product_ids, language):
+    cached = _cache.get_many([("summary", language, id) for id in product_ids])
+    summaries = {key[2]: value for key, value in cached.items()}
+    missing = [product_id for product_id in product_ids if product_id not in summaries]
+    if missing:
+        products = translate(
+            Product.objects.filter(id__in=missing, available=True), language
+        )
+        loaded = {
+            product.id: ProductSummary(
+                product.id, product.name, product.get_absolute_url(), product.image.name
+            )
+            for product in products
+        }
+        # products that are gone or unavailable are cached as None
+        _cache.set_many({("summary", language, id): loaded.get(id) for id in missing})
+        summaries.update(loaded)
+    return summaries
+
+
+def suggest(products, max_results=6):
+    """suggest returns the products most often bought with the given products.
+
+    The scores of the top lists of the given products are added up, which matches
+    Recommender.suggest_products_for() for the products in those lists.
+
+    Args:
+        products (list): Product objects to get recommendations for
+        max_results (int, optional): maximum number of suggestions. Defaults to 6.
+
+    Returns:
+        list: ProductSummary objects, best suggestion first
+
+    """
+    _check_versions()
+    product_ids = list(dict.fromkeys(p.id for p in products))
+    scores = {}
+    for suggestions in _get_top(product_ids).values():
+        for product_id, score in suggestions:
+            scores[product_id] = scores.get(product_id, 0) + score
+    for product_id in product_ids:
+        scores.pop(product_id, None)
+    ranked = sorted(scores, key=lambda product_id: -scores[product_id])
+    # a few extra candidates stand in for unavailable products
+    candidates = ranked[: max_results * 2]
+    summaries = _get_summaries(candidates, get_language())
+    return [
+        summaries[product_id]
+        for product_id in candidates
+        if summaries.get(product_id) is not None
+    ][:max_results]
@@ -1,24 +1,59 @@
+import logging
+import time
+import uuid
+from itertools import islice
+
 import redis
 from django.conf import settings
 
+from .cache import invalidate_products
 from .models import Product
+from .redis_pool import breaker, get_redis
+from .translations import translate
+
+logger = logging.getLogger(__name__)
+
+# time at which an increment weighs its nominal value, see Recommender.get_weight
+EPOCH_KEY = "recommendations:epoch"
 
-# connect to redis
-r = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-)
+# combines the sorted sets of several products and returns the best suggestions.
+# KEYS: the temporary key, then the sorted set of each product.
+# ARGV: the maximum number of results, then the IDs of the products.
+SUGGEST_SCRIPT = """
+redis.call("ZUNIONSTORE", KEYS[1], #KEYS - 1, unpack(KEYS, 2))
+redis.call("ZREM", KEYS[1], unpack(ARGV, 2))
+local suggestions = redis.call("ZREVRANGE", KEYS[1], 0, tonumber(ARGV[1]) - 1)
+redis.call("DEL", KEYS[1])
+return suggestions
+"""
 
 
 class Recommender:
     """:class:`shop.Recommender` allows product purchase tracking & retrieves suggestions.
 
     Recommender class allows product purchases to be stored and will retrieve product
-    suggestions for a given product or products.
+    suggestions for a given product or products. Calls to Redis go through the circuit
+    breaker of :mod:`shop.redis_pool`.
+
+    Scores decay exponentially, halving every RECOMMENDATIONS_HALF_LIFE seconds. Instead
+    of lowering every score over time, each new increment is multiplied by a factor
+    that doubles every half-life, counted from the epoch stored in Redis, so recent
+    purchases outweigh old ones and an update stays a single ZINCRBY. compact() divides
+    every score by the factor and moves the epoch to now once the factor grows past
+    RECOMMENDATIONS_RENORMALIZE_FACTOR, and trims each set to its best
+    RECOMMENDATIONS_SET_SIZE products.
+
+    Args:
+        redis_client (Redis, optional): client to use instead of the shared one
 
     """
 
+    def __init__(self, redis_client=None):
+        self.redis = redis_client or get_redis()
+        # sent once, then run with EVALSHA
+        self.suggest_script = self.redis.register_script(SUGGEST_SCRIPT)
+        self.epoch = None
+
     def get_product_key(self, id):
         """get_product_key builds the Redis key for sorted set of related products.
 
@@ -35,45 +70,117 @@ class Recommender:
         """
         return f"product:{id}:purchased_with"
 
-    def products_bought(self, products):
+    def get_epoch(self):
+        """get_epoch returns the epoch of the scores, read from Redis once per instance.
+
+        The epoch is set to the current time if there is none yet.
+
+        Returns:
+            float: UNIX time at which an increment weighs its nominal value
+
+        """
+        if self.epoch is None:
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(EPOCH_KEY, time.time(), nx=True)
+                pipe.get(EPOCH_KEY)
+                self.epoch = float(breaker.call(pipe.execute)[1])
+        return self.epoch
+
+    def set_epoch(self, epoch):
+        breaker.call(self.redis.set, EPOCH_KEY, epoch)
+        self.epoch = epoch
+
+    def scan_product_keys(self, batch_size=500):
+        """scan_product_keys yields the key of every product set, found with SCAN.
+
+        Each SCAN call goes through the circuit breaker.
+
+        Args:
+            batch_size (int, optional): keys asked for per SCAN call. Defaults to 500.
+
+        Yields:
+            bytes: product:[id]:purchased_with keys
+
+        """
+        cursor = None
+        while cursor != 0:
+            cursor, keys = breaker.call(
+                self.redis.scan,
+                cursor or 0,
+                match=self.get_product_key("*"),
+                count=batch_size,
+            )
+            yield from keys
+
+    def get_weight(self, at=None):
+        """get_weight returns the factor applied to increments made at a given time.
+
+        Args:
+            at (float, optional): UNIX time. Defaults to now.
+
+        Returns:
+            float: 2 raised to the number of half-lives elapsed since the epoch
+
+        """
+        at = time.time() if at is None else at
+        return 2 ** ((at - self.get_epoch()) / settings.RECOMMENDATIONS_HALF_LIFE)
+
+    def products_bought(self, products, quantities=None):
         """products_bought receives a list of Product objects that were bought together.
 
-        This method receives a list of Product objects that have been bought together
-        (these belong to the same order).
+        This method receives a list of Product objects, or their IDs, that have been
+        bought together (these belong to the same order). A product listed more than
+        once counts once. For every ordered pair of different products, the score of
+        the second one in the sorted set of the first one is incremented, by 1, or by
+        the quantity of the second product if quantities are given, times the decay
+        factor of get_weight(). All the ZINCRBY
+        commands are sent in a single pipeline, one round trip whatever the size of the
+        order. The versions of the products are changed, so their cached detail pages
+        show the new recommendations.
 
         Args:
-            products (list): Product objects that have been bought together (same order)
+            products (list): Product objects or IDs bought together (same order)
+            quantities (dict, optional): quantity bought of each product ID. Defaults to
+                None, every product then weighs 1.
+
+        Raises:
+            redis.RedisError: if Redis is unavailable, the caller can retry later
 
         """
-        product_ids = [p.id for p in products]
-        for product_id in product_ids:
-            for with_id in product_ids:
-                # get the other products bought with each product
-                if product_id != with_id:
-                    # increment score for product purchased together
-                    r.zincrby(self.get_product_key(product_id), 1, with_id)
+        # dict.fromkeys drops duplicates and keeps the order of the products
+        product_ids = list(dict.fromkeys(getattr(p, "id", p) for p in products))
+        if len(product_ids) < 2:
+            return
+        factor = self.get_weight()
+        with self.redis.pipeline(transaction=False) as pipe:
+            for product_id in product_ids:
+                key = self.get_product_key(product_id)
+                for with_id in product_ids:
+                    # get the other products bought with each product
+                    if product_id != with_id:
+                        # increment score for product purchased together
+                        weight = quantities.get(with_id, 1) if quantities else 1
+                        pipe.zincrby(key, weight * factor, with_id)
+            breaker.call(pipe.execute)
+        invalidate_products(product_ids)
 
     def suggest_products_for(self, products, max_results=6):
         """suggest_products_for retrieves products bought together for a given product list.
 
-        This method receives products and max_results as parameters. It performs several
-        actions. It gets the product IDs for the given Product objects. If only one
-        product is given, it retrieves the ID of the products bought together with the
-        given product, ordered by the total number of times they were bought together.
-        To do so, it uses Redis' ZRANGE command. The max_results attribute limits the
-        number of results specified to 6 by default. If more than one product is given,
-        a temporary Redis key built with the IDs of the products is generated. It combines
-        and sums all scores for the items contained in the sorted set of each of the
-        given products, using the Redis ZUNIONSTORE command. This performs a union of
-        the sorted sets with the given keys and stores the aggregated sum of scores of
-        the elements in a new Redis key. The aggregated scores are saved in the temporary
-        key. ZREM removes the same products it is getting recommendations for from the
-        generated sorted set. IDs of products are retrieved from the temporary key,
-        ordered by their scores using the ZRANGE command. The results are limited by the
-        max_results attribute. The temporary key is removed using the redis-py delete()
-        method that executes the Redis DEL command. Finally, the Product objects with
-        the given IDs are retrieved, and the products are ordered in the same order as
-        the members of the sorted set.
+        This method receives products and max_results as parameters. It gets the
+        product IDs for the given Product objects. If only one product is given, it
+        retrieves the IDs of the max_results products bought together with the given
+        product, ordered by the total number of times they were bought together, with a
+        bounded ZRANGE. If more than one product is given, SUGGEST_SCRIPT runs on the
+        Redis server as a single atomic call. It combines and sums the scores of the
+        sorted sets of the given products into a temporary key with ZUNIONSTORE, removes
+        the given products with ZREM, reads the best max_results IDs and deletes the
+        temporary key. The temporary key is a random UUID, so concurrent calls never
+        share it. Finally, the Product objects with the given IDs are retrieved, and the
+        products are ordered in the same order as the members of the sorted set, with
+        their names read from the translation cache. If Redis fails or the circuit
+        breaker is open, no suggestions are returned. Pages show the materialized
+        suggestions of :mod:`shop.recommendations` instead, this reads the live sets.
 
         Args:
             products (list): list of Product objects to get recommendations for. It can
@@ -85,33 +192,109 @@ class Recommender:
             list: suggested_products are sorted by appearance
 
         """
-        product_ids = [p.id for p in products]
-        if len(products) == 1:
-            # only 1 product
-            suggestions = r.zrange(
-                self.get_product_key(product_ids[0]), 0, -1, desc=True
-            )[:max_results]
-        else:
-            # generate a temporary key
-            flat_ids = "".join([str(id) for id in product_ids])
-            tmp_key = f"tmp_{flat_ids}"
-            # multiple products, combine scores of all products
-            # store the resulting sorted set in a temporary key
-            keys = [self.get_product_key(id) for id in product_ids]
-            r.zunionstore(tmp_key, keys)
-            # remove ids for the products the recommendation is for
-            r.zrem(tmp_key, *product_ids)
-            # get the product ids by their score, descendant sort
-            suggestions = r.zrange(tmp_key, 0, -1, desc=True)[:max_results]
-            # remove the temporary key
-            r.delete(tmp_key)
-        suggested_products_ids = [int(id) for id in suggestions]
+        product_ids = list(dict.fromkeys(p.id for p in products))
+        if not product_ids or max_results <= 0:
+            return []
+        try:
+            if len(product_ids) == 1:
+                # only 1 product
+                suggestions = breaker.call(
+                    self.redis.zrange,
+                    self.get_product_key(product_ids[0]),
+                    0,
+                    max_results - 1,
+                    desc=True,
+                )
+            else:
+                # multiple products, combine scores of all products on the server
+                tmp_key = f"tmp:suggest:{uuid.uuid4().hex}"
+                keys = [self.get_product_key(id) for id in product_ids]
+                suggestions = breaker.call(
+                    self.suggest_script,
+                    keys=[tmp_key, *keys],
+                    args=[max_results, *product_ids],
+                )
+        except redis.RedisError as e:
+            # recommendations are left out of the page while Redis is unavailable
+            logger.warning(f"No suggestions, Redis is unavailable: {e}")
+            return []
+        # position of each suggested product in the sorted set
+        positions = {int(id): position for position, id in enumerate(suggestions)}
         # get suggested products and sort by order of appearance
-        suggested_products = list(Product.objects.filter(id__in=suggested_products_ids))
-        suggested_products.sort(key=lambda x: suggested_products_ids.index(x.id))
+        suggested_products = translate(Product.objects.filter(id__in=positions))
+        suggested_products.sort(key=lambda x: positions[x.id])
         return suggested_products
 
-    def clear_purchases(self):
-        """clear_purchases method clears the recommendations."""
-        for id in Product.objects.values_list("id", flat=True):
-            r.delete(self.get_product_key(id))
+    def clear_purchases(self, product_ids=None, batch_size=500, progress=None):
+        """clear_purchases method clears the recommendations.
+
+        Without product_ids, every product:[id]:purchased_with key is found with SCAN,
+        including the keys of products deleted from the catalog, so the catalog is not
+        read at all. With product_ids, only the keys of those products are cleared.
+        Keys are removed with UNLINK, which frees memory in the background instead of
+        blocking Redis, batch_size keys per pipeline.
+
+        Args:
+            product_ids (iterable, optional): IDs of the products to clear, streamed.
+                Defaults to None, every product.
+            batch_size (int, optional): keys removed per pipeline. Defaults to 500.
+            progress (callable, optional): called with the number of keys removed so
+                far after each batch
+
+        Returns:
+            int: number of keys removed
+
+        """
+        if product_ids is None:
+            keys = self.scan_product_keys(batch_size)
+        else:
+            keys = (self.get_product_key(id) for id in product_ids)
+        removed = 0
+        while batch := list(islice(keys, batch_size)):
+            with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.unlink(key)
+                removed += sum(breaker.call(pipe.execute))
+            if progress is not None:
+                progress(removed)
+        return removed
+
+    def compact(self, top_n=None, batch_size=500):
+        """compact trims every sorted set and renormalizes the scores when needed.
+
+        Keys are found with SCAN and each batch is handled in one pipeline. Members
+        beyond the best top_n of a set are removed with ZREMRANGEBYRANK. If the decay
+        factor has reached RECOMMENDATIONS_RENORMALIZE_FACTOR, every score is divided by
+        it first, with a single-key ZUNIONSTORE, and the epoch is moved to now once all
+        the sets are done. Purchases recorded during that pass can be off by at most
+        the factor, which is why it is kept small.
+
+        Args:
+            top_n (int, optional): products kept in each set. Defaults to
+                RECOMMENDATIONS_SET_SIZE.
+            batch_size (int, optional): keys handled per pipeline. Defaults to 500.
+
+        Returns:
+            tuple: number of sets and number of members removed
+
+        """
+        top_n = top_n or settings.RECOMMENDATIONS_SET_SIZE
+        now = time.time()
+        factor = self.get_weight(now)
+        renormalize = factor >= settings.RECOMMENDATIONS_RENORMALIZE_FACTOR
+        keys = self.scan_product_keys(batch_size)
+        sets = removed = 0
+        while batch := list(islice(keys, batch_size)):
+            with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    if renormalize:
+                        pipe.zunionstore(key, {key: 1 / factor})
+                    pipe.zremrangebyrank(key, 0, -top_n - 1)
+                results = breaker.call(pipe.execute)
+            sets += len(batch)
+            # the ZUNIONSTORE results are the sizes of the sets, not removals
+            removed += sum(results[1::2] if renormalize else results)
+        if renormalize:
+            self.set_epoch(now)
+            logger.info(f"Recommendation scores divided by {factor:g}")
+        return sets, removed
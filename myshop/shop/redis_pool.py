@@ -0,0 +1,147 @@
+"""shared Redis client of the shop, with timeouts and a circuit breaker.
+
+get_redis() returns a client backed by a single connection pool per process, created
+the first time it is needed instead of at import time. Connections time out after
+REDIS_CONNECT_TIMEOUT seconds and commands after REDIS_SOCKET_TIMEOUT seconds, so a slow
+or unreachable Redis delays a request by a bounded amount.
+
+The breaker protects optional features, such as recommendations, that can be left out
+of a page. After REDIS_BREAKER_THRESHOLD consecutive failures it opens, and calls fail
+immediately with CircuitOpenError for REDIS_BREAKER_RESET seconds. A single trial call
+is then let through: if it succeeds the breaker closes again, otherwise it stays open
+for another period.
+
+"""
+
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """get_redis returns the shared Redis client, creating its pool on first use."""
+    global _pool, _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _pool = redis.ConnectionPool(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30,
+                )
+                _client = redis.Redis(connection_pool=_pool)
+    return _client
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """CircuitOpenError is raised instead of calling Redis while the breaker is open."""
+
+
+class CircuitBreaker:
+    """:class:`shop.CircuitBreaker` stops calling Redis after repeated failures.
+
+    Args:
+        threshold (int): consecutive failures that open the breaker
+        reset_timeout (float): seconds the breaker stays open before a trial call
+
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+        # counters reported by get_metrics()
+        self.calls = 0
+        self.failed_calls = 0
+        self.rejected_calls = 0
+        self.times_opened = 0
+
+    def _before_call(self):
+        with self.lock:
+            self.calls += 1
+            if self.state == self.CLOSED:
+                return
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                # let a single trial call through
+                self.state = self.HALF_OPEN
+                return
+            self.rejected_calls += 1
+            raise CircuitOpenError("Redis circuit breaker is open")
+
+    def _on_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("Redis circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def _on_failure(self):
+        with self.lock:
+            self.failed_calls += 1
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning(
+                        f"Redis circuit breaker opened after {self.failures} failures"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, function, *args, **kwargs):
+        """call runs function, which uses Redis, through the breaker.
+
+        Raises:
+            CircuitOpenError: if the breaker is open
+            redis.RedisError: if the call failed
+
+        Returns:
+            object: the result of function
+
+        """
+        self._before_call()
+        try:
+            result = function(*args, **kwargs)
+        except redis.RedisError:
+            self._on_failure()
+            raise
+        self._on_success()
+        return result
+
+    def get_metrics(self):
+        """get_metrics returns the state and counters of the breaker."""
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "calls": self.calls,
+                "failed_calls": self.failed_calls,
+                "rejected_calls": self.rejected_calls,
+                "times_opened": self.times_opened,
+            }
+
+
+breaker = CircuitBreaker(settings.REDIS_BREAKER_THRESHOLD, settings.REDIS_BREAKER_RESET)
@@ -0,0 +1,381 @@
+"""in-process full-text search over the translated names and descriptions of products.
+
+Each language has its own inverted index, mapping stemmed terms to the products that
+contain them with their term frequency. Text is lower-cased, accents are removed, stop
+words are dropped and words are reduced with a light suffix stemmer for English or
+Spanish. Results are ranked with BM25, names counting NAME_BOOST times as much as
+descriptions.
+
+The index of a language is built the first time it is searched, from the snapshot
+written by the rebuild_search_index management command if there is one, otherwise
+from the database. The receivers in :mod:`shop.signals` apply product and translation
+changes to the indexes of the current process right away, and queue the
+rebuild_search_index task, once per SEARCH_REBUILD_DELAY seconds. Other processes
+reload the snapshot when the search version in the shared cache changes, which
+happens every time the index is rebuilt, so they see a change after that delay.
+
+"""
+
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .cache import bump_version, get_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_VERSION_KEY = "shop:search_version"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# the name of a product counts as many times as this in its text
+NAME_BOOST = 3
+
+STOP_WORDS = {
+    "en": set(
+        "a an and are as at be but by for from has have in is it its of on or that "
+        "the this to was were will with".split()
+    ),
+    "es": set(
+        "a al como con de del el en es esta este la las lo los o para pero por que "
+        "se sin su sus un una uno unos unas y".split()
+    ),
+}
+
+# suffixes removed by stem(), longest first, except that English words ending in -ss
+# keep it. Accents are removed before stemming.
+SUFFIXES = {
+    "en": [
+        "ingly",
+        "edly",
+        "sses",
+        "ss",
+        "ness",
+        "ment",
+        "ing",
+        "ies",
+        "ied",
+        "ed",
+        "es",
+        "ly",
+        "s",
+    ],
+    "es": [
+        "amientos",
+        "imientos",
+        "amiento",
+        "imiento",
+        "aciones",
+        "iciones",
+        "acion",
+        "icion",
+        "mente",
+        "idades",
+        "idad",
+        "istas",
+        "ista",
+        "osos",
+        "osas",
+        "oso",
+        "osa",
+        "ces",
+        "es",
+        "as",
+        "os",
+        "a",
+        "o",
+        "e",
+        "s",
+    ],
+}
+# shortest stem left by stem()
+MIN_STEM = 3
+
+_word_re = re.compile(r"\w+")
+
+
+def stem(word, language):
+    """stem removes the first matching suffix of the language from the word.
+
+    In English, -sses becomes -ss and a final -ss is kept, so "dress" and "dresses"
+    share a stem. A final "e" left after that is dropped, so "shoe" and "shoes", or
+    "table" and "tables", share one too.
+
+    """
+    stemmed = word
+    for suffix in SUFFIXES.get(language, ()):
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            if language == "en" and suffix in ("ies", "ied"):
+                stemmed = word[: -len(suffix)] + "y"
+            elif language == "en" and suffix in ("sses", "ss"):
+                stemmed = word[: -len(suffix)] + "ss"
+            elif language == "es" and suffix == "ces":
+                stemmed = word[: -len(suffix)] + "z"
+            else:
+                stemmed = word[: -len(suffix)]
+            break
+    if language == "en" and stemmed.endswith("e") and len(stemmed) > MIN_STEM:
+        stemmed = stemmed[:-1]
+    return stemmed
+
+
+def tokenize(text, language):
+    """tokenize splits text into the stemmed terms of the given language.
+
+    Args:
+        text (string): text to tokenize
+        language (string): code of the language of the text
+
+    Returns:
+        list: terms of the text, in order
+
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    stop_words = STOP_WORDS.get(language, set())
+    return [
+        stem(word, language)
+        for word in _word_re.findall(text)
+        if word not in stop_words
+    ]
+
+
+class SearchIndex:
+    """:class:`shop.SearchIndex` is the inverted index of a single language.
+
+    Documents are products, identified by their ID. The terms of each document are kept
+    as well, so a document can be removed or replaced without scanning the index.
+
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.lengths = {}
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def add(self, doc_id, name, description=""):
+        """add indexes a product, replacing it if it was already indexed.
+
+        Args:
+            doc_id (int): ID of the product
+            name (string): translated name of the product
+            description (string, optional): translated description of the product
+
+        """
+        terms = Counter(tokenize(description, self.language))
+        for term in tokenize(name, self.language):
+            terms[term] += NAME_BOOST
+        with self.lock:
+            self._remove(doc_id)
+            for term, frequency in terms.items():
+                self.postings[term][doc_id] = frequency
+            self.documents[doc_id] = terms
+            self.lengths[doc_id] = sum(terms.values())
+            self.total_length += self.lengths[doc_id]
+
+    def remove(self, doc_id):
+        """remove drops a product from the index, if it is indexed."""
+        with self.lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self.documents.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def search(self, query, limit=20):
+        """search returns the IDs of the products that best match the query.
+
+        Args:
+            query (string): text entered by the user
+            limit (int, optional): maximum number of results. Defaults to 20.
+
+        Returns:
+            list: (product ID, score) tuples, best match first
+
+        """
+        terms = set(tokenize(query, self.language))
+        count = len(self.documents)
+        if not terms or not count:
+            return []
+        average_length = self.total_length / count
+        scores = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (K1 + 1) / (frequency + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+# indexes of this process, by language, and the search version they were loaded at
+_indexes = {}
+_loaded_version = None
+_lock = threading.Lock()
+
+
+def build_index(language):
+    """build_index builds the index of a language from the database.
+
+    Translations are streamed in chunks, so memory is bounded by the index itself.
+
+    Args:
+        language (string): code of the language to index
+
+    Returns:
+        SearchIndex: index of the available products in that language
+
+    """
+    index = SearchIndex(language)
+    translations = (
+        Product._parler_meta.root_model.objects.filter(
+            language_code=language, master__available=True
+        )
+        .values_list("master_id", "name", "description")
+        .iterator(chunk_size=2000)
+    )
+    for product_id, name, description in translations:
+        index.add(product_id, name, description)
+    return index
+
+
+def rebuild():
+    """rebuild builds the index of every language, saves a snapshot and bumps the version.
+
+    The snapshot is written to a temporary file next to it, then moved into place, so
+    other processes never load a partial snapshot.
+
+    Returns:
+        dict: the new indexes by language
+
+    """
+    global _indexes, _loaded_version
+    indexes = {code: build_index(code) for code, name in settings.LANGUAGES}
+    path = os.fspath(settings.SEARCH_INDEX_PATH)
+    partial = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}"
+    )
+    with open(partial, "wb") as snapshot:
+        pickle.dump(indexes, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, path)
+    with _lock:
+        _indexes = indexes
+        _loaded_version = bump_version(SEARCH_VERSION_KEY)
+    return indexes
+
+
+def _load_snapshot():
+    try:
+        with open(settings.SEARCH_INDEX_PATH, "rb") as snapshot:
+            return pickle.load(snapshot)
+    except FileNotFoundError:
+        return {}
+    except (EOFError, pickle.UnpicklingError) as e:
+        # a truncated or corrupt snapshot is treated as missing, the indexes are built
+        # from the database
+        logger.warning(f"Search snapshot could not be loaded: {e!r}")
+        return {}
+
+
+def get_index(language):
+    """get_index returns the index of a language, loading or building it if needed.
+
+    Args:
+        language (string): code of the language
+
+    Returns:
+        SearchIndex: index of the language
+
+    """
+    global _indexes, _loaded_version
+    version = get_version(SEARCH_VERSION_KEY)
+    if version != _loaded_version:
+        # the index was rebuilt by another process
+        with _lock:
+            if version != _loaded_version:
+                _indexes = _load_snapshot()
+                _loaded_version = version
+    index = _indexes.get(language)
+    if index is None:
+        with _lock:
+            index = _indexes.get(language)
+            if index is None:
+                index = _indexes[language] = build_index(language)
+    return index
+
+
+def search(query, language, limit=20):
+    """search returns the IDs of the products matching the query in the given language.
+
+    Args:
+        query (string): text entered by the user
+        language (string): code of the active language
+        limit (int, optional): maximum number of results. Defaults to 20.
+
+    Returns:
+        list: (product ID, score) tuples, best match first
+
+    """
+    return get_index(language).search(query, limit=limit)
+
+
+def loaded_languages():
+    """loaded_languages returns the codes of the languages indexed in this process."""
+    return list(_indexes)
+
+
+def update_product(product_id, language=None, name=None, description=""):
+    """update_product applies a change to the indexes already loaded in this process.
+
+    If name is None, or the product is not available, the product is removed from the
+    index of the language, or from every index if language is None as well.
+
+    Args:
+        product_id (int): ID of the changed product
+        language (string, optional): code of the changed translation
+        name (string, optional): translated name, None to remove the product
+        description (string, optional): translated description
+
+    """
+    indexes = [_indexes.get(language)] if language else list(_indexes.values())
+    for index in indexes:
+        if index is None:
+            continue
+        if name is None:
+            index.remove(product_id)
+        else:
+            index.add(product_id, name, description)
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import facets, images, search, slugs, translations
+from .cache import bump_catalog_version, bump_category_version, bump_product_version
+from .models import Category, Product
+from .tasks import generate_image_variants, rebuild_search_index
+
+ProductTranslation = Product._parler_meta.root_model
+
+SEARCH_REBUILD_KEY = "shop:search_rebuild_queued"
+
+
+def queue_search_rebuild():
+    """queue_search_rebuild queues a rebuild of the search indexes for other processes.
+
+    The changes of SEARCH_REBUILD_DELAY seconds share a single rebuild, queued by the
+    first of them.
+
+    """
+    if cache.add(SEARCH_REBUILD_KEY, 1, settings.SEARCH_REBUILD_DELAY):
+        transaction.on_commit(
+            lambda: rebuild_search_index.apply_async(
+                countdown=settings.SEARCH_REBUILD_DELAY
+            )
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    """product_changed bumps the catalog version when a product is saved or deleted.
+
+    The version of the product is bumped as well, and the change is applied to the
+    facet index of this process.
+
+    """
+    bump_catalog_version()
+    bump_product_version(instance.id)
+    facets.update_product(instance, deleted=kwargs["signal"] is post_delete)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Category._parler_meta.root_model)
+@receiver(post_delete, sender=Category._parler_meta.root_model)
+def category_changed(sender, **kwargs):
+    """category_changed bumps the category version when a category or its translations
+    are saved or deleted."""
+    bump_category_version()
+
+
+@receiver(post_save, sender=Category._parler_meta.root_model)
+@receiver(post_delete, sender=Category._parler_meta.root_model)
+def category_translation_changed(sender, instance, **kwargs):
+    """category_translation_changed drops the cached name and slug of the category."""
+    translations.invalidate(Category, instance.master_id)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """index_product adds or removes a product from the search indexes of this process.
+
+    Products that are not available are removed. Available ones are indexed again with
+    their translations, for the languages whose index is loaded. Other processes get
+    the change from the rebuild it queues.
+
+    """
+    queue_search_rebuild()
+    if not instance.available:
+        search.update_product(instance.id)
+        return
+    for language, name, description in ProductTranslation.objects.filter(
+        master=instance, language_code__in=search.loaded_languages()
+    ).values_list("language_code", "name", "description"):
+        search.update_product(instance.id, language, name, description)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """unindex_product removes a deleted product from the search indexes."""
+    queue_search_rebuild()
+    search.update_product(instance.id)
+
+
+@receiver(post_save, sender=ProductTranslation)
+def index_product_translation(sender, instance, **kwargs):
+    """index_product_translation indexes the new text of a product translation.
+
+    The catalog version and the version of the product are bumped, as product pages and
+    the catalog API show the translation, and its cached name and slug are dropped.
+
+    """
+    bump_catalog_version()
+    bump_product_version(instance.master_id)
+    translations.invalidate(Product, instance.master_id)
+    queue_search_rebuild()
+    if instance.master.available:
+        search.update_product(
+            instance.master_id,
+            instance.language_code,
+            instance.name,
+            instance.description,
+        )
+    else:
+        search.update_product(instance.master_id, instance.language_code)
+
+
+@receiver(post_delete, sender=ProductTranslation)
+def unindex_product_translation(sender, instance, **kwargs):
+    """unindex_product_translation removes a product from the index of a language."""
+    bump_catalog_version()
+    bump_product_version(instance.master_id)
+    translations.invalidate(Product, instance.master_id)
+    queue_search_rebuild()
+    search.update_product(instance.master_id, instance.language_code)
+
+
+@receiver(post_save, sender=ProductTranslation)
+@receiver(post_delete, sender=ProductTranslation)
+def update_product_slug(sender, instance, **kwargs):
+    """update_product_slug writes the new slug of a product to the slug map."""
+    deleted = kwargs["signal"] is post_delete
+    slugs.set_product_slug(
+        instance.master_id, instance.language_code, None if deleted else instance.slug
+    )
+
+
+def build_slug_map(sender, **kwargs):
+    """build_slug_map fills the slug map once the migrations of the shop are applied.
+
+    It is connected to post_migrate in :class:`shop.apps.ShopConfig`, so the map is
+    built on every deploy instead of by each process when it starts.
+
+    """
+    slugs.build()
+
+
+@receiver(post_save, sender=Product)
+def create_image_variants(sender, instance, **kwargs):
+    """create_image_variants queues the variants of a newly uploaded product image."""
+    name = instance.image.name
+    if name and name not in images.get_manifest():
+        transaction.on_commit(lambda: generate_image_variants.delay(name))
+
+
+@receiver(post_save, sender=ProductTranslation)
+@receiver(post_delete, sender=ProductTranslation)
+def touch_product(sender, instance, **kwargs):
+    """touch_product sets Product.updated, so the sitemap shard of the product is
+    written again."""
+    Product.objects.filter(id=instance.master_id).update(updated=timezone.now())
@@ -0,0 +1,123 @@
+"""resolution of the slugs used in product and category urls, without joins.
+
+Product urls hold the ID and the slug of the product. Product slugs are not unique, so
+the map kept in the shared cache goes the other way: for each language, the slug of
+every product ID, under shop:product_slug:[language]:[id]. A url is valid if its slug
+is the slug of its product in the active language, or in the fallback language when
+the product has no translation in the active one, and the product is then loaded by
+primary key. The map is built after the migrations of the shop are applied, so on every
+deploy, and by the build_slug_map management command. It is kept up to date by the
+receivers in :mod:`shop.signals` when a product translation is saved or deleted, and
+filled one product at a time on a miss.
+
+Category slugs are unique, and are resolved with the cached category tree.
+
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_category_tree
+from .models import Product
+from .translations import get_languages
+
+ProductTranslation = Product._parler_meta.root_model
+
+# stored for products without a translation in a language, so misses are cached too
+NO_SLUG = ""
+
+
+def get_product_slug_key(product_id, language):
+    return f"shop:product_slug:{language}:{product_id}"
+
+
+def get_product_slug(product_id, language):
+    """get_product_slug returns the slug of a product in its url for the given language.
+
+    That is the slug of its translation in the language, or in the fallback language if
+    there is none, like Product.slug.
+
+    Args:
+        product_id (int): ID of the product
+        language (string): code of the language
+
+    Returns:
+        string: slug of the product, or None if it has no translation in either language
+
+    """
+    for code in get_languages(language):
+        slug = _get_slug(product_id, code)
+        if slug:
+            return slug
+    return None
+
+
+def _get_slug(product_id, language):
+    key = get_product_slug_key(product_id, language)
+    slug = cache.get(key)
+    if slug is None:
+        # uses the (language_code, master) unique index of the translations
+        slug = (
+            ProductTranslation.objects.filter(
+                language_code=language, master_id=product_id
+            )
+            .values_list("slug", flat=True)
+            .first()
+        ) or NO_SLUG
+        cache.set(key, slug, settings.SLUG_MAP_TIMEOUT)
+    return slug
+
+
+def set_product_slug(product_id, language, slug=None):
+    """set_product_slug updates the map after a translation was saved or deleted."""
+    cache.set(
+        get_product_slug_key(product_id, language),
+        slug or NO_SLUG,
+        settings.SLUG_MAP_TIMEOUT,
+    )
+
+
+def get_category_id(slug, language):
+    """get_category_id returns the ID of the category with the given slug, or None.
+
+    Args:
+        slug (string): slug of the category, as given in the url
+        language (string): code of the language
+
+    Returns:
+        int: ID of the category
+
+    """
+    for category in get_category_tree(language):
+        if category["slug"] == slug:
+            return category["id"]
+    return None
+
+
+def build(chunk_size=5000):
+    """build writes the slug of every product in every language to the shared cache.
+
+    Translations are streamed and written with one set_many call per chunk.
+
+    Args:
+        chunk_size (int, optional): number of slugs written at once. Defaults to 5000.
+
+    Returns:
+        int: number of slugs written
+
+    """
+    count = 0
+    slugs = {}
+    rows = ProductTranslation.objects.values_list(
+        "master_id", "language_code", "slug"
+    ).iterator(chunk_size=chunk_size)
+    for product_id, language, slug in rows:
+        slugs[get_product_slug_key(product_id, language)] = slug
+        if len(slugs) >= chunk_size:
+            cache.set_many(slugs, settings.SLUG_MAP_TIMEOUT)
+            count += len(slugs)
+            slugs = {}
+    if slugs:
+        cache.set_many(slugs, settings.SLUG_MAP_TIMEOUT)
+        count += len(slugs)
+    return count
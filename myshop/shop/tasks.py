@@ -0,0 +1,84 @@
+import logging
+
+from celery import shared_task
+from redis import RedisError
+
+from . import feeds, images, recommendations, search
+from .cache import bump_product_version
+from .models import Product
+from .recommender import Recommender
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_image_variants(name):
+    """generate_image_variants creates the resized and WebP variants of a product image.
+
+    The versions of the products using the image are bumped, so their cached detail
+    pages are rendered again with the variants.
+
+    Args:
+        name (string): name of the uploaded image in the media storage
+
+    """
+    try:
+        entry = images.generate(name)
+    except (OSError, ValueError) as e:
+        # a missing or unreadable file keeps being served as it was uploaded
+        logger.error(f"Could not create the variants of image {name}: {e}")
+        return None
+    for product_id in Product.objects.filter(image=name).values_list("id", flat=True):
+        bump_product_version(product_id)
+    logger.info(f"Created {len(entry['variants'])} variants of image {name}")
+    return entry["digest"]
+
+
+@shared_task
+def generate_sitemaps():
+    """generate_sitemaps writes the sitemap shards and product feeds that changed."""
+    written, total = feeds.generate()
+    logger.info(f"Sitemaps generated, {written} of {total} shards written")
+    return written
+
+
+@shared_task
+def rebuild_search_index():
+    """rebuild_search_index rebuilds the search indexes that every process reloads."""
+    indexes = search.rebuild()
+    logger.info(f"Search index rebuilt, {len(indexes)} languages")
+
+
+@shared_task
+def materialize_recommendations():
+    """materialize_recommendations stores the top suggestions of every product."""
+    count = recommendations.materialize()
+    logger.info(f"Recommendations materialized for {count} products")
+    return count
+
+
+@shared_task
+def compact_recommendations():
+    """compact_recommendations trims the co-purchase sets, renormalizing if needed."""
+    sets, removed = Recommender().compact()
+    logger.info(f"Recommendations compacted, {removed} members removed of {sets} sets")
+    return removed
+
+
+@shared_task(
+    autoretry_for=(RedisError,),
+    retry_backoff=True,
+    retry_backoff_max=600,
+    max_retries=20,
+)
+def products_bought(items):
+    """products_bought replays a purchase that could not be recorded in Redis.
+
+    It is retried with an exponential backoff, up to 20 times, until Redis is back.
+
+    Args:
+        items (list): [product ID, quantity] pairs of the order
+
+    """
+    quantities = {product_id: quantity for product_id, quantity in items}
+    Recommender().products_bought(list(quantities), quantities)
@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+from shop.images import get_srcsets
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image(image, alt="", sizes="100vw"):
+    """product_image renders a product image with the srcset of its variants.
+
+    A <picture> offers the WebP variants to browsers that support them and the JPEG
+    ones to the others. Images without variants yet are served as they were uploaded,
+    and products without an image get the placeholder.
+
+    Args:
+        image (ImageFieldFile or string): image of the product, or its name
+        alt (string, optional): alternative text of the image
+        sizes (string, optional): sizes attribute, the width the image is shown at.
+            Defaults to 100vw.
+
+    Returns:
+        string: HTML of the image
+
+    """
+    name = getattr(image, "name", image)
+    if not name:
+        return format_html('<img src="{}" alt="{}">', static("img/no_image.png"), alt)
+    url = default_storage.url(name)
+    srcsets = get_srcsets(name)
+    if not srcsets:
+        return format_html('<img src="{}" alt="{}">', url, alt)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"></picture>',
+        srcsets.get("webp", ""),
+        sizes,
+        url,
+        srcsets.get("jpeg", ""),
+        sizes,
+        alt,
+    )
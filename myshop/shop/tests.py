@@ -1,3 +1,758 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_migrate
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import Order, OrderItem
+
+from . import api, facets, search, slugs, views
+from .cache import get_or_build
+from .cache_backend import ResilientRedisCache
+from .catalog import CatalogImporter, clean_row
+from .models import Category, Product
+from .recommender import EPOCH_KEY, Recommender
+from .redis_pool import CircuitBreaker, CircuitOpenError
+from .search import SearchIndex, stem, tokenize
+
+try:
+    import fakeredis
+    from scipy import sparse
+
+    from . import copurchases
+except ImportError:
+    fakeredis = copurchases = None
+
+
+class StemTests(SimpleTestCase):
+    """Tests of the light suffix stemmer of :mod:`shop.search`."""
+
+    def test_english_singular_and_plural_share_a_stem(self):
+        pairs = [
+            ("shoe", "shoes"),
+            ("table", "tables"),
+            ("candle", "candles"),
+            ("dress", "dresses"),
+            ("glass", "glasses"),
+            ("box", "boxes"),
+            ("city", "cities"),
+            ("lamp", "lamps"),
+            ("house", "houses"),
+        ]
+        for singular, plural in pairs:
+            with self.subTest(singular=singular):
+                self.assertEqual(stem(singular, "en"), stem(plural, "en"))
+
+    def test_spanish_singular_and_plural_share_a_stem(self):
+        pairs = [("mesa", "mesas"), ("vela", "velas"), ("lapiz", "lapices")]
+        for singular, plural in pairs:
+            with self.subTest(singular=singular):
+                self.assertEqual(stem(singular, "es"), stem(plural, "es"))
+
+    def test_short_words_are_kept(self):
+        self.assertEqual(stem("bus", "en"), "bus")
+        self.assertEqual(stem("tie", "en"), stem("ties", "en"))
+
+    def test_tokenize_drops_stop_words_and_accents(self):
+        self.assertEqual(tokenize("The Shoes of Canción", "en"), ["sho", "cancion"])
+
+
+class SearchIndexTests(SimpleTestCase):
+    """Tests of :class:`shop.SearchIndex`."""
+
+    def test_singular_query_finds_plural_name(self):
+        index = SearchIndex("en")
+        index.add(1, "Leather Shoes", "Handmade in Spain")
+        index.add(2, "Wooden Table", "Oak")
+        self.assertEqual([doc_id for doc_id, score in index.search("shoe")], [1])
+        self.assertEqual([doc_id for doc_id, score in index.search("tables")], [2])
+
+    def test_remove(self):
+        index = SearchIndex("en")
+        index.add(1, "Candles")
+        index.remove(1)
+        self.assertEqual(index.search("candle"), [])
+        self.assertEqual(len(index), 0)
+
+
+class SearchSnapshotTests(SimpleTestCase):
+    """Tests of the snapshot written by :func:`shop.search.rebuild`."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "search_index.pickle")
+        settings = override_settings(SEARCH_INDEX_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for patcher in [
+            # rebuild() replaces the indexes of the process, they are restored after
+            mock.patch("shop.search._indexes", {}),
+            mock.patch("shop.search._loaded_version", None),
+            mock.patch("shop.search.build_index", side_effect=SearchIndex),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, data):
+        with open(self.path, "wb") as snapshot:
+            snapshot.write(data)
+
+    def test_rebuild_replaces_snapshot(self):
+        self.write(b"old")
+        indexes = search.rebuild()
+        self.assertEqual(os.listdir(self.directory), ["search_index.pickle"])
+        self.assertEqual(sorted(search._load_snapshot()), sorted(indexes))
+
+    def test_corrupt_snapshot_is_treated_as_missing(self):
+        data = pickle.dumps({"en": SearchIndex("en")})
+        for name, corrupt in [("truncated", data[: len(data) // 2]), ("bad", b"x")]:
+            with self.subTest(name):
+                self.write(corrupt)
+                with self.assertLogs("shop.search", "WARNING"):
+                    self.assertEqual(search._load_snapshot(), {})
+
+
+@skipUnless(copurchases, "fakeredis, numpy or scipy is not installed")
+class CopurchaseLoadTests(SimpleTestCase):
+    """Tests of :func:`shop.copurchases.load` against an in-memory Redis."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.recommender = Recommender(self.redis)
+
+    def load(self, rows, **kwargs):
+        counts = sparse.csr_matrix(rows, dtype=float)
+        return copurchases.load(counts, 2, redis_client=self.redis, **kwargs)
+
+    def get_set(self, product_id):
+        key = self.recommender.get_product_key(product_id)
+        return {
+            int(id): score
+            for id, score in self.redis.zrange(key, 0, -1, withscores=True)
+        }
+
+    def test_replaces_sets_and_removes_stale_ones(self):
+        self.redis.zadd(self.recommender.get_product_key(1), {3: 9})
+        self.redis.zadd(self.recommender.get_product_key(3), {1: 9})
+        loaded = self.load([[0, 0, 0, 0], [0, 0, 2, 0], [0, 1, 0, 4], [0, 0, 0, 0]])
+        self.assertEqual(loaded, 2)
+        self.assertEqual(self.get_set(1), {2: 2.0})
+        self.assertEqual(self.get_set(2), {1: 1.0, 3: 4.0})
+        self.assertEqual(self.get_set(3), {})
+        self.assertEqual(self.redis.keys("*:rebuild:*"), [])
+
+    def test_keeps_best_entries(self):
+        self.load([[0, 1, 5, 3], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+        self.assertEqual(self.get_set(0), {2: 5.0, 3: 3.0})
+
+    def test_failed_write_keeps_live_sets(self):
+        self.redis.zadd(self.recommender.get_product_key(1), {2: 9})
+        rows = [[0, 0, 0], [0, 0, 2], [0, 1, 0]]
+        with mock.patch("redis.client.Pipeline.execute", side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.load(rows, batch_size=1)
+        self.assertEqual(self.get_set(1), {2: 9.0})
+        self.assertEqual(self.redis.keys("*:rebuild:*"), [])
+
+
+@skipUnless(copurchases, "fakeredis, numpy or scipy is not installed")
+class CopurchaseReplayTests(TestCase):
+    """Tests of the orders paid while :func:`shop.copurchases.load` runs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        cls.products = [
+            Product.objects.create(
+                category=category, name=name, slug=name, price="4.35"
+            )
+            for name in ["green", "black", "white"]
+        ]
+        cls.started = timezone.now()
+        cls.before = cls.create_order(cls.products[:2], cls.started)
+        cls.during = cls.create_order(cls.products[1:], cls.started + timedelta(1))
+
+    @classmethod
+    def create_order(cls, products, updated):
+        order = Order.objects.create(
+            first_name="Ada",
+            last_name="Lovelace",
+            email="ada@example.com",
+            address="12 Example Road",
+            postal_code="12345",
+            city="London",
+            state="London",
+            paid=True,
+        )
+        for quantity, product in enumerate(products, 1):
+            OrderItem.objects.create(
+                order=order, product=product, price="4.35", quantity=quantity
+            )
+        # auto_now cannot be set with save()
+        Order.objects.filter(pk=order.pk).update(updated=updated)
+        return order
+
+    def test_only_orders_updated_before_the_rebuild_are_counted(self):
+        batches = copurchases.iter_batches(10, updated_before=self.started)
+        order_ids = [order_id for batch in batches for order_id in batch[0]]
+        self.assertEqual(order_ids, [self.before.id, self.before.id])
+
+    def test_replay_adds_orders_paid_during_the_rebuild(self):
+        redis = fakeredis.FakeRedis()
+        recommender = Recommender(redis)
+        replayed = copurchases.replay(
+            self.started, self.started + timedelta(2), redis_client=redis
+        )
+        self.assertEqual(replayed, 1)
+        black, white = self.products[1:]
+        key = recommender.get_product_key(black.id)
+        self.assertEqual(redis.zrange(key, 0, -1), [str(white.id).encode()])
+        self.assertEqual(
+            redis.keys(recommender.get_product_key(self.products[0].id)), []
+        )
+
+
+class CleanRowTests(SimpleTestCase):
+    """Tests of the availability read by :func:`shop.catalog.clean_row`."""
+
+    row = {"category": "tea", "price": "4.35", "name_en": "Tea", "slug_en": "tea"}
+
+    def get_available(self, value):
+        fields, translated = clean_row({**self.row, "available": value}, {"tea": 1})
+        return fields["available"]
+
+    def test_values(self):
+        values = [("1", True), ("Yes", True), (True, True), ("0", False), (0, False)]
+        values += [("false", False), (False, False)]
+        for value, available in values:
+            with self.subTest(value=value):
+                self.assertIs(self.get_available(value), available)
+
+    def test_empty_is_left_to_the_importer(self):
+        for value in ["", " ", None]:
+            with self.subTest(value=value):
+                self.assertIsNone(self.get_available(value))
+        fields, translated = clean_row(self.row, {"tea": 1})
+        self.assertIsNone(fields["available"])
+
+    def test_invalid(self):
+        with self.assertRaises(ValidationError):
+            self.get_available("maybe")
+
+
+class CatalogImporterTests(TestCase):
+    """Tests of the rows written by :class:`shop.CatalogImporter`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        Product.objects.create(
+            category=category, name="Tea", slug="tea", price="4.35", available=False
+        )
+
+    # the search snapshot is written to a file, it is not needed here
+    @mock.patch("shop.search.rebuild")
+    def test_empty_available_keeps_existing_or_defaults_to_available(self, rebuild):
+        rows = [
+            {"category": "tea", "price": "5.00", "name_en": "Tea", "slug_en": "tea"},
+            {"category": "tea", "price": "2.00", "name_en": "Mug", "slug_en": "mug"},
+        ]
+        CatalogImporter().run({**row, "available": ""} for row in rows)
+        available = dict(Product.objects.values_list("translations__slug", "available"))
+        self.assertEqual(available, {"tea": False, "mug": True})
+
+    @mock.patch("shop.search.rebuild")
+    @mock.patch("shop.catalog.invalidate_products")
+    def test_products_are_invalidated_per_chunk_and_errors_capped(
+        self, invalidate_products, rebuild
+    ):
+        rows = [
+            {"category": "tea", "price": "1.00", "name_en": "Cup", "slug_en": "cup"},
+            {"category": "tea", "price": "2.00", "name_en": "Mug", "slug_en": "mug"},
+            {"category": "tea", "price": "", "name_en": "Pot", "slug_en": "pot"},
+            {"category": "tea", "price": "", "name_en": "Jar", "slug_en": "jar"},
+            {"category": "tea", "price": "5.00", "name_en": "Tea", "slug_en": "tea"},
+        ]
+        importer = CatalogImporter(chunk_size=2, max_errors=1)
+        importer.run(rows)
+        ids = dict(Product.objects.values_list("translations__slug", "id"))
+        self.assertEqual(
+            [call.args[0] for call in invalidate_products.call_args_list],
+            [[ids["cup"], ids["mug"]], [ids["tea"]]],
+        )
+        self.assertEqual((importer.created, importer.updated), (2, 1))
+        self.assertEqual(importer.invalid, 2)
+        self.assertEqual([number for number, message in importer.errors], [3])
+
+
+class FacetFilterTests(SimpleTestCase):
+    """Tests of the availability facet of :mod:`shop.facets`."""
+
+    def setUp(self):
+        index = facets.FacetIndex()
+        products = [
+            (1, "10.00", 100, True),
+            (2, "10.00", 100, False),
+            (3, "10.00", 100, True),
+            (4, "99.00", 100, False),
+        ]
+        for product_id, price, weight, available in products:
+            index.update(
+                product_id,
+                facets.FacetIndex.get_values(1, Decimal(price), weight, available),
+            )
+        patcher = mock.patch("shop.facets.get_index", return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def describe(self, query):
+        filters = facets.get_filters(QueryDict(query))
+        facet_list, counts = facets.describe(filters, QueryDict(query))
+        return {facet["name"]: facet["values"] for facet in facet_list}["available"]
+
+    def test_in_stock_only_by_default(self):
+        for query in ["", "available=0", "available=1"]:
+            with self.subTest(query=query):
+                filters = facets.get_filters(QueryDict(query))
+                self.assertIs(filters["available"], True)
+        self.assertNotIn("available", facets.get_filters(QueryDict("available=all")))
+
+    def test_availability_counts(self):
+        in_stock, everything = self.describe("")
+        self.assertEqual((in_stock["count"], in_stock["selected"]), (2, True))
+        self.assertEqual((everything["count"], everything["selected"]), (4, False))
+        self.assertEqual(in_stock["query"], "")
+        self.assertEqual(everything["query"], "available=all")
+
+    def test_availability_counts_follow_other_filters(self):
+        price = facets.band_label(facets.find_band(facets.PRICE_BANDS, Decimal(10)))
+        in_stock, everything = self.describe(f"price={price}&available=all")
+        self.assertEqual((in_stock["count"], in_stock["selected"]), (2, False))
+        self.assertEqual((everything["count"], everything["selected"]), (3, True))
+        self.assertEqual(in_stock["query"], f"price={price}")
+
+
+class ProductDetailTests(TestCase):
+    """Tests of :func:`shop.views.product_detail` and its cached fragments."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        cls.product = Product.objects.create(
+            category=category, name="Tea", slug="tea", price="4.35"
+        )
+
+    def test_out_of_stock_product_is_shown_without_cart_form(self):
+        url = self.product.get_absolute_url()
+        self.assertContains(self.client.get(url), 'value="Add to cart"')
+        # saving bumps the product version, so the cached fragment is not used
+        self.product.available = False
+        self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, "Out of stock")
+        self.assertNotContains(response, 'value="Add to cart"')
+
+    def test_wrong_slug_is_rejected_by_the_slug_map(self):
+        url = self.product.get_absolute_url().replace("/tea/", "/coffee/")
+        slugs.get_product_slug(self.product.id, "en")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_missing_product_is_cached(self):
+        url = reverse("shop:product_detail", args=[self.product.id + 1, "tea"])
+        # the slug map is out of date, it still has the product
+        with mock.patch("shop.views.get_product_slug", return_value="tea"):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class GetOrBuildTests(SimpleTestCase):
+    """Tests of the single-flight rebuild of :func:`shop.cache.get_or_build`."""
+
+    key = "tests:get_or_build"
+
+    def setUp(self):
+        cache.delete_many([self.key, f"{self.key}:lock"])
+        self.addCleanup(cache.delete_many, [self.key, f"{self.key}:lock"])
+        self.builds = []
+
+    def build(self):
+        self.builds.append(threading.get_ident())
+        # long enough for every other request to find the lock taken
+        time.sleep(0.2)
+        return "value"
+
+    def run_threads(self, count):
+        barrier = threading.Barrier(count)
+        values = []
+
+        def run():
+            barrier.wait()
+            values.append(get_or_build(self.key, self.build, 60))
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return values
+
+    def test_concurrent_misses_build_once(self):
+        self.assertEqual(self.run_threads(10), ["value"] * 10)
+        self.assertEqual(len(self.builds), 1)
+
+    def test_waiter_builds_once_the_lock_is_released_without_value(self):
+        # another request took the lock, then failed to build the value
+        cache.add(f"{self.key}:lock", 1)
+        threading.Timer(0.1, cache.delete, [f"{self.key}:lock"]).start()
+        start = time.monotonic()
+        self.assertEqual(self.run_threads(3), ["value"] * 3)
+        self.assertEqual(len(self.builds), 1)
+        self.assertLess(time.monotonic() - start, 1)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.1)
+    def test_waiter_builds_after_the_wait(self):
+        cache.add(f"{self.key}:lock", 1)
+        self.assertEqual(get_or_build(self.key, self.build, 60), "value")
+        self.assertEqual(len(self.builds), 1)
+
+
+class EncodingTests(SimpleTestCase):
+    """Tests of the content coding chosen by :func:`shop.api.get_encoding`."""
+
+    def test_q_values(self):
+        cases = [
+            ("", "identity"),
+            ("gzip", "gzip"),
+            ("GZIP; Q=1.0", "gzip"),
+            ("deflate, gzip;q=0.5", "gzip"),
+            ("gzip;q=0", "identity"),
+            ("gzip;q=0.0, deflate", "identity"),
+            ("gzip;q=0.5, identity", "identity"),
+            ("gzip;q=invalid", "identity"),
+            ("x-gzip", "gzip"),
+            ("*", "gzip"),
+            ("*;q=0, identity", "identity"),
+            ("br, deflate", "identity"),
+        ]
+        factory = RequestFactory()
+        for header, encoding in cases:
+            with self.subTest(header=header):
+                request = factory.get("/", headers={"Accept-Encoding": header})
+                self.assertEqual(api.get_encoding(request), encoding)
+
+
+class ProductApiTests(TestCase):
+    """Tests of the ETags and content codings of :func:`shop.api.product_detail`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        cls.product = Product.objects.create(
+            category=category, name="Tea", slug="tea", price="4.35"
+        )
+
+    def get(self, encoding, etag=None):
+        url = reverse("shop:api_product_detail", args=[self.product.id])
+        headers = {"Accept-Encoding": encoding}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        return self.client.get(url, headers=headers)
+
+    def test_gzip_and_identity_bodies(self):
+        compressed = self.get("gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        plain = self.get("gzip;q=0")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(json.loads(plain.content)["name"], "Tea")
+        for response in [compressed, plain]:
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertNotEqual(compressed["ETag"], plain["ETag"])
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        etag = self.get("gzip")["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get("gzip", etag).status_code, 304)
+        # the ETag of the other coding does not match
+        self.assertEqual(self.get("identity", etag).status_code, 200)
+
+    def test_etag_changes_with_the_product(self):
+        etag = self.get("gzip")["ETag"]
+        self.product.price = "5.00"
+        self.product.save()
+        response = self.get("gzip", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(gzip.decompress(response.content))["price"], "5.00")
+
+
+class SlugMapTests(TestCase):
+    """Tests of the product slug map of :mod:`shop.slugs`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Tea", slug="tea")
+        cls.product = Product.objects.create(
+            category=category, name="Tea", slug="tea", price="4.35"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fallback_language(self):
+        self.assertEqual(slugs.get_product_slug(self.product.id, "es"), "tea")
+        self.product.set_current_language("es")
+        self.product.name, self.product.slug = "Té", "te"
+        self.product.save()
+        self.assertEqual(slugs.get_product_slug(self.product.id, "es"), "te")
+        self.assertEqual(slugs.get_product_slug(self.product.id, "en"), "tea")
+
+    def test_unknown_product(self):
+        self.assertIsNone(slugs.get_product_slug(0, "en"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(slugs.get_product_slug(0, "en"))
+
+    def test_built_after_migrations(self):
+        shop = apps.get_app_config("shop")
+        post_migrate.send(
+            sender=shop,
+            app_config=shop,
+            verbosity=0,
+            interactive=False,
+            using="default",
+            apps=apps,
+            plan=[],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(slugs.get_product_slug(self.product.id, "en"), "tea")
+
+
+def fail(*args, **kwargs):
+    raise redis.ConnectionError("Redis is down")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Tests of :class:`shop.CircuitBreaker` with a fake clock."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("shop.redis_pool.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+
+    def fail_times(self, count):
+        for _ in range(count):
+            with self.assertRaises(redis.ConnectionError):
+                self.breaker.call(fail)
+
+    def test_opens_after_threshold(self):
+        self.fail_times(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.fail_times(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_success_resets_failures(self):
+        self.fail_times(2)
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.fail_times(2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rejects_while_open(self):
+        self.fail_times(3)
+        function = mock.Mock()
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(function)
+        function.assert_not_called()
+
+    def test_half_open_trial_closes_on_success(self):
+        self.fail_times(3)
+        self.now += 30
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_half_open_trial_reopens_on_failure(self):
+        self.fail_times(3)
+        self.now += 30
+        self.fail_times(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        # the reset timeout starts again from the failed trial
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "ok")
+
+    def test_metrics(self):
+        self.fail_times(3)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(fail)
+        self.now += 30
+        self.breaker.call(lambda: "ok")
+        self.assertEqual(
+            self.breaker.get_metrics(),
+            {
+                "state": CircuitBreaker.CLOSED,
+                "consecutive_failures": 0,
+                "calls": 5,
+                "failed_calls": 3,
+                "rejected_calls": 1,
+                "times_opened": 1,
+            },
+        )
+
+
+class FailingClient:
+    """FailingClient stands for the Redis client of the cache, every call fails."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls += 1
+            fail()
+
+        return call
+
+
+class ResilientRedisCacheTests(SimpleTestCase):
+    """Tests of :class:`shop.ResilientRedisCache` while Redis fails."""
+
+    def setUp(self):
+        self.cache = ResilientRedisCache("redis://localhost:6379/2", {})
+        self.client = FailingClient()
+        self.cache.__dict__["_cache"] = self.client
+        self.breaker = CircuitBreaker(threshold=100, reset_timeout=30)
+        patcher = mock.patch("shop.cache_backend.breaker", self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failures_are_misses(self):
+        self.assertEqual(self.cache.get("key", "default"), "default")
+        self.assertIsNone(self.cache.set("key", 1))
+        # the single-flight lock is granted, so the caller builds the value
+        self.assertIs(self.cache.add("key", 1), True)
+        self.assertEqual(self.cache.get_many(["a", "b"]), {})
+        self.assertEqual(self.cache.set_many({"a": 1, "b": 2}), ["a", "b"])
+        self.assertIs(self.cache.has_key("key"), False)
+        self.assertIsNone(self.cache.incr("key"))
+        self.assertIs(self.cache.delete("key"), False)
+        self.assertEqual(self.client.calls, 8)
+
+    def test_redis_is_not_called_while_breaker_is_open(self):
+        self.breaker.threshold = 2
+        for _ in range(5):
+            self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.client.calls, 2)
+        self.assertEqual(self.breaker.get_metrics()["rejected_calls"], 3)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RecommenderFailureTests(SimpleTestCase):
+    """Tests of :class:`shop.Recommender` while Redis fails."""
+
+    def test_no_suggestions_while_redis_is_down(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        recommender = Recommender(fakeredis.FakeRedis(server=server))
+        products = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+        with mock.patch("shop.recommender.breaker", CircuitBreaker(2, 30)):
+            with self.assertLogs("shop.recommender", "WARNING"):
+                self.assertEqual(recommender.suggest_products_for(products[:1]), [])
+                self.assertEqual(recommender.suggest_products_for(products), [])
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(RECOMMENDATIONS_HALF_LIFE=100, RECOMMENDATIONS_RENORMALIZE_FACTOR=2)
+class RecommenderDecayTests(SimpleTestCase):
+    """Tests of the decay of :class:`shop.Recommender` scores and of compact()."""
+
+    now = 1_000_000.0
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.recommender = Recommender(self.redis)
+        patcher = mock.patch("shop.recommender.time.time", return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_set(self, product_id):
+        key = self.recommender.get_product_key(product_id)
+        return {
+            int(id): score
+            for id, score in self.redis.zrange(key, 0, -1, withscores=True)
+        }
+
+    def test_increments_are_weighted_by_the_epoch_factor(self):
+        # two half-lives after the epoch, a purchase weighs 4 times more
+        self.recommender.set_epoch(self.now - 200)
+        self.recommender.products_bought([1, 2], {1: 1, 2: 3})
+        self.assertEqual(self.get_set(1), {2: 12.0})
+        self.assertEqual(self.get_set(2), {1: 4.0})
+
+    def test_compact_renormalizes_and_keeps_relative_scores(self):
+        self.recommender.set_epoch(self.now - 200)
+        self.redis.zadd(self.recommender.get_product_key(1), {2: 40, 3: 10, 4: 2})
+        self.redis.zadd(self.recommender.get_product_key(2), {1: 8})
+        self.assertEqual(self.recommender.compact(), (2, 0))
+        self.assertEqual(self.get_set(1), {2: 10.0, 3: 2.5, 4: 0.5})
+        self.assertEqual(self.get_set(2), {1: 2.0})
+        # the epoch is moved to now, so new purchases weigh 1 on the same scale
+        self.assertEqual(float(self.redis.get(EPOCH_KEY)), self.now)
+        self.recommender.products_bought([2, 4])
+        self.assertEqual(self.get_set(2), {1: 2.0, 4: 1.0})
+
+    def test_compact_keeps_scores_below_the_renormalize_factor(self):
+        self.recommender.set_epoch(self.now - 50)
+        self.redis.zadd(self.recommender.get_product_key(1), {2: 40, 3: 10})
+        self.recommender.compact()
+        self.assertEqual(self.get_set(1), {2: 40.0, 3: 10.0})
+        self.assertEqual(float(self.redis.get(EPOCH_KEY)), self.now - 50)
+
+    @override_settings(RECOMMENDATIONS_SET_SIZE=3)
+    def test_compact_trims_sets_to_set_size(self):
+        self.recommender.set_epoch(self.now)
+        key = self.recommender.get_product_key(1)
+        self.redis.zadd(key, {id: id for id in range(2, 8)})
+        self.redis.zadd(self.recommender.get_product_key(2), {1: 1})
+        self.assertEqual(self.recommender.compact(batch_size=1), (2, 3))
+        self.assertEqual(self.get_set(1), {5: 5.0, 6: 6.0, 7: 7.0})
+        self.assertEqual(self.get_set(2), {1: 1.0})
+
+
+class RedisHealthTests(SimpleTestCase):
+    """Tests of :func:`shop.views.redis_health`."""
+
+    def get(self, user):
+        request = RequestFactory().get("/health/redis/")
+        request.user = user
+        with mock.patch("shop.views.breaker", CircuitBreaker(2, 30)):
+            return json.loads(views.redis_health(request).content)
+
+    def test_only_staff_get_the_counters(self):
+        anonymous = SimpleNamespace(is_active=False, is_staff=False)
+        customer = SimpleNamespace(is_active=True, is_staff=False)
+        for user in [anonymous, customer]:
+            with self.subTest(user=user):
+                self.assertEqual(self.get(user), {"status": "closed"})
+        staff = SimpleNamespace(is_active=True, is_staff=True)
+        self.assertEqual(sorted(self.get(staff)), ["breaker", "recommendations_cache"])
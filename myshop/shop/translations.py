@@ -0,0 +1,130 @@
+"""denormalized cache of the translated names and slugs of parler models.
+
+The name and slug of a :model:`shop.Product` or :model:`shop.Category` come from its
+translation in the active language, or from the fallback language, or from any other
+language if neither exists. Resolving that one object at a time may take a query per
+object and language. translate() resolves a whole list of objects at once: the resolved
+fields of each object are read from the shared cache with a single call, and the objects
+missing from it are loaded with a single query that fetches every translation row they
+have. The receivers in :mod:`shop.signals` drop the cached entries of an object when one
+of its translations is saved or deleted.
+
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+from parler import appsettings
+
+# translated fields kept in the cache, the description is only shown on detail pages
+TRANSLATED_FIELDS = ["name", "slug"]
+
+
+def get_key(model, object_id, language):
+    return f"shop:translation:{model._meta.label_lower}:{language}:{object_id}"
+
+
+def get_languages(language):
+    """get_languages returns the languages to try for the given one, in order."""
+    return [language] + appsettings.PARLER_LANGUAGES.get_fallback_languages(language)
+
+
+def get_translations(model, ids, language=None):
+    """get_translations returns the translated fields of several objects of a model.
+
+    Args:
+        model (class): TranslatableModel of the objects, Product or Category
+        ids (iterable): primary keys of the objects
+        language (string, optional): code of the language, the active one by default
+
+    Returns:
+        dict: TRANSLATED_FIELDS of each object keyed by its ID. Objects without any
+            translation are left out.
+
+    """
+    language = language or get_language()
+    keys = {get_key(model, object_id, language): object_id for object_id in set(ids)}
+    translations = {
+        keys[key]: fields for key, fields in cache.get_many(keys.keys()).items()
+    }
+    missing = [
+        object_id for object_id in keys.values() if object_id not in translations
+    ]
+    if missing:
+        rows = {}
+        for master_id, language_code, *values in (
+            model._parler_meta.root_model.objects.filter(master_id__in=missing)
+            .order_by("language_code")
+            .values_list("master_id", "language_code", *TRANSLATED_FIELDS)
+        ):
+            rows.setdefault(master_id, {})[language_code] = dict(
+                zip(TRANSLATED_FIELDS, values)
+            )
+        loaded = {}
+        for object_id, by_language in rows.items():
+            for code in get_languages(language):
+                if code in by_language:
+                    loaded[object_id] = by_language[code]
+                    break
+            else:
+                # like safe_translation_getter(any_language=True)
+                loaded[object_id] = next(iter(by_language.values()))
+        cache.set_many(
+            {
+                get_key(model, object_id, language): fields
+                for object_id, fields in loaded.items()
+            },
+            settings.TRANSLATION_CACHE_TIMEOUT,
+        )
+        translations.update(loaded)
+    return translations
+
+
+def translate(objects, language=None):
+    """translate attaches the cached translated fields to each object.
+
+    The name and slug properties of the objects then read them instead of querying
+    the translations, as long as the same language is active.
+
+    Args:
+        objects (iterable): Product or Category objects, of one or more models
+        language (string, optional): code of the language, the active one by default
+
+    Returns:
+        list: the same objects
+
+    """
+    language = language or get_language()
+    objects = list(objects)
+    by_model = {}
+    for obj in objects:
+        by_model.setdefault(type(obj), []).append(obj)
+    for model, instances in by_model.items():
+        translations = get_translations(model, [obj.pk for obj in instances], language)
+        for obj in instances:
+            if obj.pk in translations:
+                obj._cached_translation = (language, translations[obj.pk])
+    return objects
+
+
+def invalidate(model, object_id):
+    """invalidate drops the cached translated fields of an object in every language.
+
+    Every language is dropped, because a language without a translation of its own
+    shows the fallback one.
+
+    """
+    cache.delete_many(
+        [get_key(model, object_id, code) for code, name in settings.LANGUAGES]
+    )
+
+
+def invalidate_many(model, object_ids):
+    """invalidate_many drops the cached translated fields of several objects at once."""
+    cache.delete_many(
+        [
+            get_key(model, object_id, code)
+            for object_id in object_ids
+            for code, name in settings.LANGUAGES
+        ]
+    )
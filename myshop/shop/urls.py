@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = "shop"
 
@@ -8,6 +8,12 @@ app_name = "shop"
 urlpatterns = [
     # view product list without any parameters
     path("", views.product_list, name="product_list"),
+    # search products by name and description
+    path("search/", views.product_search, name="product_search"),
+    # read-only JSON API of the catalog, before the category pattern that would match it
+    path("api/categories/", api.categories, name="api_categories"),
+    path("api/products/", api.product_list, name="api_product_list"),
+    path("api/products/<int:id>/", api.product_detail, name="api_product_detail"),
     # view product list filtered by a given category
     path("<slug:category_slug>/", views.product_list, name="product_list_by_category"),
     # view details about a single product using its id and slug to retrieve it
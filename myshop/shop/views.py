@@ -1,14 +1,41 @@
+import re
+
 from cart.forms import CartAddProductForm
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
 
+from . import facets, feeds, recommendations
+from .cache import (
+    get_category_tree,
+    get_category_version,
+    get_or_build,
+    get_product_version,
+)
 from .models import Category, Product
-from .recommender import Recommender
+from .pagination import paginate
+from .redis_pool import breaker
+from .search import search
+from .slugs import get_category_id, get_product_slug
+from .translations import translate
 
 
 # Views for the shop application
 def product_list(request, category_slug=None):
     """product_list View lists all the products or filters products by a given category.
 
+    Products are listed newest first, one page at a time, using keyset pagination on
+    the -created index. The cursor of the next page is given in the cursor query
+    parameter. With format=json, the same page is returned as JSON for "load more".
+    The categories of the sidebar come from the cached category tree. Products can also
+    be filtered by price band and weight band with the price and weight query
+    parameters. Only products in stock are listed unless available=all is given, and
+    the count of every facet value comes from the facet index.
+
     Args:
         request (object): Category, Product to query
         category_slug (SlugField, optional): url-friendly representation of category.
@@ -19,26 +46,130 @@ def product_list(request, category_slug=None):
 
     """
     category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
+    language = request.LANGUAGE_CODE
+    products = Product.objects.all()
     if category_slug:
-        language = request.LANGUAGE_CODE
-        category = get_object_or_404(
-            Category,
-            translations__language_code=language,
-            translations__slug=category_slug,
-        )
+        # the slug is resolved from the cached category tree, no join is needed
+        category_id = get_category_id(category_slug, language)
+        if category_id is None:
+            raise Http404("No Category matches the given query.")
+        category = get_object_or_404(Category, pk=category_id)
+        translate([category], language)
         products = products.filter(category=category)
+    filters = facets.get_filters(request.GET, category)
+    products = facets.filter_products(products, filters)
+    facet_list, counts = facets.describe(filters, request.GET)
+    products, next_cursor = paginate(
+        products,
+        cursor=request.GET.get("cursor"),
+        page_size=settings.PRODUCTS_PER_PAGE,
+    )
+    # names and slugs of the whole page come from the translation cache
+    products = translate(products, language)
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {
+                "products": [
+                    {
+                        "id": product.id,
+                        "name": product.name,
+                        "url": product.get_absolute_url(),
+                        "price": str(product.price),
+                        "image": product.image.url if product.image else None,
+                    }
+                    for product in products
+                ],
+                "next": next_cursor,
+                "facets": {
+                    facet["name"]: {
+                        str(choice["value"]): choice["count"]
+                        for choice in facet["values"]
+                    }
+                    for facet in facet_list
+                },
+            }
+        )
+    categories = [
+        {**c, "count": counts["category"].get(c["id"], 0)}
+        for c in get_category_tree(language)
+    ]
+    # filters other than the category and cursor, kept by the category links
+    query = request.GET.copy()
+    query.pop("cursor", None)
     return render(
         request,
         "shop/product/list.html",
-        {"category": category, "categories": categories, "products": products},
+        {
+            "category": category,
+            "categories": categories,
+            "products": products,
+            "next_cursor": next_cursor,
+            "facets": facet_list,
+            "facet_query": query.urlencode(),
+        },
+    )
+
+
+def product_search(request):
+    """product_search finds the available products matching the q query parameter.
+
+    Products are searched in the active language with the in-process search index,
+    then loaded with a single query and kept in the order of their score. With
+    format=json, the results are returned as JSON.
+
+    Args:
+        request (GET): q holds the text to search for
+
+    Returns:
+        HttpResponse: the matching products, best match first
+
+    """
+    query = request.GET.get("q", "").strip()
+    language = request.LANGUAGE_CODE
+    results = search(query, language, limit=settings.SEARCH_RESULTS) if query else []
+    ranks = {product_id: rank for rank, (product_id, score) in enumerate(results)}
+    products = sorted(
+        translate(Product.objects.filter(id__in=ranks, available=True), language),
+        key=lambda product: ranks[product.id],
+    )
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {
+                "query": query,
+                "products": [
+                    {
+                        "id": product.id,
+                        "name": product.name,
+                        "url": product.get_absolute_url(),
+                        "price": str(product.price),
+                        "image": product.image.url if product.image else None,
+                    }
+                    for product in products
+                ],
+            }
+        )
+    return render(
+        request,
+        "shop/product/search.html",
+        {"query": query, "products": products},
     )
 
 
 def product_detail(request, id, slug):
     """product_detail retrieves and displays a single product, using its id and slug.
 
+    The parts of the page that are the same for every visitor are rendered once and
+    cached, keyed by product id, language, product version, category version and
+    version of the materialized recommendations. On a hit, the product is not queried
+    and the recommender is not called. Only the cart form, which holds the CSRF token,
+    and the header with the cart are rendered for each request. The fragments are
+    rebuilt by a single request when they expire. The slug of the url is first checked
+    with the slug map of :mod:`shop.slugs`, so a wrong slug or an unknown product is
+    answered without a join on the translations. The product itself is then loaded by
+    primary key, and an unknown product is cached as a fragment without slug. A
+    product out of stock is shown without the cart form, since the product list links
+    to it when the products out of stock are included.
+
     Args:
         request
         id (int): unique identifier for the product
@@ -49,22 +180,92 @@ def product_detail(request, id, slug):
 
     """
     language = request.LANGUAGE_CODE
-    product = get_object_or_404(
-        Product,
-        id=id,
-        translations__language_code=language,
-        translations__slug=slug,
-        available=True,
+    if get_product_slug(id, language) != slug:
+        raise Http404("No Product matches the given query.")
+
+    def build():
+        product = Product.objects.filter(pk=id).first()
+        if product is None:
+            # cached as well, so unknown IDs do not reach the database every time
+            return {"slug": None}
+        translate([product], language)
+        context = {
+            "product": product,
+            "recommended_products": recommendations.suggest([product], 4),
+        }
+        return {
+            "slug": product.slug,
+            "available": product.available,
+            "title": product.name,
+            "head": render_to_string("shop/product/detail_head.html", context),
+            "body": render_to_string("shop/product/detail_body.html", context),
+        }
+
+    key = (
+        f"shop:product_detail:{id}:{language}:"
+        f"{get_product_version(id)}:{get_category_version()}:"
+        f"{recommendations.get_version()}"
     )
+    fragment = get_or_build(key, build, settings.PRODUCT_DETAIL_CACHE_TIMEOUT)
+    # the fragment is built from the product, the slug map may be out of date
+    if fragment["slug"] != slug:
+        raise Http404("No Product matches the given query.")
     cart_product_form = CartAddProductForm()
-    r = Recommender()
-    recommended_products = r.suggest_products_for([product], 4)
     return render(
         request,
         "shop/product/detail.html",
         {
-            "product": product,
+            "product_id": id,
+            # fragments cached before availability was stored only hold available ones
+            "available": fragment.get("available", True),
+            "title": fragment["title"],
+            "head": mark_safe(fragment["head"]),
+            "body": mark_safe(fragment["body"]),
             "cart_product_form": cart_product_form,
-            "recommended_products": recommended_products,
         },
     )
+
+
+def sitemap_file(request, filename="sitemap.xml"):
+    """sitemap_file serves a file written by :func:`shop.feeds.generate`.
+
+    Args:
+        request
+        filename (string): sitemap.xml, sitemap-[shard].xml or feed-[code].xml
+
+    Returns:
+        FileResponse: the XML file
+
+    """
+    if not re.fullmatch(r"sitemap(-\d+)?\.xml|feed-[a-z-]+\.xml", filename):
+        raise Http404("No such sitemap.")
+    try:
+        return FileResponse(
+            open(feeds.get_path(filename), "rb"), content_type="application/xml"
+        )
+    except FileNotFoundError:
+        raise Http404("No such sitemap.") from None
+
+
+@require_GET
+@never_cache
+def redis_health(request):
+    """redis_health reports the Redis circuit breaker and suggestion cache in use.
+
+    It is meant for monitoring, and answers 200 whatever the state of Redis, since
+    the pages are still served while the breaker is open. The url is public, so only
+    staff members get the counters, other requests only get the state of the breaker.
+
+    Returns:
+        JsonResponse: state and counters of the breaker, statistics of the LRU cache
+
+    """
+    metrics = breaker.get_metrics()
+    if not (request.user.is_active and request.user.is_staff):
+        return JsonResponse({"status": metrics["state"]})
+    return JsonResponse(
+        {
+            "breaker": metrics,
+            "recommendations_cache": recommendations.get_stats(),
+        }
+    )